@@ -9,7 +9,11 @@ from datetime import datetime
 
 #--- Importaciones de Módulos Propios ---
 from modules.config import Config
-from modules.data_processor import load_and_process_all_data, complete_series, extract_elevation_from_dem, download_and_load_remote_dem
+from modules.data_processor import (
+    load_and_process_all_data, complete_series, extract_elevation_from_dem, download_and_load_remote_dem,
+    attach_station_metadata, append_monthly_records
+)
+from modules.data_cache import compute_dataset_key, derive_dataset_key, save_dataset_to_cache
 from modules.visualizer import (
     display_welcome_tab, display_spatial_distribution_tab, display_graphs_tab,
     display_advanced_maps_tab, display_anomalies_tab, display_drought_analysis_tab,
@@ -17,43 +21,20 @@ from modules.visualizer import (
     display_trends_and_forecast_tab, display_downloads_tab, display_station_table_tab,
     display_forecast_tab
 )
-from modules.reporter import generate_pdf_report
-from modules.analysis import calculate_monthly_anomalies
-from modules.github_loader import load_csv_from_url, load_zip_from_url
+from modules.analysis import calculate_monthly_anomalies, calculate_annual_totals
+from modules.github_loader import load_github_dataset
+from modules.product_store import ProductStore
+from modules.product_cache import filter_signature
+from modules.precip_cube import PrecipCube
+from modules.indexing import ALTITUDE_BANDS
+from modules.dataset_registry import SharedDataset
+from modules.compute_cache import clear_cache
+from modules.streamlit_adapter import install_streamlit_cache, run_or_report, shared_dataset_registry
 
 #--- Desactivar Advertencias ---
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=FutureWarning)
 
-def apply_filters_to_stations(df, min_perc, altitudes, regions, municipios, celdas):
-    """Aplica una serie de filtros al DataFrame de estaciones."""
-    stations_filtered = df.copy()
-    if Config.PERCENTAGE_COL in stations_filtered.columns:
-        stations_filtered[Config.PERCENTAGE_COL] = pd.to_numeric(
-            stations_filtered[Config.PERCENTAGE_COL].astype(str).str.replace(',', '.', regex=False), 
-            errors='coerce'
-        ).fillna(0)
-    if min_perc > 0:
-        stations_filtered = stations_filtered[stations_filtered[Config.PERCENTAGE_COL] >= min_perc]
-    if altitudes:
-        conditions = []
-        altitude_col_numeric = pd.to_numeric(stations_filtered[Config.ALTITUDE_COL], errors='coerce')
-        for r in altitudes:
-            if r == '0-500': conditions.append((altitude_col_numeric >= 0) & (altitude_col_numeric <= 500))
-            elif r == '500-1000': conditions.append((altitude_col_numeric > 500) & (altitude_col_numeric <= 1000))
-            elif r == '1000-2000': conditions.append((altitude_col_numeric > 1000) & (altitude_col_numeric <= 2000))
-            elif r == '2000-3000': conditions.append((altitude_col_numeric > 2000) & (altitude_col_numeric <= 3000))
-            elif r == '>3000': conditions.append(altitude_col_numeric > 3000)
-        if conditions:
-            stations_filtered = stations_filtered[pd.concat(conditions, axis=1).any(axis=1)]
-    if regions:
-        stations_filtered = stations_filtered[stations_filtered[Config.REGION_COL].isin(regions)]
-    if municipios:
-        stations_filtered = stations_filtered[stations_filtered[Config.MUNICIPALITY_COL].isin(municipios)]
-    if celdas and Config.CELL_COL in stations_filtered.columns:
-        stations_filtered = stations_filtered[stations_filtered[Config.CELL_COL].isin(celdas)]
-    return stations_filtered
-
 def main():
     def display_map_controls(container_object, key_prefix):
         """Muestra los controles para seleccionar mapa base y capas adicionales."""
@@ -93,10 +74,10 @@ def main():
         selected_overlays_config = [overlay_map_options[name] for name in selected_overlays_names]
 
         return selected_base_map_config, selected_overlays_config    
+    install_streamlit_cache() # Los módulos de cálculo guardan sus resultados con st.cache_data
     st.set_page_config(layout="wide", page_title=Config.APP_TITLE)
     st.markdown("""<style>div.block-container{padding-top:1rem;} [data-testid="stMetricValue"] {font-size:1.8rem;} [data-testid="stMetricLabel"] {font-size: 1rem; padding-bottom:5px; } button[data-baseweb="tab"] {font-size:16px;font-weight:bold;color:#333;}</style>""", unsafe_allow_html=True)
     Config.initialize_session_state()
-    progress_placeholder = st.empty()
 
     title_col1, title_col2 = st.columns([0.05, 0.95])
     with title_col1:
@@ -112,24 +93,68 @@ def main():
     with st.sidebar.expander("**Subir/Actualizar Archivos Base**", expanded=not st.session_state.get('data_loaded', False)):
         load_mode = st.radio("Modo de Carga", ("GitHub", "Manual"), key="load_mode", horizontal=True)
 
+        def release_dataset():
+            # Devuelve la referencia de la sesión al conjunto compartido del registro
+            handle = st.session_state.get('dataset_handle')
+            if handle is not None:
+                handle.release()
+
         def process_and_store_data(file_mapa, file_precip, file_shape):
-            st.cache_data.clear()
-            st.cache_resource.clear()
+            clear_cache()
+            release_dataset()
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             Config.initialize_session_state()
+            dataset_key = compute_dataset_key(file_mapa, file_precip, file_shape)
+
+            def load():
+                return SharedDataset(dataset_key, *load_and_process_all_data(file_mapa, file_precip, file_shape))
+
             with st.spinner("Procesando archivos y cargando datos..."):
-                gdf_stations, gdf_municipios, df_long, df_enso = load_and_process_all_data(file_mapa, file_precip, file_shape)
-                if gdf_stations is not None and df_long is not None and gdf_municipios is not None:
-                    st.session_state.update({
-                        'gdf_stations': gdf_stations, 'gdf_municipios': gdf_municipios,
-                        'df_long': df_long, 'df_enso': df_enso, 'data_loaded': True
-                    })
+                # Si otra sesión ya cargó los mismos archivos, se reutiliza su copia en memoria
+                handle = run_or_report(shared_dataset_registry().acquire, dataset_key, load)
+                if handle is not None:
+                    st.session_state.update(handle.dataset.session_items())
+                    st.session_state.update({'dataset_handle': handle, 'data_loaded': True})
                     st.success("¡Datos cargados y listos!")
                     st.rerun()
                 else:
                     st.error("Hubo un error al procesar los archivos.")
 
+        def append_and_store_data(file_delta):
+            # No se limpia st.cache_data: solo se invalidan los productos de las estaciones/meses afectados
+            with st.spinner("Incorporando registros nuevos..."):
+                result = run_or_report(
+                    append_monthly_records,
+                    st.session_state.gdf_stations, st.session_state.df_long, st.session_state.df_enso, file_delta
+                )
+            if result is None:
+                st.error("No se pudieron incorporar los registros nuevos.")
+                return
+            df_long, df_enso, df_long_delta = result
+            affected_stations = set(df_long_delta[Config.STATION_NAME_COL].astype(object).unique())
+            affected_period = (df_long_delta[Config.DATE_COL].min(), df_long_delta[Config.DATE_COL].max())
+            invalidated = st.session_state.product_cache.invalidate(stations=affected_stations, period=affected_period)
+
+            # El conjunto ampliado es uno nuevo en el registro; el anterior sigue intacto para
+            # las demás sesiones que lo usan
+            dataset_key = derive_dataset_key(st.session_state.dataset_key, file_delta)
+            gdf_stations, gdf_municipios = st.session_state.gdf_stations, st.session_state.gdf_municipios
+            precip_cube = st.session_state.precip_cube.update(PrecipCube.from_long(df_long_delta))
+            save_dataset_to_cache(dataset_key, gdf_stations, gdf_municipios, df_long, df_enso)
+            handle = shared_dataset_registry().acquire(
+                dataset_key, lambda: SharedDataset(dataset_key, gdf_stations, gdf_municipios, df_long, df_enso, precip_cube)
+            )
+            release_dataset()
+            st.session_state.update(handle.dataset.session_items())
+            st.session_state.dataset_handle = handle
+            # El mensaje se muestra después de la reejecución (st.rerun descarta lo dibujado antes)
+            st.session_state.append_message = (
+                f"Se incorporaron {len(df_long_delta)} registros de {len(affected_stations)} estaciones "
+                f"({invalidated} productos derivados recalculados)."
+            )
+            st.rerun()
+
         if load_mode == "Manual":
             uploaded_file_mapa = st.file_uploader("1. Archivo de estaciones (CSV)", type="csv")
             uploaded_file_precip = st.file_uploader("2. Archivo de precipitación (CSV)", type="csv")
@@ -143,16 +168,26 @@ def main():
             st.info(f"Datos desde: **{Config.GITHUB_USER}/{Config.GITHUB_REPO}**")
             if st.button("Cargar Datos desde GitHub"):
                 with st.spinner("Descargando archivos..."):
-                    github_files = {
-                        'mapa': load_csv_from_url(Config.URL_ESTACIONES_CSV),
-                        'precip': load_csv_from_url(Config.URL_PRECIPITACION_CSV),
-                        'shape': load_zip_from_url(Config.URL_SHAPEFILE_ZIP)
-                    }
+                    github_files = load_github_dataset()
                 if all(github_files.values()):
                     process_and_store_data(github_files['mapa'], github_files['precip'], github_files['shape'])
                 else:
                     st.error("No se pudieron descargar los archivos desde GitHub.")
 
+        if st.session_state.get('data_loaded', False):
+            st.markdown("---")
+            st.markdown("**Añadir registros mensuales**")
+            uploaded_file_delta = st.file_uploader(
+                "Meses nuevos (CSV con el formato del archivo de precipitación)", type="csv", key="delta_uploader"
+            )
+            if st.button("Añadir Registros"):
+                if uploaded_file_delta is not None:
+                    append_and_store_data(uploaded_file_delta)
+                else:
+                    st.warning("Por favor, suba el archivo con los registros nuevos.")
+            if st.session_state.get('append_message'):
+                st.success(st.session_state.pop('append_message'))
+
     if not st.session_state.get('data_loaded', False):
         display_welcome_tab()
         st.warning("Para comenzar, cargue los datos usando el panel de la izquierda.")
@@ -160,30 +195,30 @@ def main():
 
     st.sidebar.success("Datos cargados.")
     if st.sidebar.button("Limpiar Caché y Reiniciar"):
+        # El registro de conjuntos (st.cache_resource) no se vacía: lo comparten otras sesiones
         st.cache_data.clear()
-        st.cache_resource.clear()
+        release_dataset()
         for key in list(st.session_state.keys()):
             del st.session_state[key]
         st.rerun()
 
+    station_index, long_index = st.session_state.station_index, st.session_state.long_index
+
     with st.sidebar.expander("**1. Filtros Geográficos y de Datos**", expanded=True):
         min_data_perc = st.slider("Filtrar por % de datos mínimo:", 0, 100, st.session_state.get('min_data_perc_slider', 0))
-        altitude_ranges = ['0-500', '500-1000', '1000-2000', '2000-3000', '>3000']
-        selected_altitudes = st.multiselect('Filtrar por Altitud (m)', options=altitude_ranges)
-        regions_list = sorted(st.session_state.gdf_stations[Config.REGION_COL].dropna().unique())
+        selected_altitudes = st.multiselect('Filtrar por Altitud (m)', options=list(ALTITUDE_BANDS))
+        regions_list = station_index.options(Config.REGION_COL)
         selected_regions = st.multiselect('Filtrar por Depto/Región', options=regions_list, key='regions_multiselect')
-        temp_gdf_for_mun = st.session_state.gdf_stations.copy()
-        if selected_regions:
-            temp_gdf_for_mun = temp_gdf_for_mun[temp_gdf_for_mun[Config.REGION_COL].isin(selected_regions)]
-        municipios_list = sorted(temp_gdf_for_mun[Config.MUNICIPALITY_COL].dropna().unique())
+        municipios_list = station_index.options(Config.MUNICIPALITY_COL, regions=selected_regions)
         selected_municipios = st.multiselect('Filtrar por Municipio', options=municipios_list, key='municipios_multiselect')
-        celdas_list = sorted(temp_gdf_for_mun[Config.CELL_COL].dropna().unique()) if Config.CELL_COL in temp_gdf_for_mun.columns else []
+        celdas_list = station_index.options(Config.CELL_COL, regions=selected_regions)
         selected_celdas = st.multiselect('Filtrar por Celda_XY', options=celdas_list, key='celdas_multiselect')
 
-    gdf_filtered = apply_filters_to_stations(st.session_state.gdf_stations, min_data_perc, selected_altitudes, selected_regions, selected_municipios, selected_celdas)
+    filtered_positions = station_index.filter(min_data_perc, selected_altitudes, selected_regions, selected_municipios, selected_celdas)
+    gdf_filtered = station_index.select(filtered_positions)
 
     with st.sidebar.expander("**2. Selección de Estaciones y Período**", expanded=True):
-        stations_options = sorted(gdf_filtered[Config.STATION_NAME_COL].unique())
+        stations_options = station_index.station_names(filtered_positions)
         
         def select_all_stations():
             if st.session_state.get('select_all_checkbox_main', False):
@@ -194,7 +229,7 @@ def main():
         st.checkbox("Seleccionar/Deseleccionar todas", key='select_all_checkbox_main', on_change=select_all_stations)
         
         selected_stations = st.multiselect('Seleccionar Estaciones', options=stations_options, key='station_multiselect')
-        years_with_data = sorted(st.session_state.df_long[Config.YEAR_COL].dropna().unique())
+        years_with_data = long_index.years
         year_range_default = (min(years_with_data), max(years_with_data)) if years_with_data else (1970, 2020)
         year_range = st.slider("Rango de Años", min_value=year_range_default[0], max_value=year_range_default[1], value=st.session_state.get('year_range', year_range_default), key='year_range')
         meses_dict = {m: i + 1 for i, m in enumerate(['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'])}
@@ -205,6 +240,9 @@ def main():
         st.radio("Modo de análisis", ("Usar datos originales", "Completar series (interpolación)"), key="analysis_mode")
         st.checkbox("Excluir datos nulos (NaN)", key='exclude_na')
         st.checkbox("Excluir valores cero (0)", key='exclude_zeros')
+        st.session_state.dem_raster = st.file_uploader(
+            "Modelo Digital de Elevación (GeoTIFF, opcional)", type=["tif", "tiff"], key="dem_uploader"
+        )
 
     tab_names = [
         "Bienvenida", "Distribución Espacial", "Gráficos", "Mapas Avanzados", 
@@ -225,35 +263,75 @@ def main():
                 st.info("Seleccione al menos una estación para ver el contenido.")
         return
 
-    df_monthly_filtered = st.session_state.df_long[
-        (st.session_state.df_long[Config.STATION_NAME_COL].isin(stations_for_analysis)) & 
-        (st.session_state.df_long[Config.DATE_COL].dt.year >= year_range[0]) & 
-        (st.session_state.df_long[Config.DATE_COL].dt.year <= year_range[1]) & 
-        (st.session_state.df_long[Config.DATE_COL].dt.month.isin(meses_numeros))
-    ].copy()
-
-    if st.session_state.analysis_mode == "Completar series (interpolación)":
-        bar = progress_placeholder.progress(0, text="Iniciando interpolación...")
-        df_monthly_filtered = complete_series(df_monthly_filtered, _progress_bar=bar)
-        progress_placeholder.empty()
-
-    if st.session_state.get('exclude_na', False): 
-        df_monthly_filtered.dropna(subset=[Config.PRECIPITATION_COL], inplace=True)
-    if st.session_state.get('exclude_zeros', False): 
-        df_monthly_filtered = df_monthly_filtered[df_monthly_filtered[Config.PRECIPITATION_COL] > 0]
-    
-    annual_agg = df_monthly_filtered.groupby([Config.STATION_NAME_COL, Config.YEAR_COL]).agg(
-        precipitation_sum=(Config.PRECIPITATION_COL, 'sum'), 
-        meses_validos=(Config.MONTH_COL, 'nunique')
-    ).reset_index()
-    annual_agg.loc[annual_agg['meses_validos'] < 10, 'precipitation_sum'] = np.nan
-    df_anual_melted = annual_agg.rename(columns={'precipitation_sum': Config.PRECIPITATION_COL})
+    # Las tablas derivadas de la selección se guardan en la LRU de la sesión con la firma de los
+    # filtros: las reejecuciones que no cambian los filtros (pestañas, mapas, casillas) no recalculan nada.
+    analysis_mode = st.session_state.analysis_mode
+    exclude_na, exclude_zeros = st.session_state.get('exclude_na', False), st.session_state.get('exclude_zeros', False)
+
+    def derive_selection():
+        # df_long está ordenado por (estación, fecha): la selección son rangos contiguos de filas
+        selected_rows = long_index.rows(stations_for_analysis, year_range, meses_numeros)
+        df_monthly_filtered = st.session_state.df_long.take(selected_rows)
+        df_monthly_filtered = attach_station_metadata(df_monthly_filtered, st.session_state.gdf_stations, copy=False)
+
+        if analysis_mode == "Completar series (interpolación)":
+            # El panel completo se interpola una vez por conjunto de datos, para todas las sesiones
+            completed_cube = st.session_state.dataset_handle.dataset.completed_cube()
+            df_monthly_filtered = complete_series(
+                df_monthly_filtered, completed_cube.select(stations_for_analysis, year_range, meses_numeros)
+            )
+
+        if exclude_na:
+            df_monthly_filtered.dropna(subset=[Config.PRECIPITATION_COL], inplace=True)
+        if exclude_zeros:
+            df_monthly_filtered = df_monthly_filtered[df_monthly_filtered[Config.PRECIPITATION_COL] > 0]
+
+        # Cubo estaciones × meses de la selección (matrices de correlación, vistas anchas)
+        if analysis_mode == "Completar series (interpolación)":
+            precip_cube = PrecipCube.from_long(df_monthly_filtered)
+        else:
+            precip_cube = st.session_state.precip_cube.select(stations_for_analysis, year_range, meses_numeros)
+            if exclude_zeros:
+                precip_cube = precip_cube.where(precip_cube.values > 0)
+
+        # Totales anuales: con los datos originales salen de los prefijos del cubo anual, sin
+        # recorrer las filas mensuales; las series completadas se agregan desde las filas.
+        if analysis_mode == "Completar series (interpolación)":
+            df_anual_melted = calculate_annual_totals(df_monthly_filtered)
+        else:
+            df_anual_melted = st.session_state.annual_cube.annual_totals(
+                stations_for_analysis, year_range, meses_numeros, exclude_zeros=exclude_zeros
+            )
+        return df_monthly_filtered, precip_cube, df_anual_melted
+
+    df_monthly_filtered, precip_cube, df_anual_melted = st.session_state.product_cache.get_or_compute(
+        filter_signature(st.session_state.dataset_key, stations_for_analysis, year_range, meses_numeros,
+                         analysis_mode, exclude_na, exclude_zeros),
+        derive_selection,
+        stations=stations_for_analysis, period=(f"{year_range[0]}-01-01", f"{year_range[1]}-12-31")
+    )
+
+    # Productos precalculados por pipeline.py: válidos solo si la selección usa los mismos
+    # datos que el lote (período completo, todos los meses, datos originales sin exclusiones).
+    full_selection = (
+        tuple(year_range) == tuple(year_range_default) and len(meses_numeros) == 12
+        and st.session_state.analysis_mode == "Usar datos originales"
+        and not st.session_state.get('exclude_zeros', False)
+    )
+    product_store = ProductStore(st.session_state.dataset_key)
+    if not (full_selection and product_store.available):
+        product_store = None
+    # Productos de toda la red calculados en memoria y compartidos entre sesiones (p. ej. SPI)
+    shared_dataset = st.session_state.dataset_handle.dataset if full_selection else None
 
     display_args = {
         "gdf_filtered": gdf_filtered, "stations_for_analysis": stations_for_analysis, 
         "df_anual_melted": df_anual_melted, "df_monthly_filtered": df_monthly_filtered, 
         "analysis_mode": st.session_state.analysis_mode, "selected_regions": selected_regions, 
-        "selected_municipios": selected_municipios, "selected_altitudes": selected_altitudes
+        "selected_municipios": selected_municipios, "selected_altitudes": selected_altitudes,
+        "precip_cube": precip_cube, "product_store": product_store, "shared_dataset": shared_dataset,
+        "climatology": st.session_state.dataset_handle.dataset.climatology(),
+        "year_range": year_range, "meses_numeros": meses_numeros
     }
     
     with tabs[0]: display_welcome_tab()
@@ -312,12 +390,14 @@ def main():
             else:
                 with st.spinner("Generando reporte..."):
                     try:
+                        # fpdf y selenium se importan solo al generar un reporte
+                        from modules.reporter import generate_pdf_report
                         summary_data = {
                             "Estaciones": f"{len(stations_for_analysis)}/{len(st.session_state.gdf_stations)}",
                             "Periodo": f"{year_range[0]}-{year_range[1]}",
                             "Modo de Análisis": st.session_state.analysis_mode
                         }
-                        df_anomalies = calculate_monthly_anomalies(df_monthly_filtered, st.session_state.df_long)
+                        df_anomalies = calculate_monthly_anomalies(df_monthly_filtered, display_args['climatology'])
                         
                         report_pdf_bytes = generate_pdf_report(
                             report_title=report_title,
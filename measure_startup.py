@@ -0,0 +1,96 @@
+# measure_startup.py
+"""
+Mide el tiempo de arranque en frío de la aplicación (importación de app.py y sus módulos)
+en procesos nuevos, y cuánto agregaría importar de entrada las librerías pesadas que
+ahora se cargan de forma diferida (modules/lazy_import.py).
+
+Uso:
+    python measure_startup.py [--repeticiones 5] [--modulo app] [--detalle 15]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Librerías que las pestañas importan en su primer uso
+HEAVY_MODULES = [
+    'prophet', 'pmdarima', 'statsmodels.tsa.statespace.sarimax', 'gstools', 'sklearn.metrics',
+    'matplotlib.pyplot', 'altair', 'pymannkendall', 'scipy.stats', 'rasterio',
+    'selenium.webdriver', 'fpdf', 'openmeteo_requests',
+]
+
+_PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module({module!r})
+app_seconds = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+eager_seconds, missing = 0.0, []
+if {eager!r}:
+    start = time.perf_counter()
+    for name in {heavy!r}:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            missing.append(name)
+    eager_seconds = time.perf_counter() - start
+print(json.dumps({{'app': app_seconds, 'eager': eager_seconds, 'loaded': loaded, 'missing': missing}}))
+"""
+
+def _probe(module, eager, importtime=False):
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES, eager=eager)
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    result = subprocess.run(
+        command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "fallo desconocido")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def _slowest_imports(importtime_log, top):
+    """Importaciones de primer nivel con mayor tiempo acumulado según `python -X importtime`."""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        if not name[1:].startswith(' '): # Los submódulos aparecen con sangría adicional
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el tiempo de arranque en frío de SIHCLIM.")
+    parser.add_argument('--repeticiones', type=int, default=5, help="Procesos nuevos por medición")
+    parser.add_argument('--modulo', default='app', help="Módulo a importar (por defecto app)")
+    parser.add_argument('--detalle', type=int, default=0, help="Mostrar las N importaciones más lentas")
+    args = parser.parse_args(argv)
+
+    try:
+        lazy_runs = [_probe(args.modulo, eager=False)[0] for _ in range(args.repeticiones)]
+        eager_runs = [_probe(args.modulo, eager=True)[0] for _ in range(args.repeticiones)]
+    except RuntimeError as e:
+        print(f"Error al importar '{args.modulo}': {e}", file=sys.stderr)
+        return 1
+
+    lazy = statistics.median(run['app'] for run in lazy_runs)
+    eager = statistics.median(run['app'] + run['eager'] for run in eager_runs)
+    print(f"Arranque con importación diferida: {lazy:.2f} s (mediana de {args.repeticiones})")
+    print(f"Arranque importando todo de entrada: {eager:.2f} s")
+    print(f"Ahorro: {eager - lazy:.2f} s ({(eager - lazy) / eager:.0%})" if eager > 0 else "Ahorro: -")
+    loaded = lazy_runs[0]['loaded']
+    print(f"Librerías pesadas cargadas al arrancar: {', '.join(loaded) if loaded else 'ninguna'}")
+    if eager_runs[0]['missing']:
+        print(f"No instaladas (no incluidas en la medición): {', '.join(eager_runs[0]['missing'])}")
+
+    if args.detalle:
+        _, log = _probe(args.modulo, eager=False, importtime=True)
+        print("\nImportaciones más lentas al arrancar:")
+        for cumulative_us, name in _slowest_imports(log, args.detalle):
+            print(f"  {cumulative_us / 1e6:6.2f} s  {name}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,130 +1,125 @@
 # modules/analysis.py
 
-import streamlit as st
 import pandas as pd
 import numpy as np
-from scipy.stats import gamma, norm
 from modules.config import Config
+from modules.compute_cache import cached
+from modules.lazy_import import lazy_import
+from modules.precip_cube import PrecipCube
+from modules.drought_indices import compute_spi, compute_spei
+from modules.climatology import Climatology, EVENT_DRY, EVENT_WET
 
-@st.cache_data
+# scipy.stats y pymannkendall se importan en el primer cálculo que los usa
+stats = lazy_import('scipy.stats')
+mk = lazy_import('pymannkendall')
+
+@cached
 def calculate_spi(series, window):
     """
-    Calcula el Índice de Precipitación Estandarizado (SPI).
-    """
-    series = series.sort_index()
-    rolling_sum = series.rolling(window, min_periods=window).sum()
-    data_for_fit = rolling_sum.dropna()
-    data_for_fit = data_for_fit[np.isfinite(data_for_fit)]
-    
-    if len(data_for_fit) > 0:
-        params = gamma.fit(data_for_fit, floc=0)
-        shape, loc, scale = params
-        cdf = gamma.cdf(rolling_sum, shape, loc=loc, scale=scale)
-    else:
+    Calcula el Índice de Precipitación Estandarizado (SPI) de una estación.
+    Usa el mismo motor que el cálculo por lotes de la red (drought_indices.compute_spi):
+    ajuste gamma por mes calendario con probabilidad de meses secos.
+    """
+    series = series.sort_index().dropna()
+    if series.empty:
         return pd.Series(dtype=float)
+    spi_cube = compute_spi(PrecipCube.from_series(series), scales=[int(window)])
+    return spi_cube.series(spi_cube.stations[0], window)
 
-    spi = norm.ppf(cdf)
-    spi = np.where(np.isinf(spi), np.nan, spi)
-    return pd.Series(spi, index=rolling_sum.index)
-
-@st.cache_data
+@cached
 def calculate_spei(precip_series, et_series, scale):
     """
-    Calcula el Índice de Precipitación y Evapotranspiración Estandarizado (SPEI).
+    Calcula el Índice de Precipitación y Evapotranspiración Estandarizado (SPEI) de una estación.
+    `et_series` es la evapotranspiración anual (mm/año, columna Config.ET_COL); la ETP mensual
+    es su doceava parte. Usa el motor de toda la red (drought_indices.compute_spei):
+    log-logística ajustada por L-momentos para cada mes calendario.
     """
-    from scipy.stats import loglaplace
-    scale = int(scale)
-    df = pd.DataFrame({'precip': precip_series, 'et': et_series})
-    df = df.sort_index().asfreq('MS')
-    df.dropna(inplace=True)
-    if len(df) < scale * 2:
+    precip_series = precip_series.sort_index().dropna()
+    et_annual = pd.to_numeric(et_series, errors='coerce').dropna()
+    if precip_series.empty or et_annual.empty:
         return pd.Series(dtype=float)
+    precip_cube = PrecipCube.from_series(precip_series)
+    spei_cube = compute_spei(precip_cube, [et_annual.mean() / 12], scales=[int(scale)])
+    return spei_cube.series(spei_cube.stations[0], scale)
 
-    water_balance = df['precip'] - df['et']
-    rolling_balance = water_balance.rolling(window=scale, min_periods=scale).sum()
-    data_for_fit = rolling_balance.dropna()
-    data_for_fit = data_for_fit[np.isfinite(data_for_fit)]
+def calculate_monthly_anomalies(df_monthly_filtered, climatology):
+    """
+    Calcula las anomalías mensuales con respecto al promedio de todo el período de datos,
+    a partir de la climatología precalculada del conjunto (climatology.Climatology).
+    """
+    return climatology.anomalies(df_monthly_filtered, mean_col='precip_promedio_mes')
 
-    if len(data_for_fit) > 0:
-        params = loglaplace.fit(data_for_fit)
-        cdf = loglaplace.cdf(rolling_balance, *params)
-    else:
-        return pd.Series(dtype=float)
-        
-    spei = norm.ppf(cdf)
-    spei = np.where(np.isinf(spei), np.nan, spei)
-    return pd.Series(spei, index=rolling_balance.index)
-    
-@st.cache_data
-def calculate_monthly_anomalies(_df_monthly_filtered, _df_long):
-    """
-    Calcula las anomalías mensuales con respecto al promedio de todo el período de datos.
-    """
-    df_monthly_filtered = _df_monthly_filtered.copy()
-    df_long = _df_long.copy()
-    
-    df_climatology = df_long[
-        df_long[Config.STATION_NAME_COL].isin(df_monthly_filtered[Config.STATION_NAME_COL].unique())
-    ].groupby([Config.STATION_NAME_COL, Config.MONTH_COL])[Config.PRECIPITATION_COL].mean() \
-     .reset_index().rename(columns={Config.PRECIPITATION_COL: 'precip_promedio_mes'})
-
-    df_anomalias = pd.merge(
-        df_monthly_filtered,
-        df_climatology,
-        on=[Config.STATION_NAME_COL, Config.MONTH_COL],
-        how='left'
+def calculate_percentiles_and_extremes(df_long, station_name, p_lower=10, p_upper=90, climatology=None):
+    """
+    Calcula umbrales de percentiles y clasifica eventos extremos para una estación.
+    Los umbrales salen de la climatología del conjunto (calculados para todas las estaciones en
+    una sola pasada y guardados por par de percentiles); sin ella se calcula la de la estación.
+    Cada fila lleva el código entero del evento ('codigo_evento', ver climatology.EVENT_*) y su etiqueta.
+    """
+    df_station_full = df_long[df_long[Config.STATION_NAME_COL] == station_name]
+    if climatology is None:
+        climatology = Climatology(PrecipCube.from_long(df_station_full))
+    low, high = climatology.thresholds(p_lower, p_upper)
+    mean, _, counts = climatology.normals()
+
+    codes = climatology.classify(df_station_full, p_lower, p_upper)
+    labels = {EVENT_DRY: f'Sequía Extrema (< P{p_lower}%)', EVENT_WET: f'Húmedo Extremo (> P{p_upper}%)'}
+    df_station_extremes = df_station_full.assign(
+        p_lower=climatology.lookup(df_station_full, low), p_upper=climatology.lookup(df_station_full, high),
+        mean_monthly=climatology.lookup(df_station_full, mean), codigo_evento=codes,
+        event_type=pd.Series(codes, index=df_station_full.index).map(labels).fillna('Normal'),
     )
-    df_anomalias['anomalia'] = df_anomalias[Config.PRECIPITATION_COL] - df_anomalias['precip_promedio_mes']
-    return df_anomalias.copy()
 
-def calculate_percentiles_and_extremes(df_long, station_name, p_lower=10, p_upper=90):
+    position = climatology.stations.get_indexer([station_name])[0]
+    months = np.flatnonzero(counts[position] > 0) if position >= 0 else np.array([], dtype='int64')
+    df_thresholds = pd.DataFrame({
+        Config.MONTH_COL: months + 1, 'p_lower': low[position, months], 'p_upper': high[position, months],
+        'mean_monthly': mean[position, months],
+    })
+    return df_station_extremes.dropna(subset=[Config.PRECIPITATION_COL]), df_thresholds
+
+def calculate_annual_totals(df_monthly):
     """
-    Calcula umbrales de percentiles y clasifica eventos extremos para una estación.
+    Precipitación anual por estación. Los años con menos de 10 meses con dato quedan como NaN.
     """
-    df_station_full = df_long[df_long[Config.STATION_NAME_COL] == station_name].copy()
-    df_thresholds = df_station_full.groupby(Config.MONTH_COL)[Config.PRECIPITATION_COL].agg(
-        p_lower=lambda x: np.nanpercentile(x.dropna(), p_lower),
-        p_upper=lambda x: np.nanpercentile(x.dropna(), p_upper),
-        mean_monthly='mean'
+    annual_agg = df_monthly.groupby([Config.STATION_NAME_COL, Config.YEAR_COL], observed=True).agg(
+        precipitation_sum=(Config.PRECIPITATION_COL, 'sum'),
+        meses_validos=(Config.MONTH_COL, 'nunique')
     ).reset_index()
-    df_station_extremes = pd.merge(df_station_full, df_thresholds, on=Config.MONTH_COL, how='left')
-    df_station_extremes['event_type'] = 'Normal'
-    is_dry = (df_station_extremes[Config.PRECIPITATION_COL] < df_station_extremes['p_lower'])
-    df_station_extremes.loc[is_dry, 'event_type'] = f'Sequía Extrema (< P{p_lower}%)'
-    is_wet = (df_station_extremes[Config.PRECIPITATION_COL] > df_station_extremes['p_upper'])
-    df_station_extremes.loc[is_wet, 'event_type'] = f'Húmedo Extremo (> P{p_upper}%)'
-    return df_station_extremes.dropna(subset=[Config.PRECIPITATION_COL]), df_thresholds
+    annual_agg.loc[annual_agg['meses_validos'] < 10, 'precipitation_sum'] = np.nan
+    return annual_agg.rename(columns={'precipitation_sum': Config.PRECIPITATION_COL})
 
-@st.cache_data
-def calculate_climatological_anomalies(_df_monthly_filtered, _df_long, baseline_start, baseline_end):
+def calculate_station_trend(station_data):
+    """
+    Tendencia lineal y de Mann-Kendall (con pendiente de Sen) de la precipitación anual de una estación.
+    `station_data` contiene las columnas de año y precipitación.
+    """
+    station_data = station_data.dropna(subset=[Config.PRECIPITATION_COL]).sort_values(by=Config.YEAR_COL)
+    slope_lin, p_lin = np.nan, np.nan
+    trend_mk, p_mk, slope_sen = "Datos insuficientes", np.nan, np.nan
+    if len(station_data) > 2:
+        res = stats.linregress(pd.to_numeric(station_data[Config.YEAR_COL]), station_data[Config.PRECIPITATION_COL])
+        slope_lin, p_lin = res.slope, res.pvalue
+    if len(station_data) > 3:
+        mk_result_table = mk.original_test(station_data[Config.PRECIPITATION_COL])
+        trend_mk = mk_result_table.trend.capitalize()
+        p_mk = mk_result_table.p
+        slope_sen = mk_result_table.slope
+    return {
+        "Años Analizados": len(station_data), "Tendencia Lineal (mm/año)": slope_lin, "Valor p (Lineal)": p_lin,
+        "Tendencia MK": trend_mk, "Valor p (MK)": p_mk, "Pendiente de Sen (mm/año)": slope_sen
+    }
+
+def calculate_climatological_anomalies(df_monthly_filtered, climatology, baseline_start, baseline_end):
     """
     Calcula las anomalías mensuales con respecto a un período base climatológico fijo.
+    La media del período base sale de las sumas acumuladas de la climatología, sin recorrer df_long.
     """
-    df_monthly_filtered = _df_monthly_filtered.copy()
-    df_long = _df_long.copy()
-
-    baseline_df = df_long[
-        (df_long[Config.YEAR_COL] >= baseline_start) & 
-        (df_long[Config.YEAR_COL] <= baseline_end)
-    ]
-
-    df_climatology = baseline_df.groupby(
-        [Config.STATION_NAME_COL, Config.MONTH_COL]
-    )[Config.PRECIPITATION_COL].mean().reset_index().rename(
-        columns={Config.PRECIPITATION_COL: 'precip_promedio_climatologico'}
+    return climatology.anomalies(
+        df_monthly_filtered, baseline=(baseline_start, baseline_end), mean_col='precip_promedio_climatologico'
     )
 
-    df_anomalias = pd.merge(
-        df_monthly_filtered,
-        df_climatology,
-        on=[Config.STATION_NAME_COL, Config.MONTH_COL],
-        how='left'
-    )
-
-    df_anomalias['anomalia'] = df_anomalias[Config.PRECIPITATION_COL] - df_anomalias['precip_promedio_climatologico']
-    return df_anomalias
-
-@st.cache_data
+@cached
 def analyze_events(index_series, threshold, event_type='drought'):
     """
     Identifica y caracteriza eventos de sequía o humedad en una serie de tiempo de índices.
@@ -0,0 +1,194 @@
+# modules/climatology.py
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from modules.config import Config
+
+# Códigos enteros de evento extremo por percentiles (arreglos int8)
+EVENT_DRY, EVENT_NORMAL, EVENT_WET, EVENT_MISSING = -1, 0, 1, -9
+# Umbrales por par de percentiles que se conservan en memoria
+MAX_STORED_QUANTILES = 32
+
+class Climatology:
+    """
+    Climatología mensual por estación (estaciones × 12 meses calendario), calculada una vez por
+    conjunto de datos a partir de un PrecipCube. Guarda sumas acumuladas sobre los años del
+    número de datos, la suma y la suma de cuadrados, de modo que la media y la desviación
+    estándar de cualquier período base salen de dos restas, sin recorrer los datos.
+    Los percentiles no se pueden acumular: se calculan por período base con un solo
+    nanquantile sobre el arreglo estaciones × años × mes y se memorizan (LRU acotada).
+    Las anomalías son operaciones de arreglos contra esa tabla, indexada por los códigos de
+    estación y el mes de cada fila.
+    """
+
+    def __init__(self, precip_cube):
+        self._by_year = precip_cube.by_year()
+        values = self._by_year.astype('float64')
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0.0)
+        pad = [(0, 0), (1, 0), (0, 0)]
+        self._counts = np.pad(np.cumsum(valid, axis=1, dtype='int32'), pad)
+        self._sums = np.pad(np.cumsum(values, axis=1), pad)
+        self._squares = np.pad(np.cumsum(values ** 2, axis=1), pad)
+        self.stations = precip_cube.stations
+        self.first_year = precip_cube.first_year
+        self._quantiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def years(self):
+        return np.arange(self.first_year, self.first_year + self._by_year.shape[1])
+
+    def _year_slice(self, baseline):
+        """Posiciones [inicio, fin) de los años del período base (inclusive); todo el período si es None."""
+        n_years = self._by_year.shape[1]
+        if baseline is None:
+            return 0, n_years
+        start = min(max(int(baseline[0]) - self.first_year, 0), n_years)
+        end = max(min(int(baseline[1]) - self.first_year + 1, n_years), start)
+        return start, end
+
+    # --- Estadísticos del período base (estaciones × 12) ---
+    def normals(self, baseline=None):
+        """(media, desviación estándar muestral, número de datos) por estación y mes del período base."""
+        start, end = self._year_slice(baseline)
+        counts = self._counts[:, end] - self._counts[:, start]
+        sums = self._sums[:, end] - self._sums[:, start]
+        squares = self._squares[:, end] - self._squares[:, start]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(counts > 0, sums / counts, np.nan)
+            variance = np.where(counts > 1, (squares - counts * mean ** 2) / (counts - 1), np.nan)
+        return mean, np.sqrt(np.maximum(variance, 0)), counts
+
+    def quantiles(self, percentiles, baseline=None):
+        """
+        Percentiles (0-100) por estación y mes del período base, arreglo (percentiles × estaciones × 12).
+        Se calculan todos en una sola pasada y se guardan por (percentiles, período base).
+        """
+        start, end = self._year_slice(baseline)
+        key = (tuple(float(q) for q in percentiles), start, end)
+        with self._lock:
+            if key in self._quantiles:
+                self._quantiles.move_to_end(key)
+                return self._quantiles[key]
+        # Cuantiles con interpolación lineal (como np.nanquantile) sobre los años ordenados de cada
+        # estación y mes; los NaN quedan al final del orden y solo cuentan los n datos válidos
+        ordered = np.sort(self._by_year[:, start:end].astype('float64'), axis=1)
+        n_valid = (~np.isnan(ordered)).sum(axis=1)
+        position = (np.maximum(n_valid, 1) - 1)[None] * (np.asarray(key[0]) / 100)[:, None, None]
+        lower = np.floor(position).astype('int64')
+        upper = np.minimum(lower + 1, np.maximum(n_valid - 1, 0)[None])
+        weight = position - lower
+        if end > start:
+            take = lambda index: np.take_along_axis(ordered[None], index[:, :, None, :], axis=2)[:, :, 0, :]
+            below, above = take(lower), take(upper)
+            result = np.where(n_valid[None] > 0, below + weight * (above - below), np.nan)
+        else:
+            result = np.full(position.shape, np.nan)
+        with self._lock:
+            self._quantiles[key] = result
+            while len(self._quantiles) > MAX_STORED_QUANTILES:
+                self._quantiles.popitem(last=False)
+        return result
+
+    def percentiles(self, q, baseline=None):
+        """Percentil `q` (0-100) por estación y mes del período base."""
+        return self.quantiles([q], baseline)[0]
+
+    def thresholds(self, p_lower, p_upper, baseline=None):
+        """(umbral inferior, umbral superior) por estación y mes, para la clasificación de extremos."""
+        low, high = self.quantiles([p_lower, p_upper], baseline)
+        return low, high
+
+    def table(self, baseline=None, percentiles=(10, 50, 90)):
+        """Tabla larga estación × mes con media, desviación estándar, número de datos y percentiles."""
+        mean, std, counts = self.normals(baseline)
+        df = pd.DataFrame({
+            Config.STATION_NAME_COL: np.repeat(self.stations.to_numpy(), 12),
+            Config.MONTH_COL: np.tile(np.arange(1, 13), len(self.stations)),
+            'media': mean.ravel(), 'desviacion': std.ravel(), 'n_datos': counts.ravel(),
+        })
+        for q in percentiles:
+            df[f'p{q:g}'] = self.percentiles(q, baseline).ravel()
+        return df
+
+    # --- Anomalías ---
+    def lookup(self, df, array):
+        """Valor de `array` (estaciones × 12) para la estación y el mes de cada fila de df; NaN si no existe."""
+        station_col = df[Config.STATION_NAME_COL]
+        if isinstance(station_col.dtype, pd.CategoricalDtype): # Se resuelven las categorías, no las filas
+            category_codes = self.stations.get_indexer(pd.Index(station_col.cat.categories.astype(object)))
+            codes = np.append(category_codes, -1)[station_col.cat.codes.to_numpy()] # Código -1 (NaN) -> -1
+        else:
+            codes = self.stations.get_indexer(pd.Index(station_col.astype(object)))
+        months = df[Config.MONTH_COL].to_numpy().astype('int64') - 1
+        found = (codes >= 0) & (months >= 0) & (months < 12)
+        result = np.full(len(df), np.nan)
+        result[found] = array[codes[found], months[found]]
+        return result
+
+    def anomalies(self, df_monthly, baseline=None, mean_col='precip_promedio_mes'):
+        """
+        Copia de df_monthly con la media del período base (`mean_col`), la anomalía (mm), la
+        anomalía estandarizada (anomalía / desviación estándar) y el porcentaje de lo normal.
+        """
+        mean, std, _ = self.normals(baseline)
+        normal, deviation = self.lookup(df_monthly, mean), self.lookup(df_monthly, std)
+        precipitation = df_monthly[Config.PRECIPITATION_COL].to_numpy(dtype='float64', na_value=np.nan)
+        anomaly = precipitation - normal
+        with np.errstate(invalid='ignore', divide='ignore'):
+            standardized = np.where(deviation > 0, anomaly / deviation, np.nan)
+            percent = np.where(normal > 0, precipitation / normal * 100, np.nan)
+        return df_monthly.assign(**{
+            mean_col: normal, 'anomalia': anomaly,
+            'anomalia_estandarizada': standardized, 'porcentaje_normal': percent,
+        })
+
+    # --- Eventos extremos por percentiles ---
+    @staticmethod
+    def _codes(values, low, high):
+        codes = np.full(values.shape, EVENT_NORMAL, dtype='int8')
+        with np.errstate(invalid='ignore'):
+            codes[values < low] = EVENT_DRY
+            codes[values > high] = EVENT_WET
+        codes[np.isnan(values)] = EVENT_MISSING
+        return codes
+
+    def event_codes(self, p_lower, p_upper, baseline=None):
+        """
+        Código de evento de cada estación y mes del cubo (estaciones × meses, int8): EVENT_DRY por
+        debajo del percentil inferior de su mes calendario, EVENT_WET por encima del superior,
+        EVENT_NORMAL en otro caso y EVENT_MISSING sin dato.
+        """
+        low, high = self.thresholds(p_lower, p_upper, baseline)
+        values = self._by_year.astype('float64')
+        codes = self._codes(values, low[:, None, :], high[:, None, :])
+        return codes.reshape(len(self.stations), -1)
+
+    def classify(self, df, p_lower, p_upper, baseline=None):
+        """Códigos de evento de las filas de df (estación, mes y precipitación de cada fila)."""
+        low, high = self.thresholds(p_lower, p_upper, baseline)
+        values = df[Config.PRECIPITATION_COL].to_numpy(dtype='float64', na_value=np.nan)
+        return self._codes(values, self.lookup(df, low), self.lookup(df, high))
+
+    def event_counts(self, p_lower, p_upper, stations=None, year_range=None, months=None):
+        """
+        Conteo por estación de meses con dato, secos y húmedos extremos en la selección
+        (para mapas y reportes de toda la red). Una fila por estación con al menos un dato.
+        """
+        codes = self.event_codes(p_lower, p_upper).reshape(len(self.stations), -1, 12)
+        positions = np.arange(len(self.stations))
+        if stations is not None:
+            positions = self.stations.get_indexer(pd.Index(stations))
+            positions = np.sort(positions[positions >= 0])
+        start, end = self._year_slice(year_range)
+        month_idx = np.arange(12) if months is None else np.asarray(sorted(months), dtype='int64') - 1
+        block = codes[positions, start:end][:, :, month_idx]
+        n_valid = (block != EVENT_MISSING).sum(axis=(1, 2))
+        df = pd.DataFrame({
+            Config.STATION_NAME_COL: self.stations.to_numpy()[positions], 'meses_con_dato': n_valid,
+            'meses_secos': (block == EVENT_DRY).sum(axis=(1, 2)), 'meses_humedos': (block == EVENT_WET).sum(axis=(1, 2)),
+        })
+        return df[df['meses_con_dato'] > 0].reset_index(drop=True)
@@ -0,0 +1,123 @@
+# modules/compute_cache.py
+
+import io
+import pickle
+import hashlib
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Capa de caché de las funciones de cálculo (analysis, interpolation, forecasting,
+# data_processor). Los módulos de cálculo solo usan el decorador `cached`; quién guarda
+# los resultados lo decide el backend instalado:
+#   - NullCache (por defecto): sin caché. Procesos de trabajo, pipeline.py y benchmarks.
+#   - MemoryCache: LRU en memoria del proceso, útil en scripts que repiten llamadas.
+#   - streamlit_adapter.StreamlitCache: st.cache_data, instalado por app.py.
+# Como en st.cache_data, los parámetros cuyo nombre empieza con '_' no forman parte de la clave.
+
+class NullCache:
+    """Backend sin caché: cada llamada ejecuta la función."""
+
+    def wrap(self, func):
+        return func
+
+    def clear(self):
+        pass
+
+class MemoryCache:
+    """Backend LRU en memoria. La clave es un hash del contenido de los argumentos."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__module__, func.__qualname__, hash_arguments(signature, args, kwargs))
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+            result = func(*args, **kwargs)
+            with self._lock:
+                self._entries[key] = result
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return result
+        return wrapper
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_backend = NullCache()
+_wrapped = {}
+_lock = threading.Lock()
+
+def set_cache_backend(backend):
+    """Instala el backend de caché para todas las funciones decoradas con `cached`."""
+    global _backend
+    with _lock:
+        _backend = backend
+        _wrapped.clear()
+
+def get_cache_backend():
+    return _backend
+
+def clear_cache():
+    """Vacía la caché del backend instalado."""
+    _backend.clear()
+
+def cached(func):
+    """
+    Decorador de las funciones de cálculo. La función se envuelve con el backend vigente
+    en el momento de la llamada, por lo que el backend puede cambiarse después de importar
+    los módulos. `__wrapped__` apunta a la función original, sin caché.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        backend_func = _wrapped.get(func)
+        if backend_func is None:
+            with _lock:
+                backend_func = _wrapped.setdefault(func, _backend.wrap(func))
+        return backend_func(*args, **kwargs)
+    return wrapper
+
+# --- Hash de argumentos (MemoryCache) ---
+def hash_arguments(signature, args, kwargs):
+    """Hash de los argumentos enlazados a la firma, omitiendo los parámetros que empiezan con '_'."""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    digest = hashlib.sha256()
+    for name, value in bound.arguments.items():
+        if name.startswith('_'):
+            continue
+        digest.update(name.encode())
+        digest.update(_hash_value(value))
+    return digest.hexdigest()
+
+def _hash_value(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        try:
+            hashed = pd.util.hash_pandas_object(value, index=not isinstance(value, pd.Index))
+            columns = repr(list(value.columns)) if isinstance(value, pd.DataFrame) else repr(value.name)
+            return hashlib.sha256(hashed.to_numpy().tobytes() + columns.encode()).digest()
+        except TypeError:
+            pass
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(repr((value.shape, value.dtype.str)).encode() + np.ascontiguousarray(value).tobytes()).digest()
+    if isinstance(value, io.BytesIO) or hasattr(value, 'getvalue'):
+        return hashlib.sha256(value.getvalue()).digest()
+    if isinstance(value, (list, tuple)):
+        return hashlib.sha256(b''.join(_hash_value(item) for item in value)).digest()
+    try:
+        return hashlib.sha256(pickle.dumps(value, protocol=4)).digest()
+    except Exception:
+        return hashlib.sha256(repr(value).encode()).digest()
@@ -1,8 +1,8 @@
 # modules/config.py
 
 import os
-import streamlit as st
 import pandas as pd
+from modules.product_cache import ProductCache
 
 class Config:
     #--- Configuración de la Aplicación
@@ -74,8 +74,34 @@ class Config:
     #--- Configuración para DEM
     DEM_SERVER_URL = "https://tu-bucket.storage.com/srtm_antioquia.tif"
 
+    #--- Caché persistente de datos procesados (Parquet)
+    DATA_CACHE_DIR = os.environ.get("SIHCLIM_CACHE_DIR", os.path.join(_PROJECT_ROOT, '.cache', 'datasets'))
+    DATA_CACHE_VERSION = 6 # Incrementar cuando cambie la salida de load_and_process_all_data
+    DATA_CACHE_MAX_ENTRIES = 5
+
+    #--- Caché por sesión de productos derivados y selecciones filtradas (LRU acotada)
+    PRODUCT_CACHE_MAX_MB = float(os.environ.get("SIHCLIM_PRODUCT_CACHE_MB", 256))
+    PRODUCT_CACHE_MAX_ENTRIES = 32
+
+    #--- Índices de sequía (drought_indices)
+    SPI_SCALES = [1, 3, 6, 9, 12, 24] # Escalas en meses
+    SPI_MIN_FIT_VALUES = 10 # Sumas positivas mínimas por mes calendario para ajustar la distribución
+
+    #--- Productos precalculados por pipeline.py (los lee la aplicación)
+    PRODUCT_STORE_DIR = os.environ.get("SIHCLIM_PRODUCT_DIR", os.path.join(_PROJECT_ROOT, '.cache', 'products'))
+    PRODUCT_SPI_SCALES = SPI_SCALES
+    PRODUCT_INTERPOLATION_METHODS = ["Kriging Ordinario", "IDW", "Spline (Thin Plate)"]
+    PRODUCT_VARIOGRAM_MODEL = 'linear'
+    PRODUCT_FORECAST_HORIZON = 36
+    PRODUCT_FORECAST_TEST_SIZE = 12
+
+    #--- Descargas HTTP (GitHub): caché en disco con revalidación condicional
+    HTTP_CACHE_DIR = os.environ.get("SIHCLIM_HTTP_CACHE_DIR", os.path.join(_PROJECT_ROOT, '.cache', 'http'))
+    HTTP_TIMEOUT = (5, 60) # (conexión, lectura) en segundos
+
     @staticmethod
     def initialize_session_state():
+        import streamlit as st # Solo la interfaz usa el estado de sesión; Config no depende de Streamlit
         if 'data_loaded' not in st.session_state:
             st.session_state.data_loaded = False
         if 'gdf_stations' not in st.session_state:
@@ -86,6 +112,24 @@ class Config:
             st.session_state.df_enso = None
         if 'gdf_municipios' not in st.session_state:
             st.session_state.gdf_municipios = None
+        if 'precip_cube' not in st.session_state:
+            st.session_state.precip_cube = None
+        if 'station_index' not in st.session_state:
+            st.session_state.station_index = None
+        if 'long_index' not in st.session_state:
+            st.session_state.long_index = None
+        if 'annual_cube' not in st.session_state:
+            st.session_state.annual_cube = None
+        if 'dataset_key' not in st.session_state:
+            st.session_state.dataset_key = None
+        if 'dataset_handle' not in st.session_state:
+            st.session_state.dataset_handle = None # Referencia al conjunto compartido (dataset_registry)
+        if 'append_message' not in st.session_state:
+            st.session_state.append_message = None # Resumen de la última incorporación de registros
+        if 'product_cache' not in st.session_state:
+            st.session_state.product_cache = ProductCache(
+                max_bytes=int(Config.PRODUCT_CACHE_MAX_MB * 1024 ** 2), max_entries=Config.PRODUCT_CACHE_MAX_ENTRIES
+            )
         if 'df_monthly_processed' not in st.session_state:
             st.session_state.df_monthly_processed = pd.DataFrame()
         if 'meses_numeros' not in st.session_state:
@@ -0,0 +1,271 @@
+# modules/data_cache.py
+
+import os
+import shutil
+import hashlib
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from modules.config import Config
+
+# Nombre de archivo Parquet para cada objeto del conjunto de datos procesado.
+_DATASET_FILES = {
+    'gdf_stations': 'stations.parquet',
+    'gdf_municipios': 'municipios.parquet',
+    'df_long': 'long.parquet',
+    'df_enso': 'enso.parquet',
+}
+_GEO_OBJECTS = ('gdf_stations', 'gdf_municipios')
+
+def _read_file_bytes(file_object):
+    """Obtiene el contenido binario de un archivo subido o de un objeto tipo BytesIO."""
+    if hasattr(file_object, 'getvalue'):
+        return file_object.getvalue()
+    position = file_object.tell()
+    content = file_object.read()
+    file_object.seek(position)
+    return content
+
+def compute_dataset_key(*file_objects):
+    """
+    Calcula una clave de contenido (SHA-256) a partir de los archivos de entrada.
+    Devuelve None si alguno de los archivos no está disponible.
+    """
+    if any(f is None for f in file_objects):
+        return None
+    hasher = hashlib.sha256(f"v{Config.DATA_CACHE_VERSION}".encode())
+    for file_object in file_objects:
+        content = _read_file_bytes(file_object)
+        hasher.update(len(content).to_bytes(8, 'little'))
+        hasher.update(content)
+    return hasher.hexdigest()[:32]
+
+def derive_dataset_key(base_key, *file_objects):
+    """Clave de un conjunto de datos obtenido al añadir archivos incrementales a otro ya cargado."""
+    if not base_key:
+        return None
+    delta_key = compute_dataset_key(*file_objects)
+    if delta_key is None:
+        return None
+    return hashlib.sha256(f"{base_key}+{delta_key}".encode()).hexdigest()[:32]
+
+def _dataset_dir(dataset_key):
+    return os.path.join(Config.DATA_CACHE_DIR, dataset_key)
+
+def create_staging_dir():
+    """
+    Crea un directorio temporal (dentro de la caché, si es posible) donde se escriben los
+    archivos de un conjunto de datos antes de publicarlos con save_dataset_to_cache.
+    """
+    try:
+        os.makedirs(Config.DATA_CACHE_DIR, exist_ok=True)
+        return tempfile.mkdtemp(prefix=".staging-", dir=Config.DATA_CACHE_DIR)
+    except OSError:
+        return tempfile.mkdtemp(prefix="sihclim-")
+
+def dataset_file_path(directory, name):
+    """Ruta del archivo Parquet de un objeto del conjunto de datos ('df_long', 'df_enso', ...)."""
+    return os.path.join(directory, _DATASET_FILES[name])
+
+class ParquetChunkWriter:
+    """
+    Escribe DataFrames sucesivos (con las mismas columnas) como row groups de un único
+    archivo Parquet, para construir tablas grandes sin mantenerlas completas en memoria.
+    El esquema lo fija el primer bloque; los siguientes se convierten a ese esquema.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._writer = None
+        self._empty_frame = None
+
+    def write(self, df):
+        if df.empty:
+            if self._empty_frame is None:
+                self._empty_frame = df
+            return
+        if self._writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=False).cast(self._writer.schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        elif self._empty_frame is not None:
+            # Sin filas: se escribe igualmente el archivo para conservar las columnas
+            self._empty_frame.to_parquet(self.path, index=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._writer is not None:
+            self._writer.close()
+        return False
+
+def load_cached_dataset(dataset_key):
+    """
+    Lee desde disco (con memory mapping) el conjunto de datos procesado asociado a la clave.
+    Devuelve la tupla (gdf_stations, gdf_municipios, df_long, df_enso) o None si no existe.
+    """
+    if not dataset_key:
+        return None
+    dataset_dir = _dataset_dir(dataset_key)
+    if not os.path.isdir(dataset_dir):
+        return None
+    try:
+        loaded = {}
+        for name, file_name in _DATASET_FILES.items():
+            path = os.path.join(dataset_dir, file_name)
+            reader = gpd.read_parquet if name in _GEO_OBJECTS else pd.read_parquet
+            loaded[name] = reader(path, memory_map=True)
+        os.utime(dataset_dir) # Marca el uso para la política de depuración
+    except Exception as e:
+        warnings.warn(f"Caché de datos inválida en '{dataset_dir}', se descarta: {e}")
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        return None
+    return tuple(loaded[name] for name in _DATASET_FILES)
+
+def save_dataset_to_cache(dataset_key, gdf_stations, gdf_municipios, df_long, df_enso, staging_dir=None):
+    """
+    Guarda el conjunto de datos procesado en formato Parquet (GeoParquet para las capas espaciales).
+    La escritura es atómica: se escribe en un directorio temporal y luego se renombra.
+    Si se indica `staging_dir` (ver create_staging_dir), los archivos que ya existan en él
+    (p. ej. df_long escrito por bloques) se publican tal cual, sin volver a escribirse.
+    """
+    if not dataset_key:
+        return False
+    objects = {
+        'gdf_stations': gdf_stations, 'gdf_municipios': gdf_municipios,
+        'df_long': df_long, 'df_enso': df_enso,
+    }
+    temp_dir = staging_dir
+    if temp_dir is None:
+        os.makedirs(Config.DATA_CACHE_DIR, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=f".{dataset_key}-", dir=Config.DATA_CACHE_DIR)
+    try:
+        for name, file_name in _DATASET_FILES.items():
+            path = os.path.join(temp_dir, file_name)
+            if staging_dir is None or not os.path.exists(path):
+                objects[name].to_parquet(path, index=False)
+        dataset_dir = _dataset_dir(dataset_key)
+        if os.path.isdir(dataset_dir):
+            shutil.rmtree(dataset_dir, ignore_errors=True)
+        os.replace(temp_dir, dataset_dir)
+    except Exception as e:
+        warnings.warn(f"No se pudo guardar la caché de datos '{dataset_key}': {e}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return False
+    _prune_cache()
+    return True
+
+# Subdirectorios de la caché con tablas auxiliares (no son entradas de conjuntos de datos)
+_AUX_KINDS = ('layers', 'elevations', 'covariates')
+
+def _aux_path(kind, key, extension='.parquet'):
+    return os.path.join(Config.DATA_CACHE_DIR, kind, f"{key}{extension}")
+
+def load_cached_frame(kind, key, geo=False):
+    """Lee una tabla auxiliar de la caché ('layers', 'elevations') o None si no existe."""
+    if not key:
+        return None
+    path = _aux_path(kind, key)
+    if not os.path.exists(path):
+        return None
+    try:
+        reader = gpd.read_parquet if geo else pd.read_parquet
+        return reader(path, memory_map=True)
+    except Exception as e:
+        warnings.warn(f"Tabla en caché inválida en '{path}', se descarta: {e}")
+        os.remove(path)
+        return None
+
+def save_frame_to_cache(kind, key, df):
+    """Guarda una tabla auxiliar (GeoParquet si es un GeoDataFrame) con escritura atómica."""
+    if not key:
+        return False
+    path = _aux_path(kind, key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=f".{key}-", suffix='.parquet', dir=os.path.dirname(path))
+        os.close(fd)
+        df.to_parquet(temp_path, index=False)
+        os.replace(temp_path, path)
+    except Exception as e:
+        warnings.warn(f"No se pudo guardar '{key}' en la caché '{kind}': {e}")
+        return False
+    _prune_cache()
+    return True
+
+def load_cached_array(kind, key):
+    """Lee un arreglo NumPy auxiliar de la caché (p. ej. 'covariates') o None si no existe."""
+    if not key:
+        return None
+    path = _aux_path(kind, key, '.npy')
+    if not os.path.exists(path):
+        return None
+    try:
+        return np.load(path, mmap_mode='r')
+    except Exception as e:
+        warnings.warn(f"Arreglo en caché inválido en '{path}', se descarta: {e}")
+        os.remove(path)
+        return None
+
+def save_array_to_cache(kind, key, array):
+    """Guarda un arreglo NumPy auxiliar con escritura atómica."""
+    if not key:
+        return False
+    path = _aux_path(kind, key, '.npy')
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=f".{key}-", suffix='.npy', dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        os.replace(temp_path, path)
+    except Exception as e:
+        warnings.warn(f"No se pudo guardar '{key}' en la caché '{kind}': {e}")
+        return False
+    _prune_cache()
+    return True
+
+def load_cached_layer(layer_key):
+    """Lee una capa espacial ya procesada (GeoParquet) asociada a la clave, o None si no existe."""
+    return load_cached_frame('layers', layer_key, geo=True)
+
+def save_layer_to_cache(layer_key, gdf):
+    """Guarda una capa espacial procesada como GeoParquet."""
+    return save_frame_to_cache('layers', layer_key, gdf)
+
+def _prune_cache():
+    """Elimina las entradas menos usadas recientemente por encima de DATA_CACHE_MAX_ENTRIES."""
+    try:
+        entries = [
+            os.path.join(Config.DATA_CACHE_DIR, d) for d in os.listdir(Config.DATA_CACHE_DIR)
+            if not d.startswith('.') and d not in _AUX_KINDS and os.path.isdir(os.path.join(Config.DATA_CACHE_DIR, d))
+        ]
+    except OSError:
+        return
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for stale_dir in entries[Config.DATA_CACHE_MAX_ENTRIES:]:
+        shutil.rmtree(stale_dir, ignore_errors=True)
+
+    for kind in _AUX_KINDS:
+        aux_dir = os.path.join(Config.DATA_CACHE_DIR, kind)
+        try:
+            files = [os.path.join(aux_dir, f) for f in os.listdir(aux_dir) if not f.startswith('.')]
+            files.sort(key=os.path.getmtime, reverse=True)
+            for stale_file in files[Config.DATA_CACHE_MAX_ENTRIES:]:
+                os.remove(stale_file)
+        except OSError:
+            continue
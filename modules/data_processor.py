@@ -1,157 +1,248 @@
 # modules/data_processor.py
 
-import streamlit as st
 import pandas as pd
 import geopandas as gpd
 import zipfile
-import tempfile
 import os
 import io
+import shutil
 import numpy as np
-import rasterio
 import requests
 from modules.config import Config
-from modules.utils import standardize_numeric_column
+from modules.utils import normalize_numeric_frame
+from modules.compute_cache import cached
+from modules.indexing import long_sort_keys
+from modules.precip_cube import PrecipCube
+from modules.ingest import read_csv_bytes, iter_csv_chunks
+from modules.dem_service import get_elevations
+from modules.data_cache import (
+    compute_dataset_key, load_cached_dataset, save_dataset_to_cache,
+    create_staging_dir, dataset_file_path, ParquetChunkWriter,
+    load_cached_layer, save_layer_to_cache
+)
 
 # --- UTILS ---
-@st.cache_data
+MONTHS_ES_TO_EN = {
+    'ene': 'Jan', 'feb': 'Feb', 'mar': 'Mar', 'abr': 'Apr',
+    'may': 'May', 'jun': 'Jun', 'jul': 'Jul', 'ago': 'Aug',
+    'sep': 'Sep', 'oct': 'Oct', 'nov': 'Nov', 'dic': 'Dec'
+}
+
 def parse_spanish_dates(date_series):
-    months_es_to_en = {
-        'ene': 'Jan', 'feb': 'Feb', 'mar': 'Mar', 'abr': 'Apr',
-        'may': 'May', 'jun': 'Jun', 'jul': 'Jul', 'ago': 'Aug',
-        'sep': 'Sep', 'oct': 'Oct', 'nov': 'Nov', 'dic': 'Dec'
-    }
-    date_series_str = date_series.astype(str).str.lower()
-    for es, en in months_es_to_en.items():
-        date_series_str = date_series_str.str.replace(es, en, regex=False)
-    return pd.to_datetime(date_series_str, format='%b-%y', errors='coerce')
-
-@st.cache_data
-def load_csv_data(file_uploader_object, sep=";", lower_case=True):
+    """
+    Convierte fechas en formato 'mmm-aa' en español (p. ej. 'ene-70') a datetime.
+    Cada valor distinto se interpreta una sola vez y el resultado se propaga a todas
+    las filas mediante los códigos de factorización, por lo que el costo depende del
+    número de meses distintos y no del largo de la serie.
+    """
+    if pd.api.types.is_datetime64_any_dtype(date_series):
+        return date_series
+    codes, uniques = pd.factorize(date_series)
+    uniques_str = pd.Series(uniques, dtype=object).astype(str).str.lower()
+    for es, en in MONTHS_ES_TO_EN.items():
+        uniques_str = uniques_str.str.replace(es, en, regex=False)
+    parsed = pd.to_datetime(uniques_str, format='%b-%y', errors='coerce').to_numpy()
+    # El código -1 (valores nulos) apunta al NaT agregado al final
+    parsed = np.append(parsed, np.datetime64('NaT', 'ns'))
+    return pd.Series(parsed[codes], index=date_series.index, name=date_series.name)
+
+# --- ESQUEMA COMPACTO DE df_long ---
+# Columnas de texto repetidas en cada fila mensual -> category
+LONG_CATEGORICAL_COLS = [Config.STATION_NAME_COL, 'id_estacion', Config.ORIGIN_COL, 'enso_año', 'enso_mes']
+# Precipitación e índices ENSO -> float32
+LONG_FLOAT32_COLS = [Config.PRECIPITATION_COL, Config.ENSO_ONI_COL, 'temp_sst', 'temp_media', Config.SOI_COL, Config.IOD_COL]
+LONG_INT_COLS = {Config.YEAR_COL: 'int16', Config.MONTH_COL: 'int8'}
+# Metadatos que viven en la tabla lateral de estaciones (gdf_stations)
+STATION_METADATA_COLS = [
+    Config.MUNICIPALITY_COL, Config.REGION_COL, Config.ALTITUDE_COL, Config.CELL_COL,
+    Config.LATITUDE_COL, Config.LONGITUDE_COL, Config.ET_COL
+]
+
+def apply_compact_schema(df):
+    """Aplica el esquema compacto (category, float32, int16/int8) a las columnas presentes."""
+    dtypes = {col: 'category' for col in LONG_CATEGORICAL_COLS}
+    dtypes.update({col: 'float32' for col in LONG_FLOAT32_COLS})
+    dtypes.update(LONG_INT_COLS)
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
+def sort_long(df_long):
+    """
+    Ordena df_long por (estación, fecha) según los códigos categóricos de la estación, de modo
+    que las filas de cada estación queden contiguas y en orden cronológico (ver indexing.LongIndex).
+    Si ya está ordenado se devuelve sin copiar.
+    """
+    keys = long_sort_keys(df_long)
+    if len(keys) < 2 or (np.diff(keys) >= 0).all():
+        return df_long
+    return df_long.take(np.argsort(keys, kind='stable')).reset_index(drop=True)
+
+def attach_station_metadata(df, gdf_stations, columns=None, copy=True):
+    """
+    Une a un subconjunto de df_long los metadatos de estación desde la tabla lateral.
+    Además decodifica las columnas categóricas y amplía los enteros compactos, de modo
+    que el resultado se comporte como el df_long tradicional en agrupaciones y cálculos.
+    Con copy=False se modifica `df` directamente (p. ej. si ya es una selección nueva).
+    """
+    if copy:
+        df = df.copy()
+    for col in LONG_CATEGORICAL_COLS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    for col in LONG_INT_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype('int64')
+
+    columns = STATION_METADATA_COLS if columns is None else columns
+    columns = [col for col in columns if col in gdf_stations.columns and col not in df.columns]
+    if columns:
+        metadata = gdf_stations.drop_duplicates(subset=[Config.STATION_NAME_COL]).set_index(Config.STATION_NAME_COL)
+        for col in columns:
+            df[col] = df[Config.STATION_NAME_COL].map(metadata[col])
+    return df
+
+@cached
+def load_csv_data(file_uploader_object, sep=None, lower_case=True, decimal=','):
+    """
+    Lee un CSV subido en una sola pasada. La codificación y el delimitador (si sep es None)
+    se detectan sobre una muestra de bytes en lugar de reintentar el parseo completo.
+    La coma decimal se interpreta directamente en el parser de CSV.
+    Lanza ValueError si el archivo está vacío o no se puede interpretar.
+    """
     if file_uploader_object is None: return None
+    file_name = getattr(file_uploader_object, 'name', 'CSV')
     try:
         content = file_uploader_object.getvalue()
-        if not content.strip():
-            st.error(f"El archivo '{file_uploader_object.name}' parece estar vacío.")
-            return None
     except Exception as e:
-        st.error(f"Error al leer el archivo '{file_uploader_object.name}': {e}")
-        return None
-    encodings_to_try = ['utf-8', 'latin1', 'cp1252', 'iso-8859-1']
-    for encoding in encodings_to_try:
-        try:
-            df = pd.read_csv(io.BytesIO(content), sep=sep, encoding=encoding)
-            if lower_case:
-                df.columns = [col.strip().lower() for col in df.columns]
-            return df
-        except Exception:
-            continue
-    st.error(f"No se pudo decodificar el archivo '{file_uploader_object.name}' con las codificaciones probadas.")
-    return None
-
-@st.cache_data
+        raise ValueError(f"Error al leer el archivo '{file_name}': {e}") from e
+    if not content.strip():
+        raise ValueError(f"El archivo '{file_name}' parece estar vacío.")
+    try:
+        df = read_csv_bytes(content, sep=sep, decimal=decimal)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"No se pudo interpretar el archivo '{file_name}': {e}") from e
+    if lower_case:
+        df.columns = [col.strip().lower() for col in df.columns]
+    return df
+
+@cached
 def load_shapefile(file_uploader_object):
+    """
+    Lee el shapefile directamente desde el ZIP a través del sistema de archivos virtual de
+    GDAL (/vsizip/ sobre /vsimem/), sin extraerlo, y lo reproyecta a EPSG:4326.
+    La capa reproyectada se guarda como GeoParquet indexada por el hash del ZIP, de modo
+    que las cargas siguientes no repiten la lectura del shapefile ni la reproyección.
+    Lanza ValueError si el ZIP no contiene un shapefile válido.
+    """
     if file_uploader_object is None: return None
+    layer_key = compute_dataset_key(file_uploader_object)
+    gdf = load_cached_layer(layer_key)
+    if gdf is not None:
+        return gdf
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            with zipfile.ZipFile(file_uploader_object, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            shp_files = [f for f in os.listdir(temp_dir) if f.endswith('.shp')]
-            if not shp_files:
-                st.error("No se encontró un archivo .shp en el archivo .zip.")
-                return None
-            shp_path = os.path.join(temp_dir, shp_files[0])
-            gdf = gpd.read_file(shp_path)
-            gdf.columns = gdf.columns.str.strip().str.lower()
-            if gdf.crs is None:
-                gdf.set_crs("EPSG:4686", inplace=True) # Origen Nacional
-            return gdf.to_crs("EPSG:4326")
+        content = file_uploader_object.getvalue()
+        with zipfile.ZipFile(io.BytesIO(content)) as zip_ref:
+            shp_files = [name for name in zip_ref.namelist() if name.lower().endswith('.shp')]
+        if not shp_files:
+            raise ValueError("No se encontró un archivo .shp en el archivo .zip.")
+        layer_name = os.path.splitext(os.path.basename(shp_files[0]))[0]
+        gdf = gpd.read_file(io.BytesIO(content), layer=layer_name)
+        gdf.columns = gdf.columns.str.strip().str.lower()
+        if gdf.crs is None:
+            gdf.set_crs("EPSG:4686", inplace=True) # Origen Nacional
+        gdf = gdf.to_crs("EPSG:4326")
+    except ValueError:
+        raise
     except Exception as e:
-        st.error(f"Error al procesar el shapefile: {e}")
-        return None
-
-# --- INICIO DE LA CORRECCIÓN ---
-# Se elimina el decorador @st.cache_data para resolver el CacheReplayClosureError.
-def complete_series(_df, _progress_bar=None):
-# --- FIN DE LA CORRECCIÓN ---
-    """Completa las series de tiempo mensuales para cada estación mediante interpolación."""
-    all_completed_dfs = []
-    station_list = _df[Config.STATION_NAME_COL].unique()
-    
-    metadata_cols_to_keep = [
-        col for col in [Config.MUNICIPALITY_COL, Config.ALTITUDE_COL, Config.REGION_COL, Config.CELL_COL] 
-        if col in _df.columns
-    ]
-
-    total_stations = len(station_list)
-    for i, station in enumerate(station_list):
-        if _progress_bar:
-            progress_percentage = (i + 1) / total_stations
-            progress_text = f"Interpolando estación: {station} ({i+1}/{total_stations})"
-            _progress_bar.progress(progress_percentage, text=progress_text)
-            
-        df_station = _df[_df[Config.STATION_NAME_COL] == station].copy()
-        station_metadata = None
-        if not df_station.empty and metadata_cols_to_keep:
-            station_metadata = df_station[metadata_cols_to_keep].iloc[0]
-
-        df_station[Config.DATE_COL] = pd.to_datetime(df_station[Config.DATE_COL])
-        df_station.set_index(Config.DATE_COL, inplace=True)
-
-        if not df_station.index.is_unique:
-            df_station = df_station[~df_station.index.duplicated(keep='first')]
-        
-        df_station[Config.ORIGIN_COL] = 'Original'
-
-        date_range = pd.date_range(start=df_station.index.min(), end=df_station.index.max(), freq='MS')
-        df_resampled = df_station.reindex(date_range)
-        
-        df_resampled[Config.PRECIPITATION_COL] = df_resampled[Config.PRECIPITATION_COL].interpolate(method='time')
-        df_resampled[Config.ORIGIN_COL] = df_resampled[Config.ORIGIN_COL].fillna('Completado')
-        df_resampled[Config.STATION_NAME_COL] = station
-
-        if station_metadata is not None:
-            for col_name, value in station_metadata.items():
-                df_resampled[col_name] = value
-
-        df_resampled[Config.YEAR_COL] = df_resampled.index.year
-        df_resampled[Config.MONTH_COL] = df_resampled.index.month
-        
-        df_resampled.reset_index(inplace=True)
-        df_resampled.rename(columns={'index': Config.DATE_COL}, inplace=True)
-        all_completed_dfs.append(df_resampled)
-    
-    if _progress_bar:
-        _progress_bar.empty()
+        raise ValueError(f"Error al procesar el shapefile: {e}") from e
+    save_layer_to_cache(layer_key, gdf)
+    return gdf
+
+def complete_series(_df, completed=None):
+    """
+    Completa las series de tiempo mensuales de las estaciones de `_df` mediante interpolación.
+    Los huecos se rellenan para todas las estaciones a la vez sobre el arreglo estaciones × meses
+    (PrecipCube.fill_gaps). `completed` es un PrecipCube ya completado que cubre la selección
+    (p. ej. el panel completo del conjunto de datos, calculado una sola vez y recortado con
+    select); si no se entrega, se completa `_df` entre el primer y el último dato de cada estación.
+    Las filas originales se conservan ('Original'); las nuevas ('Completado') llevan los
+    metadatos de su estación.
+    """
+    if _df.empty:
+        return pd.DataFrame()
+    df_original = _df.copy()
+    df_original[Config.DATE_COL] = pd.to_datetime(df_original[Config.DATE_COL])
+    df_original = df_original.drop_duplicates(subset=[Config.STATION_NAME_COL, Config.DATE_COL], keep='first')
+    df_original[Config.ORIGIN_COL] = 'Original'
+
+    original = PrecipCube.from_long(df_original)
+    if completed is None:
+        completed = original.fill_gaps()
+    new_cells = ~np.isnan(completed.values) & np.isnan(original.align_to(completed))
+    station_idx, month_idx = np.nonzero(new_cells)
+    dates = completed.months[month_idx]
+    df_new = pd.DataFrame({
+        Config.DATE_COL: dates,
+        Config.STATION_NAME_COL: completed.stations.to_numpy()[station_idx],
+        Config.PRECIPITATION_COL: completed.values[station_idx, month_idx],
+        Config.ORIGIN_COL: 'Completado',
+        Config.YEAR_COL: dates.year.astype('int64'),
+        Config.MONTH_COL: dates.month.astype('int64'),
+    })
+    metadata_cols = [col for col in STATION_METADATA_COLS if col in df_original.columns]
+    if metadata_cols:
+        metadata = df_original.drop_duplicates(subset=[Config.STATION_NAME_COL]).set_index(Config.STATION_NAME_COL)
+        for col in metadata_cols:
+            df_new[col] = df_new[Config.STATION_NAME_COL].map(metadata[col])
+
+    df_completed = pd.concat([df_original, df_new], ignore_index=True)
+    df_completed[Config.STATION_NAME_COL] = df_completed[Config.STATION_NAME_COL].astype(object)
+    return df_completed.sort_values([Config.STATION_NAME_COL, Config.DATE_COL], kind='stable').reset_index(drop=True)
 
-    return pd.concat(all_completed_dfs, ignore_index=True) if all_completed_dfs else pd.DataFrame()
 
-
-@st.cache_data
 def load_and_process_all_data(uploaded_file_mapa, uploaded_file_precip, uploaded_zip_shapefile):
+    """
+    Carga y procesa los tres archivos base. El resultado se guarda en una caché Parquet
+    en disco, indexada por el contenido de los archivos, que sobrevive a reinicios del servidor.
+    No usa `cached`: en la aplicación el DatasetRegistry ya guarda una sola copia por conjunto.
+    La precipitación se procesa por bloques y df_long se escribe directamente en el
+    directorio de la caché, por lo que el pico de memoria no depende del tamaño del archivo.
+    Lanza ValueError si alguno de los archivos no se puede procesar.
+    """
+    dataset_key = compute_dataset_key(uploaded_file_mapa, uploaded_file_precip, uploaded_zip_shapefile)
+    cached_dataset = load_cached_dataset(dataset_key)
+    if cached_dataset is not None:
+        return cached_dataset
+
+    staging_dir = create_staging_dir()
+    try:
+        result = _process_all_data(
+            uploaded_file_mapa, uploaded_file_precip, uploaded_zip_shapefile,
+            long_path=dataset_file_path(staging_dir, 'df_long')
+        )
+        save_dataset_to_cache(dataset_key, *result, staging_dir=staging_dir)
+    finally:
+        # Tras publicar la caché el directorio ya no existe; si no se publicó, se descarta
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return result
+
+def _process_all_data(uploaded_file_mapa, uploaded_file_precip, uploaded_zip_shapefile, long_path):
     df_stations_raw = load_csv_data(uploaded_file_mapa)
-    df_precip_raw = load_csv_data(uploaded_file_precip)
     gdf_municipios = load_shapefile(uploaded_zip_shapefile)
 
-    if any(df is None for df in [df_stations_raw, df_precip_raw, gdf_municipios]):
-        return None, None, None, None
+    if any(df is None for df in [df_stations_raw, gdf_municipios]) or uploaded_file_precip is None:
+        raise ValueError("Se requieren los archivos de estaciones, precipitación y shapefile.")
 
     lon_col = next((col for col in df_stations_raw.columns if 'longitud' in col.lower() or 'lon' in col.lower()), None)
     lat_col = next((col for col in df_stations_raw.columns if 'latitud' in col.lower() or 'lat' in col.lower()), None)
     if not all([lon_col, lat_col]):
-        st.error("No se encontraron columnas de longitud y/o latitud en el archivo de estaciones.")
-        return None, None, None, None
+        raise ValueError("No se encontraron columnas de longitud y/o latitud en el archivo de estaciones.")
+
+    normalize_numeric_frame(df_stations_raw, [lon_col, lat_col, Config.ET_COL, Config.ALTITUDE_COL])
 
-    df_stations_raw[lon_col] = standardize_numeric_column(df_stations_raw[lon_col])
-    df_stations_raw[lat_col] = standardize_numeric_column(df_stations_raw[lat_col])
-    
     for col in [Config.MUNICIPALITY_COL, Config.REGION_COL]:
         if col in df_stations_raw.columns:
             df_stations_raw[col] = df_stations_raw[col].astype(str).str.strip().replace('nan', 'Sin Dato')
 
-    if Config.ET_COL in df_stations_raw.columns:
-        df_stations_raw[Config.ET_COL] = standardize_numeric_column(df_stations_raw[Config.ET_COL])
-
     df_stations_raw.dropna(subset=[lon_col, lat_col], inplace=True)
 
     gdf_stations = gpd.GeoDataFrame(
@@ -163,9 +254,53 @@ def load_and_process_all_data(uploaded_file_mapa, uploaded_file_precip, uploaded
     gdf_stations[Config.LONGITUDE_COL] = gdf_stations.geometry.x
     gdf_stations[Config.LATITUDE_COL] = gdf_stations.geometry.y
 
-    if Config.ALTITUDE_COL in gdf_stations.columns:
-        gdf_stations[Config.ALTITUDE_COL] = standardize_numeric_column(gdf_stations[Config.ALTITUDE_COL])
+    id_estacion_col_name = 'id_estacio'
+    if id_estacion_col_name not in gdf_stations.columns:
+        raise ValueError(f"No se encontró la columna '{id_estacion_col_name}' en el archivo de estaciones.")
+    gdf_stations[id_estacion_col_name] = gdf_stations[id_estacion_col_name].astype(str).str.strip()
+
+    df_long, df_enso = _stream_precipitation_to_long(uploaded_file_precip, gdf_stations, long_path)
+    return gdf_stations, gdf_municipios, df_long, df_enso
 
+def _stream_precipitation_to_long(uploaded_file_precip, gdf_stations, long_path):
+    """
+    Ingesta por bloques del archivo de precipitación: cada bloque de filas de la tabla ancha
+    se convierte a formato largo y se escribe como un row group del archivo Parquet `long_path`.
+    Ni la tabla ancha completa ni el resultado completo del melt llegan a estar en memoria;
+    df_long se lee al final desde el archivo con memory mapping.
+    """
+    file_name = getattr(uploaded_file_precip, 'name', 'CSV')
+    for encoding in (None, 'latin1'):
+        enso_chunks = []
+        try:
+            with ParquetChunkWriter(long_path) as writer:
+                for chunk in iter_csv_chunks(uploaded_file_precip, encoding=encoding, decimal=','):
+                    chunk.columns = [col.strip().lower() for col in chunk.columns]
+                    df_long_chunk, df_enso_chunk = _precipitation_to_long(chunk, gdf_stations)
+                    writer.write(df_long_chunk)
+                    enso_chunks.append(df_enso_chunk)
+            break
+        except UnicodeDecodeError:
+            # La muestra inicial no fue representativa: se reinicia la lectura con latin1,
+            # que decodifica cualquier secuencia de bytes.
+            continue
+        except ValueError as e:
+            raise ValueError(f"No se pudo interpretar el archivo '{file_name}': {e}") from e
+
+    df_long = apply_compact_schema(pd.read_parquet(long_path, memory_map=True))
+    sorted_long = sort_long(df_long)
+    if sorted_long is not df_long:
+        # Se reescribe ordenado para que la caché entregue df_long ya indexable
+        df_long = sorted_long
+        df_long.to_parquet(long_path, index=False)
+    df_enso = pd.concat(enso_chunks, ignore_index=True).drop_duplicates().reset_index(drop=True)
+    return df_long, apply_compact_schema(df_enso)
+
+def _precipitation_to_long(df_precip_raw, gdf_stations):
+    """
+    Convierte la tabla ancha de precipitación (una fila por mes, una columna por estación)
+    en df_long y df_enso. Se usa tanto en la carga completa como al añadir registros nuevos.
+    """
     columns_to_exclude = [
         Config.DATE_COL, Config.ENSO_ONI_COL, Config.SOI_COL, Config.IOD_COL,
         'temp_sst', 'temp_media', 'id', 'fecha', 'mes', 'año', 'id_estacio', 'nom_est', 'unnamed',
@@ -176,48 +311,38 @@ def load_and_process_all_data(uploaded_file_mapa, uploaded_file_precip, uploaded
     station_id_cols = [col for col in df_precip_raw.columns if col not in id_vars]
 
     if not station_id_cols:
-        st.error("Error: No se pudieron identificar las columnas de estación. Verifique que los nombres de las columnas de metadatos (fecha, enso, etc.) sean correctos.")
-        return None, None, None, None
+        raise ValueError("Error: No se pudieron identificar las columnas de estación. Verifique que los nombres de las columnas de metadatos (fecha, enso, etc.) sean correctos.")
 
-    df_long = df_precip_raw.melt(id_vars=id_vars, value_vars=station_id_cols, var_name='id_estacion', value_name=Config.PRECIPITATION_COL)
+    # Las fechas se interpretan sobre la tabla ancha (una fila por mes), antes del melt
+    if Config.DATE_COL in df_precip_raw.columns:
+        df_precip_raw[Config.DATE_COL] = parse_spanish_dates(df_precip_raw[Config.DATE_COL])
+
+    # Normalización numérica en bloque sobre la tabla ancha, antes de multiplicar las filas con el melt
+    enso_numeric_cols = [Config.ENSO_ONI_COL, 'temp_sst', 'temp_media', Config.SOI_COL, Config.IOD_COL]
+    normalize_numeric_frame(df_precip_raw, enso_numeric_cols + station_id_cols)
 
-    cols_to_numeric = [Config.ENSO_ONI_COL, 'temp_sst', 'temp_media', Config.PRECIPITATION_COL, Config.SOI_COL, Config.IOD_COL]
-    for col in cols_to_numeric:
-        if col in df_long.columns:
-            df_long[col] = standardize_numeric_column(df_long[col])
+    df_long = df_precip_raw.melt(id_vars=id_vars, value_vars=station_id_cols, var_name='id_estacion', value_name=Config.PRECIPITATION_COL)
 
     df_long.dropna(subset=[Config.PRECIPITATION_COL], inplace=True)
 
-    df_long[Config.DATE_COL] = parse_spanish_dates(df_long[Config.DATE_COL])
     df_long.dropna(subset=[Config.DATE_COL], inplace=True)
 
     df_long[Config.ORIGIN_COL] = 'Original'
     df_long[Config.YEAR_COL] = df_long[Config.DATE_COL].dt.year
     df_long[Config.MONTH_COL] = df_long[Config.DATE_COL].dt.month
 
-    id_estacion_col_name = 'id_estacio'
-    if id_estacion_col_name not in gdf_stations.columns:
-        st.error(f"No se encontró la columna '{id_estacion_col_name}' en el archivo de estaciones.")
-        return None, None, None, None
-
-    gdf_stations[id_estacion_col_name] = gdf_stations[id_estacion_col_name].astype(str).str.strip()
     df_long['id_estacion'] = df_long['id_estacion'].astype(str).str.strip()
 
-    station_mapping = gdf_stations.set_index(id_estacion_col_name)[Config.STATION_NAME_COL].to_dict()
+    station_mapping = gdf_stations.set_index('id_estacio')[Config.STATION_NAME_COL].to_dict()
     df_long[Config.STATION_NAME_COL] = df_long['id_estacion'].map(station_mapping)
     df_long.dropna(subset=[Config.STATION_NAME_COL], inplace=True)
 
-    station_metadata_cols = [
-        Config.STATION_NAME_COL, Config.MUNICIPALITY_COL, Config.REGION_COL,
-        Config.ALTITUDE_COL, Config.CELL_COL, Config.LATITUDE_COL, Config.LONGITUDE_COL, Config.ET_COL
-    ]
-    existing_metadata_cols = [col for col in station_metadata_cols if col in gdf_stations.columns]
-    gdf_metadata_unique = gdf_stations[existing_metadata_cols].drop_duplicates(subset=[Config.STATION_NAME_COL])
-
-    cols_to_drop_from_long = [c for c in existing_metadata_cols if c != Config.STATION_NAME_COL and c in df_long.columns]
+    # Los metadatos de estación no se copian en cada fila mensual: permanecen en gdf_stations
+    # (tabla lateral) y se unen bajo demanda con attach_station_metadata.
+    cols_to_drop_from_long = [c for c in STATION_METADATA_COLS if c in df_long.columns]
     df_long.drop(columns=cols_to_drop_from_long, inplace=True, errors='ignore')
-
-    df_long = pd.merge(df_long, gdf_metadata_unique, on=Config.STATION_NAME_COL, how='left')
+    df_long.reset_index(drop=True, inplace=True)
+    df_long = apply_compact_schema(df_long)
 
     enso_cols = ['id', Config.DATE_COL, Config.ENSO_ONI_COL, 'temp_sst', 'temp_media']
     existing_enso_cols = [col for col in enso_cols if col in df_precip_raw.columns]
@@ -226,43 +351,77 @@ def load_and_process_all_data(uploaded_file_mapa, uploaded_file_precip, uploaded
     if Config.DATE_COL in df_enso.columns:
         df_enso[Config.DATE_COL] = parse_spanish_dates(df_enso[Config.DATE_COL])
         df_enso.dropna(subset=[Config.DATE_COL], inplace=True)
-    
-    for col in [Config.ENSO_ONI_COL, 'temp_sst', 'temp_media']:
-        if col in df_enso.columns:
-            df_enso[col] = standardize_numeric_column(df_enso[col])
-
-    return gdf_stations, gdf_municipios, df_long, df_enso
+    df_enso = apply_compact_schema(df_enso)
+
+    return df_long, df_enso
+
+def _concat_compact(frames):
+    """Concatena DataFrames con esquema compacto conservando las columnas categóricas."""
+    frames = [df for df in frames if df is not None]
+    for col in LONG_CATEGORICAL_COLS:
+        if all(col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype) for df in frames):
+            categories = frames[0][col].cat.categories
+            for df in frames[1:]:
+                categories = categories.union(df[col].cat.categories)
+            frames = [df.assign(**{col: df[col].cat.set_categories(categories)}) for df in frames]
+    return apply_compact_schema(pd.concat(frames, ignore_index=True))
+
+def append_monthly_records(gdf_stations, df_long, df_enso, uploaded_file_delta):
+    """
+    Incorpora un archivo de precipitación con solo los meses nuevos (o corregidos), con el mismo
+    formato que el archivo completo, sin reprocesar el conjunto de datos.
+    Los registros del archivo reemplazan a los existentes para la misma estación y fecha.
+    Devuelve (df_long, df_enso, df_long_delta); df_long queda ordenado por (estación, fecha)
+    y df_long_delta contiene solo las filas incorporadas, lo que permite identificar las
+    estaciones y meses afectados.
+    Lanza ValueError si el archivo no se puede interpretar o no aporta registros.
+    """
+    df_delta_raw = load_csv_data(uploaded_file_delta)
+    if df_delta_raw is None:
+        raise ValueError("No se recibió el archivo con los registros nuevos.")
+    df_long_delta, df_enso_delta = _precipitation_to_long(df_delta_raw, gdf_stations)
+    if df_long_delta.empty:
+        raise ValueError("El archivo no contiene registros de precipitación para estaciones conocidas.")
+
+    # Se descartan solo las filas existentes que el delta reemplaza (misma estación y fecha)
+    delta_keys = pd.MultiIndex.from_arrays([
+        df_long_delta[Config.STATION_NAME_COL].astype(object), df_long_delta[Config.DATE_COL]
+    ])
+    candidates = df_long[Config.DATE_COL].isin(df_long_delta[Config.DATE_COL].unique())
+    existing_keys = pd.MultiIndex.from_arrays([
+        df_long.loc[candidates, Config.STATION_NAME_COL].astype(object), df_long.loc[candidates, Config.DATE_COL]
+    ])
+    replaced = np.zeros(len(df_long), dtype=bool)
+    replaced[np.flatnonzero(candidates.to_numpy())[existing_keys.isin(delta_keys)]] = True
+    df_long_updated = sort_long(_concat_compact([df_long[~replaced], df_long_delta]))
+
+    df_enso_updated = _concat_compact([df_enso, df_enso_delta])
+    if Config.DATE_COL in df_enso_updated.columns:
+        df_enso_updated = df_enso_updated.drop_duplicates(subset=[Config.DATE_COL], keep='last') \
+            .sort_values(Config.DATE_COL).reset_index(drop=True)
+    return df_long_updated, df_enso_updated, df_long_delta
 
 def extract_elevation_from_dem(gdf_stations, dem_data_source):
+    """
+    Asigna a cada estación la elevación del DEM (GeoTIFF subido, ruta local o URL).
+    El muestreo y la caché de elevaciones por DEM y coordenada están en dem_service.
+    Si el DEM no se puede leer lanza ValueError y la altitud original no se modifica.
+    """
     if dem_data_source is None:
         return gdf_stations
-    
-    file_object = dem_data_source
-    if hasattr(dem_data_source, 'name') and dem_data_source.name.lower().endswith('.tif'):
-        try:
-            file_object = io.BytesIO(dem_data_source.getvalue())
-        except:
-            pass
-            
+
     try:
-        with rasterio.open(file_object) as dem:
-            coords = [(point.x, point.y) for point in gdf_stations.geometry]
-            elevations = [val[0] for val in dem.sample(coords)]
-            elevations = np.array(elevations)
-            elevations[elevations < -1000] = np.nan
-            gdf_stations[Config.ALTITUDE_COL] = elevations
-            st.success("Elevación extraída del DEM para todas las estaciones.")
+        elevations = get_elevations(dem_data_source, gdf_stations.geometry.x, gdf_stations.geometry.y)
     except Exception as e:
-        st.error(f"Error al procesar el archivo DEM. Asegúrese de que es un GeoTIFF válido y el CRS coincide: {e}")
-        st.session_state[f'original_{Config.ALTITUDE_COL}'] = st.session_state.get(f'original_{Config.ALTITUDE_COL}', None)
-        if Config.ALTITUDE_COL in gdf_stations.columns and st.session_state[f'original_{Config.ALTITUDE_COL}'] is not None:
-            gdf_stations[Config.ALTITUDE_COL] = st.session_state[f'original_{Config.ALTITUDE_COL}']
-            
+        raise ValueError(f"Error al procesar el archivo DEM. Asegúrese de que es un GeoTIFF válido: {e}") from e
+    gdf_stations[Config.ALTITUDE_COL] = elevations
     return gdf_stations
 
-@st.cache_resource
 def download_and_load_remote_dem(url):
+    """
+    Simulación de descarga remota: en un entorno real se usaría un archivo temporal.
+    Por ahora la URL se devuelve como marcador de la fuente del DEM.
+    """
     if not url:
         raise ValueError("La URL del servidor DEM no está configurada.")
-    st.info(f"Simulación de descarga remota. En un entorno real, se usaría un archivo temporal. Usando '{url}' como marcador.")
     return url
@@ -0,0 +1,168 @@
+# modules/dataset_registry.py
+
+import threading
+import weakref
+from modules.indexing import StationIndex, LongIndex
+from modules.precip_cube import PrecipCube, AnnualCube
+from modules.climatology import Climatology
+from modules.drought_indices import compute_spi, compute_spei, monthly_pet
+
+# Registro de conjuntos de datos compartido por todas las sesiones del proceso.
+# Cada conjunto (estaciones, municipios, df_long, ENSO y las estructuras derivadas: cubos e
+# índices) se guarda una sola vez por clave de contenido (data_cache.compute_dataset_key);
+# las sesiones que cargan los mismos archivos reciben un DatasetHandle hacia la misma copia,
+# y el registro la libera cuando ya ninguna sesión la usa.
+# Los objetos compartidos son de solo lectura: las sesiones filtran con take/select/iloc,
+# que producen copias propias, y nunca deben modificarlos en su lugar.
+# La aplicación obtiene el registro del proceso con streamlit_adapter.shared_dataset_registry.
+
+def _freeze(*arrays):
+    for array in arrays:
+        array.setflags(write=False)
+
+class SharedDataset:
+    """Conjunto de datos cargado e inmutable, con sus cubos e índices ya construidos."""
+
+    def __init__(self, dataset_key, gdf_stations, gdf_municipios, df_long, df_enso, precip_cube=None):
+        self.dataset_key = dataset_key
+        self.gdf_stations = gdf_stations
+        self.gdf_municipios = gdf_municipios
+        self.df_long = df_long
+        self.df_enso = df_enso
+        self.precip_cube = precip_cube if precip_cube is not None else PrecipCube.from_long(df_long)
+        self.annual_cube = AnnualCube.from_precip_cube(self.precip_cube)
+        self.station_index = StationIndex(gdf_stations)
+        self.long_index = LongIndex(df_long)
+        _freeze(self.precip_cube.values, self.annual_cube.sums, self.annual_cube.counts, self.annual_cube.positives)
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def derived(self, name, compute):
+        """Producto de todo el conjunto calculado una sola vez con `compute()` y compartido entre sesiones."""
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = compute()
+            return self._derived[name]
+
+    def completed_cube(self):
+        """Panel estaciones × meses con los huecos interpolados (PrecipCube.fill_gaps)."""
+        def compute():
+            cube = self.precip_cube.fill_gaps()
+            _freeze(cube.values)
+            return cube
+        return self.derived('serie_completada', compute)
+
+    def spi_cube(self):
+        """SPI de toda la red en las escalas de Config.SPI_SCALES (drought_indices.compute_spi)."""
+        def compute():
+            cube = compute_spi(self.precip_cube)
+            _freeze(*cube.values.values())
+            return cube
+        return self.derived('spi', compute)
+
+    def spei_cube(self):
+        """SPEI de toda la red, con la ETP mensual de la tabla de estaciones (drought_indices.monthly_pet)."""
+        def compute():
+            cube = compute_spei(self.precip_cube, monthly_pet(self.gdf_stations, self.precip_cube.stations))
+            _freeze(*cube.values.values())
+            return cube
+        return self.derived('spei', compute)
+
+    def climatology(self):
+        """Climatología estación × mes calendario del conjunto (climatology.Climatology)."""
+        return self.derived('climatologia', lambda: Climatology(self.precip_cube))
+
+    def session_items(self):
+        """Referencias (no copias) que la sesión expone en st.session_state."""
+        return {
+            'gdf_stations': self.gdf_stations, 'gdf_municipios': self.gdf_municipios,
+            'df_long': self.df_long, 'df_enso': self.df_enso,
+            'precip_cube': self.precip_cube, 'annual_cube': self.annual_cube,
+            'station_index': self.station_index, 'long_index': self.long_index,
+            'dataset_key': self.dataset_key
+        }
+
+    def memory_usage(self):
+        """Tamaño aproximado en bytes de las tablas y cubos compartidos."""
+        frames = (self.gdf_stations, self.gdf_municipios, self.df_long, self.df_enso)
+        total = sum(int(df.memory_usage(deep=True).sum()) for df in frames if df is not None)
+        total += self.precip_cube.values.nbytes
+        total += sum(a.nbytes for a in (self.annual_cube.sums, self.annual_cube.counts, self.annual_cube.positives))
+        for product in list(self._derived.values()):
+            values = getattr(product, 'values', None)
+            arrays = values.values() if isinstance(values, dict) else [values] if values is not None else []
+            total += sum(array.nbytes for array in arrays)
+        return total
+
+class DatasetHandle:
+    """
+    Referencia de una sesión a un conjunto del registro. `release()` devuelve la referencia;
+    si la sesión se descarta sin liberarla, se devuelve cuando el handle se recolecta.
+    """
+
+    def __init__(self, registry, dataset):
+        self.dataset = dataset
+        self.dataset_key = dataset.dataset_key
+        self._finalizer = weakref.finalize(self, registry._release, dataset.dataset_key)
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+    def release(self):
+        self._finalizer() # Solo libera la primera vez
+
+class DatasetRegistry:
+    """Conjuntos de datos compartidos por clave de contenido, con conteo de referencias."""
+
+    def __init__(self):
+        self._datasets = {}
+        self._refs = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def __contains__(self, dataset_key):
+        return dataset_key in self._datasets
+
+    def acquire(self, dataset_key, load):
+        """
+        Handle hacia el conjunto `dataset_key`. Si no está registrado se construye con `load()`,
+        que debe devolver un SharedDataset; las sesiones que piden la misma clave mientras se
+        carga esperan a esa carga en lugar de repetirla. Los errores de `load` se propagan.
+        """
+        with self._lock:
+            key_lock = self._loading.setdefault(dataset_key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                dataset = self._datasets.get(dataset_key)
+                if dataset is not None:
+                    self._refs[dataset_key] += 1
+                    return DatasetHandle(self, dataset)
+            dataset = load()
+            with self._lock:
+                self._datasets[dataset_key] = dataset
+                self._refs[dataset_key] = 1
+                self._loading.pop(dataset_key, None)
+                return DatasetHandle(self, dataset)
+
+    def _release(self, dataset_key):
+        with self._lock:
+            if dataset_key not in self._refs:
+                return
+            self._refs[dataset_key] -= 1
+            if self._refs[dataset_key] <= 0:
+                del self._refs[dataset_key]
+                del self._datasets[dataset_key]
+
+    def references(self, dataset_key):
+        return self._refs.get(dataset_key, 0)
+
+    def summary(self):
+        """Lista de (clave, sesiones que lo usan, bytes aproximados) de los conjuntos registrados."""
+        with self._lock:
+            datasets = list(self._datasets.items())
+            refs = dict(self._refs)
+        return [(key, refs.get(key, 0), dataset.memory_usage()) for key, dataset in datasets]
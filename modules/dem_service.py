@@ -0,0 +1,143 @@
+# modules/dem_service.py
+
+import os
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from modules.config import Config
+from modules.data_cache import (
+    compute_dataset_key, load_cached_frame, save_frame_to_cache, load_cached_array, save_array_to_cache
+)
+from modules.lazy_import import lazy_import, lazy_callable
+
+# rasterio (GDAL) se importa la primera vez que se abre un DEM
+rasterio = lazy_import('rasterio')
+rasterio_enums = lazy_import('rasterio.enums')
+Window = lazy_callable('rasterio.windows', 'Window')
+warp_transform = lazy_callable('rasterio.warp', 'transform')
+reproject = lazy_callable('rasterio.warp', 'reproject')
+from_origin = lazy_callable('rasterio.transform', 'from_origin')
+
+# Valores por debajo de este umbral se consideran sin dato (p. ej. -32768 en SRTM)
+MIN_VALID_ELEVATION = -1000
+# Precisión (decimales) con la que se comparan las coordenadas en la caché de elevaciones
+COORD_DECIMALS = 7
+
+def compute_dem_key(dem_source):
+    """
+    Clave del DEM para la caché de elevaciones. Para archivos subidos se usa el hash del
+    contenido; para rutas locales, la ruta, el tamaño y la fecha de modificación (sin leer
+    el archivo completo); para URLs, la URL.
+    """
+    if hasattr(dem_source, 'getvalue') or hasattr(dem_source, 'read'):
+        return compute_dataset_key(dem_source)
+    source = str(dem_source)
+    if os.path.exists(source):
+        stat = os.stat(source)
+        source = f"{os.path.abspath(source)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(f"v{Config.DATA_CACHE_VERSION}|{source}".encode()).hexdigest()[:32]
+
+@contextmanager
+def open_dem(dem_source):
+    """
+    Abre el DEM sin copiarlo: las rutas locales (incluidos COG) se abren directamente con
+    lectura por memory mapping cuando GDAL lo permite, y los archivos subidos se leen desde
+    un MemoryFile sobre sus bytes. Uso: `with open_dem(src) as dem:`.
+    """
+    if hasattr(dem_source, 'getvalue'):
+        with rasterio.MemoryFile(dem_source.getvalue()) as memfile, memfile.open() as dem:
+            yield dem
+    else:
+        with rasterio.Env(GTIFF_VIRTUAL_MEM_IO='IF_ENOUGH_RAM'), rasterio.open(dem_source) as dem:
+            yield dem
+
+def sample_dem(dem, lons, lats):
+    """
+    Muestrea la primera banda del DEM en los puntos (lon, lat) en EPSG:4326 con una sola
+    lectura de la ventana que los contiene. Los puntos se reproyectan si el CRS del DEM es
+    distinto. Devuelve un arreglo float64 con NaN fuera del raster o sin dato.
+    """
+    lons, lats = np.asarray(lons, dtype='float64'), np.asarray(lats, dtype='float64')
+    elevations = np.full(len(lons), np.nan)
+    if len(lons) == 0:
+        return elevations
+    xs, ys = lons, lats
+    if dem.crs is not None and dem.crs.to_epsg() != 4326:
+        xs, ys = map(np.asarray, warp_transform('EPSG:4326', dem.crs, lons, lats))
+    finite = np.isfinite(xs) & np.isfinite(ys)
+    rows = np.full(len(xs), -1)
+    cols = np.full(len(xs), -1)
+    if finite.any():
+        rows[finite], cols[finite] = rasterio.transform.rowcol(dem.transform, xs[finite], ys[finite])
+    inside = (rows >= 0) & (rows < dem.height) & (cols >= 0) & (cols < dem.width)
+    if not inside.any():
+        return elevations
+
+    row_off, col_off = rows[inside].min(), cols[inside].min()
+    window = Window(col_off, row_off, cols[inside].max() - col_off + 1, rows[inside].max() - row_off + 1)
+    block = dem.read(1, window=window, masked=True)
+    values = block[rows[inside] - row_off, cols[inside] - col_off]
+    values = np.ma.filled(values.astype('float64'), np.nan)
+    values[values < MIN_VALID_ELEVATION] = np.nan
+    elevations[inside] = values
+    return elevations
+
+def get_elevations(dem_source, lons, lats):
+    """
+    Elevación del DEM en cada punto (lon, lat), usando la caché persistente
+    (hash del DEM, lon, lat) -> elevación. Solo se muestrean los puntos que no estén
+    en la caché, de modo que volver a seleccionar el mismo DEM no lee el raster.
+    """
+    dem_key = compute_dem_key(dem_source)
+    points = pd.DataFrame({
+        'lon': np.round(np.asarray(lons, dtype='float64'), COORD_DECIMALS),
+        'lat': np.round(np.asarray(lats, dtype='float64'), COORD_DECIMALS),
+    })
+    cached = load_cached_frame('elevations', dem_key)
+    if cached is None:
+        cached = pd.DataFrame({'lon': [], 'lat': [], 'elevation': []})
+    merged = points.merge(cached, on=['lon', 'lat'], how='left', indicator=True)
+    missing = (merged['_merge'] == 'left_only').to_numpy()
+
+    if missing.any():
+        new_points = points[missing].drop_duplicates()
+        with open_dem(dem_source) as dem:
+            new_points = new_points.assign(elevation=sample_dem(dem, new_points['lon'], new_points['lat']))
+        cached = pd.concat([cached, new_points], ignore_index=True)
+        save_frame_to_cache('elevations', dem_key, cached)
+        merged = points.merge(cached, on=['lon', 'lat'], how='left')
+    return merged['elevation'].to_numpy(dtype='float64')
+
+def get_covariate_grid(dem_source, grid_lon, grid_lat):
+    """
+    Remuestrea el DEM sobre la grilla regular de interpolación (centros en grid_lon × grid_lat,
+    EPSG:4326) promediando los píxeles que caen en cada celda. Devuelve un arreglo
+    (len(grid_lat), len(grid_lon)) con la latitud en orden ascendente, como np.meshgrid.
+    La grilla se guarda en caché por (DEM, límites, resolución): sirve como deriva externa
+    del KED para cualquier año sin volver a leer el raster.
+    """
+    grid_lon, grid_lat = np.asarray(grid_lon, dtype='float64'), np.asarray(grid_lat, dtype='float64')
+    signature = (
+        compute_dem_key(dem_source), np.round([grid_lon[0], grid_lon[-1], grid_lat[0], grid_lat[-1]], COORD_DECIMALS).tolist(),
+        len(grid_lon), len(grid_lat)
+    )
+    grid_key = hashlib.sha256(repr(signature).encode()).hexdigest()[:32]
+    cached = load_cached_array('covariates', grid_key)
+    if cached is not None:
+        return np.asarray(cached)
+
+    dx = (grid_lon[-1] - grid_lon[0]) / max(len(grid_lon) - 1, 1)
+    dy = (grid_lat[-1] - grid_lat[0]) / max(len(grid_lat) - 1, 1)
+    dst_transform = from_origin(grid_lon[0] - dx / 2, grid_lat[-1] + dy / 2, dx, dy)
+    grid = np.full((len(grid_lat), len(grid_lon)), np.nan, dtype='float32')
+    with open_dem(dem_source) as dem:
+        reproject(
+            source=rasterio.band(dem, 1), destination=grid,
+            src_nodata=dem.nodata, dst_transform=dst_transform, dst_crs='EPSG:4326',
+            dst_nodata=np.nan, resampling=rasterio_enums.Resampling.average
+        )
+    grid[grid < MIN_VALID_ELEVATION] = np.nan
+    grid = np.flipud(grid).astype('float64') # Filas de norte a sur -> latitud ascendente
+    save_array_to_cache('covariates', grid_key, grid)
+    return grid
@@ -0,0 +1,230 @@
+# modules/drought_indices.py
+
+import numpy as np
+import pandas as pd
+from modules.config import Config
+from modules.lazy_import import lazy_import
+
+# scipy.special (gamma, gammainc, ndtri) se importa en el primer cálculo
+special = lazy_import('scipy.special')
+
+# Índices de sequía estandarizados calculados para toda la red a la vez, sobre el arreglo
+# estaciones × meses de un PrecipCube: sumas móviles por escala, ajuste de la distribución por
+# estación y mes calendario (vectorizado sobre las estaciones) y transformación a la normal
+# estándar. El resultado es un IndexCube con los mismos ejes que el cubo de precipitación.
+
+# --- Sumas móviles ---
+def rolling_sums(values, scale, non_negative=False):
+    """
+    Sumas móviles de `scale` meses sobre el eje de meses de un arreglo (estaciones × meses).
+    La suma es NaN si falta algún mes de la ventana o si la ventana no está completa.
+    Con non_negative=True (precipitación, nunca negativa) las ventanas sin ningún valor
+    positivo valen exactamente 0; no debe usarse con datos con signo como el balance hídrico.
+    """
+    n_stations, n_months = values.shape
+    result = np.full((n_stations, n_months), np.nan)
+    if scale < 1 or scale > n_months:
+        return result
+    missing = np.isnan(values)
+    zeros = np.zeros((n_stations, 1))
+    total = np.concatenate([zeros, np.cumsum(np.where(missing, 0.0, values), axis=1, dtype='float64')], axis=1)
+    n_missing = np.concatenate([zeros, np.cumsum(missing, axis=1)], axis=1)
+
+    window_total = total[:, scale:] - total[:, :-scale]
+    if non_negative:
+        n_positive = np.concatenate([zeros, np.cumsum(values > 0, axis=1)], axis=1)
+        window_total[(n_positive[:, scale:] - n_positive[:, :-scale]) == 0] = 0.0 # Evita residuos de redondeo
+    complete = (n_missing[:, scale:] - n_missing[:, :-scale]) == 0
+    result[:, scale - 1:] = np.where(complete, window_total, np.nan)
+    return result
+
+# --- SPI: gamma mixta (probabilidad de cero + gamma sobre los valores positivos) ---
+def fit_gamma_mixture(sums, min_values=Config.SPI_MIN_FIT_VALUES):
+    """
+    Ajuste por estación y mes calendario de una gamma mixta a las sumas móviles (estaciones × meses).
+    `q` es la proporción de sumas iguales a cero; la gamma de los valores positivos se estima
+    con el estimador de Thom (aproximación de máxima verosimilitud en forma cerrada):
+        A = ln(media) - media(ln x),  alpha = (1 + sqrt(1 + 4A/3)) / (4A),  beta = media / alpha
+    Devuelve (alpha, beta, q), cada uno de forma (estaciones × 12); NaN donde hay menos de
+    `min_values` sumas positivas o todas son iguales.
+    """
+    by_month = sums.reshape(sums.shape[0], -1, 12)
+    valid = ~np.isnan(by_month)
+    positive = valid & (by_month > 0)
+    n_valid, n_positive = valid.sum(axis=1), positive.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        q = np.where(n_valid > 0, (n_valid - n_positive) / n_valid, np.nan)
+        mean = np.where(positive, by_month, 0.0).sum(axis=1) / n_positive
+        mean_log = np.where(positive, np.log(np.where(positive, by_month, 1.0)), 0.0).sum(axis=1) / n_positive
+        a = np.log(mean) - mean_log
+        alpha = (1 + np.sqrt(1 + 4 * a / 3)) / (4 * a)
+        beta = mean / alpha
+
+    fitted = (n_positive >= min_values) & (a > 1e-12)
+    return np.where(fitted, alpha, np.nan), np.where(fitted, beta, np.nan), np.where(fitted, q, np.nan)
+
+def _gamma_mixture_cdf(sums, alpha, beta, q):
+    """Probabilidad acumulada de la gamma mixta, con los parámetros de cada mes calendario."""
+    calendar_month = np.arange(sums.shape[1]) % 12
+    alpha, beta, q = alpha[:, calendar_month], beta[:, calendar_month], q[:, calendar_month]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return q + (1 - q) * special.gammainc(alpha, np.maximum(sums, 0) / beta)
+
+def _to_normal(cdf):
+    """Cuantil normal estándar de una probabilidad; los extremos (±inf) quedan como NaN."""
+    index = special.ndtri(cdf)
+    index[~np.isfinite(index)] = np.nan
+    return index.astype('float32')
+
+def compute_spi(precip_cube, scales=Config.SPI_SCALES, min_values=Config.SPI_MIN_FIT_VALUES):
+    """
+    SPI de todas las estaciones del cubo para cada escala (meses). Para cada escala: sumas móviles,
+    ajuste gamma mixto por estación y mes calendario, y transformación a la normal estándar.
+    Devuelve un IndexCube con los parámetros ajustados en `parameters[escala]` = (alpha, beta, q).
+    """
+    values, parameters = {}, {}
+    for scale in scales:
+        sums = rolling_sums(precip_cube.values, int(scale), non_negative=True)
+        alpha, beta, q = fit_gamma_mixture(sums, min_values)
+        values[int(scale)] = _to_normal(_gamma_mixture_cdf(sums, alpha, beta, q))
+        parameters[int(scale)] = (alpha, beta, q)
+    return IndexCube('SPI', values, precip_cube.stations, precip_cube.first_year, parameters)
+
+# --- SPEI: log-logística de 3 parámetros ajustada por L-momentos ---
+def monthly_pet(gdf_stations, stations):
+    """
+    ETP mensual (mm/mes) por estación, alineada con `stations`: la columna Config.ET_COL es la
+    evapotranspiración anual (mm/año), que se reparte por igual entre los 12 meses. NaN si falta.
+    """
+    if Config.ET_COL not in gdf_stations.columns:
+        return np.full(len(stations), np.nan)
+    annual = pd.to_numeric(gdf_stations[Config.ET_COL], errors='coerce')
+    annual = annual.groupby(gdf_stations[Config.STATION_NAME_COL].astype(object)).first()
+    return annual.reindex(pd.Index(stations).astype(object)).to_numpy(dtype='float64') / 12
+
+def fit_loglogistic(sums, min_values=Config.SPI_MIN_FIT_VALUES):
+    """
+    Ajuste por estación y mes calendario de una log-logística de 3 parámetros a las sumas móviles
+    del balance hídrico (estaciones × meses), con los momentos ponderados por probabilidad
+    (Vicente-Serrano et al., 2010), en forma cerrada y para todas las estaciones a la vez:
+        w_s = media((1 - F_i)^s · x_(i)),  F_i = (i - 0.35) / n
+        beta = (2w1 - w0) / (6w1 - w0 - 6w2)
+        alpha = (w0 - 2w1) · beta / (Γ(1 + 1/beta) · Γ(1 - 1/beta)),  gamma = w0 - alpha · Γ(1 + 1/beta) · Γ(1 - 1/beta)
+    Devuelve (alpha, beta, gamma) de forma (estaciones × 12); NaN con menos de `min_values`
+    sumas o si el ajuste no es válido (beta <= 1).
+    """
+    by_month = np.sort(sums.reshape(sums.shape[0], -1, 12), axis=1) # NaN al final de cada columna
+    n_valid = (~np.isnan(by_month)).sum(axis=1)
+    rank = np.arange(1, by_month.shape[1] + 1)[None, :, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        survival = 1 - (rank - 0.35) / n_valid[:, None, :]
+        x = np.where(rank <= n_valid[:, None, :], by_month, 0.0)
+        w0, w1, w2 = (np.where(np.isnan(by_month), 0.0, x * survival ** k).sum(axis=1) / n_valid for k in range(3))
+        beta = (2 * w1 - w0) / (6 * w1 - w0 - 6 * w2)
+        gamma_product = special.gamma(1 + 1 / beta) * special.gamma(1 - 1 / beta)
+        alpha = (w0 - 2 * w1) * beta / gamma_product
+        location = w0 - alpha * gamma_product
+
+    fitted = (n_valid >= min_values) & (beta > 1) & (alpha > 0) & np.isfinite(location)
+    return tuple(np.where(fitted, parameter, np.nan) for parameter in (alpha, beta, location))
+
+def _loglogistic_cdf(sums, alpha, beta, location):
+    """Probabilidad acumulada de la log-logística, con los parámetros de cada mes calendario."""
+    calendar_month = np.arange(sums.shape[1]) % 12
+    alpha, beta, location = alpha[:, calendar_month], beta[:, calendar_month], location[:, calendar_month]
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        shifted = sums - location
+        cdf = 1 / (1 + (alpha / np.where(shifted > 0, shifted, np.nan)) ** beta)
+    return np.where(shifted <= 0, 0.0, cdf) # Por debajo del límite inferior de la distribución
+
+def compute_spei(precip_cube, pet, scales=Config.SPI_SCALES, min_values=Config.SPI_MIN_FIT_VALUES):
+    """
+    SPEI de todas las estaciones del cubo para cada escala (meses). `pet` es la ETP mensual (mm/mes):
+    un arreglo (estaciones × meses) con los ejes del cubo o un valor por estación (ver monthly_pet).
+    El balance hídrico P - ETP se calcula sobre el arreglo completo; para cada escala se toman
+    sumas móviles, se ajusta la log-logística por L-momentos y se transforma a la normal estándar.
+    Devuelve un IndexCube con `parameters[escala]` = (alpha, beta, gamma).
+    """
+    pet = np.asarray(pet, dtype='float64')
+    balance = precip_cube.values.astype('float64') - (pet[:, None] if pet.ndim == 1 else pet)
+    values, parameters = {}, {}
+    for scale in scales:
+        sums = rolling_sums(balance, int(scale))
+        alpha, beta, location = fit_loglogistic(sums, min_values)
+        values[int(scale)] = _to_normal(_loglogistic_cdf(sums, alpha, beta, location))
+        parameters[int(scale)] = (alpha, beta, location)
+    return IndexCube('SPEI', values, precip_cube.stations, precip_cube.first_year, parameters)
+
+class IndexCube:
+    """
+    Índice estandarizado (SPI, SPEI) por escala: un arreglo (estaciones × meses) por escala,
+    con los mismos ejes que el PrecipCube del que se calculó (años calendario completos).
+    """
+
+    def __init__(self, name, values, stations, first_year, parameters=None):
+        self.name = name
+        self.values = values
+        self.stations = pd.Index(stations, name=Config.STATION_NAME_COL)
+        self.first_year = int(first_year)
+        self.parameters = parameters or {}
+
+    @property
+    def scales(self):
+        return sorted(self.values)
+
+    @property
+    def n_months(self):
+        return next(iter(self.values.values())).shape[1] if self.values else 0
+
+    @property
+    def months(self):
+        return pd.date_range(f"{self.first_year}-01-01", periods=self.n_months, freq='MS', name=Config.DATE_COL)
+
+    # --- Consultas ---
+    def series(self, station, scale):
+        """Serie del índice de una estación y escala, sin los NaN iniciales y finales (vacía si no existe)."""
+        scale = int(scale)
+        if scale not in self.values or station not in self.stations:
+            return pd.Series(dtype=float)
+        series = pd.Series(self.values[scale][self.stations.get_loc(station)].astype('float64'), index=self.months)
+        first, last = series.first_valid_index(), series.last_valid_index()
+        return series.loc[first:last] if first is not None else pd.Series(dtype=float)
+
+    def select(self, stations=None, year_range=None):
+        """Subconjunto por estaciones y rango de años (inclusive)."""
+        positions = np.arange(len(self.stations))
+        if stations is not None:
+            positions = self.stations.get_indexer(pd.Index(stations))
+            positions = np.sort(positions[positions >= 0])
+        start, end, first_year = 0, self.n_months, self.first_year
+        if year_range is not None and self.n_months:
+            first_year = max(int(year_range[0]), self.first_year)
+            start = (first_year - self.first_year) * 12
+            end = max(start, min(self.n_months, (int(year_range[1]) - self.first_year + 1) * 12))
+        values = {scale: array[positions, start:end] for scale, array in self.values.items()}
+        return IndexCube(self.name, values, self.stations[positions], first_year, self.parameters)
+
+    def drought_fraction(self, scale, threshold=-1.0):
+        """Fracción mensual de las estaciones con dato cuyo índice es <= threshold (monitoreo regional)."""
+        array = self.values[int(scale)]
+        n_valid = (~np.isnan(array)).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(n_valid > 0, (array <= threshold).sum(axis=0) / n_valid, np.nan)
+        return pd.Series(fraction, index=self.months, name=f"fraccion_{self.name.lower()}")
+
+    def to_long(self, dropna=True):
+        """Formato largo: estación, fecha, escala y valor del índice (columna con el nombre del índice)."""
+        column = self.name.lower()
+        frames = []
+        for scale in self.scales:
+            array = self.values[scale]
+            frame = pd.DataFrame({
+                Config.STATION_NAME_COL: np.repeat(self.stations.to_numpy(), array.shape[1]),
+                Config.DATE_COL: np.tile(self.months.to_numpy(), array.shape[0]),
+                'escala': scale, column: array.ravel().astype('float64'),
+            })
+            frames.append(frame.dropna(subset=[column]) if dropna else frame)
+        if not frames:
+            return pd.DataFrame(columns=[Config.STATION_NAME_COL, Config.DATE_COL, 'escala', column])
+        return pd.concat(frames, ignore_index=True)
@@ -1,10 +1,7 @@
 # modules/forecast_api.py
 
 import streamlit as st
-import openmeteo_requests
-import requests_cache
 import pandas as pd
-from retry_requests import retry
 
 @st.cache_data(ttl=3600) # Guardar en caché por 1 hora
 def get_weather_forecast(latitude, longitude):
@@ -12,6 +9,11 @@ def get_weather_forecast(latitude, longitude):
     Obtiene el pronóstico del tiempo para 7 días desde la API de Open-Meteo.
     """
     try:
+        # Cliente de Open-Meteo: se importa solo cuando se consulta el pronóstico
+        import openmeteo_requests
+        import requests_cache
+        from retry_requests import retry
+
         # Configuración para reintentos y caché
         cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
         retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
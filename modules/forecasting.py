@@ -1,16 +1,21 @@
-import pmdarima as pm
-import streamlit as st
 import pandas as pd
-from statsmodels.tsa.seasonal import seasonal_decompose
-from statsmodels.tsa.stattools import pacf, acf
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from prophet import Prophet
 import plotly.graph_objects as go
-from sklearn.metrics import mean_squared_error, mean_absolute_error
 import numpy as np
 from modules.config import Config
-
-@st.cache_data(show_spinner=False)
+from modules.compute_cache import cached
+from modules.lazy_import import lazy_import, lazy_callable
+
+# Librerías de modelado: se importan al generar el primer pronóstico, no al arrancar la aplicación
+pm = lazy_import('pmdarima')
+seasonal_decompose = lazy_callable('statsmodels.tsa.seasonal', 'seasonal_decompose')
+pacf = lazy_callable('statsmodels.tsa.stattools', 'pacf')
+acf = lazy_callable('statsmodels.tsa.stattools', 'acf')
+SARIMAX = lazy_callable('statsmodels.tsa.statespace.sarimax', 'SARIMAX')
+Prophet = lazy_callable('prophet', 'Prophet')
+mean_squared_error = lazy_callable('sklearn.metrics', 'mean_squared_error')
+mean_absolute_error = lazy_callable('sklearn.metrics', 'mean_absolute_error')
+
+@cached
 def get_decomposition_results(series, period=12, model='additive'):
     """Realiza la descomposición de la serie de tiempo."""
     series_clean = series.asfreq('MS').interpolate(method='time').dropna()
@@ -58,12 +63,16 @@ def evaluate_forecast(y_true, y_pred):
     mae = mean_absolute_error(y_true, y_pred)
     return {'RMSE': rmse, 'MAE': mae}
 
+def prepare_monthly_series(ts_data_raw):
+    """Serie mensual regular (inicio de mes) de una estación, con los vacíos interpolados en el tiempo."""
+    ts_data = ts_data_raw[[Config.DATE_COL, Config.PRECIPITATION_COL]].copy()
+    ts_data = ts_data.set_index(Config.DATE_COL).sort_index()
+    return ts_data[Config.PRECIPITATION_COL].asfreq('MS').interpolate(method='time').dropna()
+
 # --- INICIO DE LA CORRECCIÓN ---
 def generate_sarima_forecast(ts_data_raw, order, seasonal_order, horizon, test_size=12, regressors=None):
     """Entrena, evalúa y genera un pronóstico con SARIMAX, incluyendo regresores opcionales."""
-    ts_data = ts_data_raw[[Config.DATE_COL, Config.PRECIPITATION_COL]].copy()
-    ts_data = ts_data.set_index(Config.DATE_COL).sort_index()
-    ts = ts_data[Config.PRECIPITATION_COL].asfreq('MS').interpolate(method='time').dropna()
+    ts = prepare_monthly_series(ts_data_raw)
 
     if len(ts) < test_size + 24:
         raise ValueError(f"Se necesitan al menos {test_size + 24} meses de datos para el pronóstico y la evaluación.")
@@ -150,7 +159,7 @@ def generate_prophet_forecast(ts_data_raw, horizon, test_size=12, regressors=Non
     forecast = full_model.predict(future)
     return full_model, forecast, metrics
 
-@st.cache_data(show_spinner=False)
+@cached
 def auto_arima_search(ts_data, test_size):
     """Encuentra los parámetros óptimos para un modelo SARIMA usando auto_arima."""
     ts_data_copy = ts_data.copy()
@@ -1,59 +1,151 @@
 # modules/github_loader.py
 
 import streamlit as st
-import pandas as pd
-import geopandas as gpd
 import requests
+import hashlib
+import json
+import os
 import io
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from modules.config import Config
 
-@st.cache_data(ttl=3600)
-def load_csv_from_url(url):
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
     """
-    Carga un archivo CSV desde una URL a un DataFrame de Pandas,
-    probando varias codificaciones comunes para evitar errores.
+    Sesión HTTP compartida (pool de conexiones con reintentos) para todas las descargas,
+    de modo que las conexiones al mismo servidor se reutilizan entre archivos y recargas.
     """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retries = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=('GET',))
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+# --- CACHÉ EN DISCO CON REVALIDACIÓN CONDICIONAL ---
+def _cache_paths(url, cache_dir):
+    name = hashlib.sha256(url.encode()).hexdigest()[:32]
+    return os.path.join(cache_dir, f"{name}.bin"), os.path.join(cache_dir, f"{name}.json")
+
+def _read_cached(url, cache_dir):
+    """Devuelve (contenido, metadatos) de la copia local de la URL, o (None, {}) si no existe."""
+    data_path, meta_path = _cache_paths(url, cache_dir)
     try:
-        # 1. Descargamos el contenido del archivo una sola vez
-        response = requests.get(url)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(data_path, 'rb') as f:
+            return f.read(), meta
+    except (OSError, ValueError):
+        return None, {}
+
+def _write_cached(url, cache_dir, content, response):
+    """Guarda el contenido y los validadores (ETag / Last-Modified) de forma atómica."""
+    data_path, meta_path = _cache_paths(url, cache_dir)
+    meta = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for path, payload, mode in ((data_path, content, 'wb'), (meta_path, json.dumps(meta), 'w')):
+            fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-')
+            with os.fdopen(fd, mode) as f:
+                f.write(payload)
+            os.replace(temp_path, path)
+    except OSError:
+        pass # La caché es una optimización: si no se puede escribir, se sigue sin ella
+
+def fetch_url(url, session=None, cache_dir=None, timeout=None):
+    """
+    Descarga una URL usando la copia en disco cuando el servidor indica que no cambió
+    (304 ante If-None-Match / If-Modified-Since). Si el servidor no responde o devuelve
+    un error y existe copia local, se usa esa copia.
+    Devuelve (contenido_en_bytes, origen) con origen en {'red', 'sin cambios', 'copia local'}.
+    Lanza requests.RequestException si no hay red ni copia local.
+    """
+    session = session or get_http_session()
+    cache_dir = cache_dir or Config.HTTP_CACHE_DIR
+    timeout = timeout or Config.HTTP_TIMEOUT
+    cached_content, meta = _read_cached(url, cache_dir)
+
+    headers = {}
+    if cached_content is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached_content is not None:
+            return cached_content, 'sin cambios'
         response.raise_for_status()
-        content_bytes = response.content
-
-        # 2. Lista de codificaciones a probar (latin1 suele funcionar para español)
-        encodings_to_try = ['utf-8', 'latin1', 'cp1252']
-        df = None
-        
-        # 3. Bucle para encontrar la codificación correcta
-        for encoding in encodings_to_try:
-            try:
-                # Usamos io.BytesIO para tratar los bytes como un archivo en memoria
-                df = pd.read_csv(io.BytesIO(content_bytes), sep=";", encoding=encoding)
-                # Si la lectura es exitosa, rompemos el bucle
-                break
-            except UnicodeDecodeError:
-                # Si esta codificación falla, probamos con la siguiente
-                continue
-        
-        # Si después de probar todas, ninguna funcionó
-        if df is None:
-            st.error(f"No se pudo decodificar el archivo CSV desde {url} con las codificaciones probadas.")
-            return None
-
-        # 4. Convertimos el DataFrame limpio de vuelta a un objeto de bytes en memoria
-        #    para mantener la compatibilidad con el resto de la aplicación.
-        output_csv_bytes = df.to_csv(index=False, sep=';').encode('utf-8')
-        return io.BytesIO(output_csv_bytes)
-
-    except Exception as e:
-        st.error(f"Error al cargar el archivo CSV desde la URL: {url}\nError: {e}")
-        return None
-
-@st.cache_data(ttl=3600)
+    except requests.RequestException:
+        if cached_content is not None:
+            return cached_content, 'copia local'
+        raise
+    _write_cached(url, cache_dir, response.content, response)
+    return response.content, 'red'
+
+def fetch_urls(urls, session=None, cache_dir=None, timeout=None):
+    """
+    Descarga varias URLs en paralelo con la misma sesión.
+    Devuelve un diccionario url -> (contenido, origen) o url -> excepción si falló.
+    """
+    session = session or get_http_session()
+
+    def fetch(url):
+        try:
+            return fetch_url(url, session=session, cache_dir=cache_dir, timeout=timeout)
+        except requests.RequestException as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, len(urls))) as executor:
+        return dict(zip(urls, executor.map(fetch, urls)))
+
+def load_github_dataset(urls=None, session=None, cache_dir=None):
+    """
+    Descarga en paralelo los tres archivos base (estaciones, precipitación, shapefile).
+    Devuelve un diccionario {'mapa', 'precip', 'shape'} con objetos BytesIO, o None para
+    los archivos que no se pudieron obtener. Los mensajes se muestran en el hilo principal.
+    """
+    urls = urls or {
+        'mapa': Config.URL_ESTACIONES_CSV,
+        'precip': Config.URL_PRECIPITACION_CSV,
+        'shape': Config.URL_SHAPEFILE_ZIP,
+    }
+    results = fetch_urls(list(urls.values()), session=session, cache_dir=cache_dir)
+    files = {}
+    for name, url in urls.items():
+        result = results[url]
+        if isinstance(result, Exception):
+            st.error(f"Error al descargar el archivo desde la URL: {url}\nError: {result}")
+            files[name] = None
+            continue
+        content, origin = result
+        if origin == 'copia local':
+            st.warning(f"No se pudo contactar el servidor; se usa la copia local de: {url}")
+        files[name] = io.BytesIO(content)
+    return files
+
+def load_csv_from_url(url):
+    """
+    Descarga un archivo CSV desde una URL y lo retorna como un objeto de bytes en memoria.
+    El contenido se entrega sin modificar: la detección de codificación y delimitador y el
+    único parseo del archivo ocurren en data_processor.load_csv_data.
+    """
+    return load_github_dataset({'csv': url})['csv']
+
 def load_zip_from_url(url):
     """Descarga un archivo ZIP (shapefile) desde una URL y lo retorna como un objeto de bytes en memoria."""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Lanza un error si la descarga falla
-        return io.BytesIO(response.content)
-    except Exception as e:
-        st.error(f"Error al descargar el archivo ZIP desde la URL: {url}\nError: {e}")
-        return None
+    return load_github_dataset({'zip': url})['zip']
@@ -0,0 +1,169 @@
+# modules/indexing.py
+
+import numpy as np
+import pandas as pd
+from modules.config import Config
+
+# Rangos de altitud del filtro de estaciones: etiqueta -> límite superior (inclusive).
+# El primer rango incluye el 0; '>3000' no tiene límite superior.
+ALTITUDE_BANDS = {'0-500': 500, '500-1000': 1000, '1000-2000': 2000, '2000-3000': 3000, '>3000': np.inf}
+# Columnas categóricas filtrables, con pertenencia precalculada como bitsets
+FILTER_COLUMNS = [Config.REGION_COL, Config.MUNICIPALITY_COL, Config.CELL_COL]
+
+def _bitset(mask):
+    return np.packbits(mask)
+
+class StationIndex:
+    """
+    Índice de la tabla de estaciones para los filtros del panel lateral, construido una sola
+    vez al cargar los datos. Guarda las columnas numéricas ya convertidas (% de datos, altitud),
+    el código de rango de altitud de cada estación y, para región, municipio y celda, los
+    códigos categóricos y un bitset de pertenencia por valor (np.packbits sobre las estaciones).
+    Filtrar es intersecar bitsets; la tabla solo se recorta al final, con `select`.
+    """
+
+    def __init__(self, gdf_stations):
+        frame = gdf_stations.reset_index(drop=True)
+        n = len(frame)
+        self.n_stations = n
+
+        percentages = np.zeros(n)
+        if Config.PERCENTAGE_COL in frame.columns:
+            percentages = pd.to_numeric(
+                frame[Config.PERCENTAGE_COL].astype(str).str.replace(',', '.', regex=False), errors='coerce'
+            ).fillna(0).to_numpy(dtype='float64')
+            frame = frame.assign(**{Config.PERCENTAGE_COL: percentages})
+        self.percentages = percentages
+        # La tabla que se entrega a las pestañas ya trae el % de datos numérico
+        self.frame = frame
+
+        altitudes = np.full(n, np.nan)
+        if Config.ALTITUDE_COL in frame.columns:
+            altitudes = pd.to_numeric(frame[Config.ALTITUDE_COL], errors='coerce').to_numpy(dtype='float64')
+        upper_bounds = np.array(list(ALTITUDE_BANDS.values())[:-1])
+        band_codes = np.digitize(altitudes, upper_bounds, right=True).astype('int8')
+        band_codes[np.isnan(altitudes) | (altitudes < 0)] = -1
+        self.altitude_codes = band_codes
+        self._altitude_bits = {label: _bitset(band_codes == code) for code, label in enumerate(ALTITUDE_BANDS)}
+
+        self._codes, self._categories, self._bits = {}, {}, {}
+        for column in FILTER_COLUMNS:
+            if column not in frame.columns:
+                continue
+            codes, categories = pd.factorize(frame[column], sort=True)
+            self._codes[column] = codes
+            self._categories[column] = categories
+            membership = np.zeros((len(categories), n), dtype=bool)
+            membership[codes[codes >= 0], np.flatnonzero(codes >= 0)] = True
+            self._bits[column] = np.packbits(membership, axis=1)
+
+        # Orden alfabético de las estaciones para las listas de opciones
+        name_codes, self._names = pd.factorize(frame[Config.STATION_NAME_COL], sort=True)
+        self._name_codes = name_codes
+        self._all = _bitset(np.ones(n, dtype=bool))
+
+    # --- Bitsets ---
+    def _union(self, column, values):
+        """Bitset de las estaciones cuyo valor de `column` está en `values`."""
+        if column not in self._bits:
+            return self._all
+        positions = self._categories[column].get_indexer(pd.Index(values))
+        positions = positions[positions >= 0]
+        if len(positions) == 0:
+            return np.zeros_like(self._all)
+        return np.bitwise_or.reduce(self._bits[column][positions], axis=0)
+
+    def mask(self, min_perc=0, altitudes=None, regions=None, municipios=None, celdas=None):
+        """Bitset de las estaciones que cumplen todos los filtros (los filtros vacíos no restringen)."""
+        bits = self._all.copy()
+        if min_perc > 0:
+            bits &= _bitset(self.percentages >= min_perc)
+        if altitudes:
+            band_bits = [self._altitude_bits[label] for label in altitudes if label in self._altitude_bits]
+            bits &= np.bitwise_or.reduce(band_bits, axis=0) if band_bits else 0
+        for column, values in ((Config.REGION_COL, regions), (Config.MUNICIPALITY_COL, municipios), (Config.CELL_COL, celdas)):
+            if values:
+                bits &= self._union(column, values)
+        return bits
+
+    def positions(self, bits):
+        """Posiciones (ordenadas) de las estaciones de un bitset."""
+        return np.flatnonzero(np.unpackbits(bits, count=self.n_stations))
+
+    # --- Resultados ---
+    def filter(self, min_perc=0, altitudes=None, regions=None, municipios=None, celdas=None):
+        """Posiciones de las estaciones que cumplen los filtros."""
+        return self.positions(self.mask(min_perc, altitudes, regions, municipios, celdas))
+
+    def select(self, positions):
+        """Subconjunto de la tabla de estaciones (con el % de datos numérico)."""
+        return self.frame.iloc[positions]
+
+    def station_names(self, positions):
+        """Nombres de estación de las posiciones dadas, sin repetir y en orden alfabético."""
+        return self._names[np.unique(self._name_codes[positions])].tolist()
+
+    def options(self, column, regions=None):
+        """
+        Valores ordenados de `column` para las listas de selección. Si se indican regiones,
+        solo los valores presentes en esas regiones (municipios y celdas dependen de la región).
+        """
+        if column not in self._codes:
+            return []
+        codes = self._codes[column]
+        if regions:
+            codes = codes[self.positions(self._union(Config.REGION_COL, regions))]
+        codes = np.unique(codes[codes >= 0])
+        return self._categories[column][codes].tolist()
+
+# Clave de orden de df_long: código de estación × LONG_KEY_STRIDE + mes ordinal (año * 12 + mes - 1)
+LONG_KEY_STRIDE = 12 * 10000
+
+def long_sort_keys(df_long):
+    """Clave entera (estación, fecha) de cada fila de df_long, a partir de los códigos categóricos y de año/mes."""
+    station_codes = df_long[Config.STATION_NAME_COL].cat.codes.to_numpy().astype('int64')
+    ordinals = df_long[Config.YEAR_COL].to_numpy().astype('int64') * 12 + df_long[Config.MONTH_COL].to_numpy().astype('int64') - 1
+    return station_codes * LONG_KEY_STRIDE + ordinals
+
+class LongIndex:
+    """
+    Índice de df_long ordenado por (estación, fecha) (ver data_processor.sort_long).
+    Como las filas de cada estación son contiguas y están en orden cronológico, la selección
+    estaciones × rango de años se resuelve con búsquedas binarias sobre la clave ordenada y
+    da rangos de filas; el filtro de meses solo recorre las filas seleccionadas.
+    """
+
+    def __init__(self, df_long):
+        self._keys = long_sort_keys(df_long)
+        if len(self._keys) > 1 and (np.diff(self._keys) < 0).any():
+            raise ValueError("df_long debe estar ordenado por estación y fecha (data_processor.sort_long).")
+        self._stations = df_long[Config.STATION_NAME_COL].cat.categories
+        self._months = df_long[Config.MONTH_COL].to_numpy()
+        ordinals = self._keys % LONG_KEY_STRIDE
+        present = np.unique(ordinals // 12) if len(ordinals) else np.array([], dtype='int64')
+        self.years = present.tolist()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def ranges(self, stations=None, year_range=None):
+        """Rangos [inicio, fin) de filas por estación seleccionada, en orden de estación."""
+        if stations is None:
+            codes = np.arange(len(self._stations))
+        else:
+            codes = self._stations.get_indexer(pd.Index(stations))
+            codes = np.unique(codes[codes >= 0])
+        first, last = (0, LONG_KEY_STRIDE - 1) if year_range is None else (int(year_range[0]) * 12, int(year_range[1]) * 12 + 11)
+        starts = np.searchsorted(self._keys, codes * LONG_KEY_STRIDE + first, side='left')
+        ends = np.searchsorted(self._keys, codes * LONG_KEY_STRIDE + last, side='right')
+        return starts, ends
+
+    def rows(self, stations=None, year_range=None, months=None):
+        """Posiciones (ordenadas) de las filas de la selección estaciones × años × meses."""
+        starts, ends = self.ranges(stations, year_range)
+        lengths = ends - starts
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        rows = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+        if months is not None and set(months) != set(range(1, 13)):
+            rows = rows[np.isin(self._months[rows], list(months))]
+        return rows
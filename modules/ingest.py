@@ -0,0 +1,96 @@
+# modules/ingest.py
+
+import io
+import re
+import codecs
+import pandas as pd
+
+# Tamaño de la muestra (en bytes) usada para detectar la codificación.
+SNIFF_SAMPLE_SIZE = 64 * 1024
+# Delimitadores candidatos, en orden de preferencia ante empates.
+DELIMITER_CANDIDATES = (';', '\t', '|', ',')
+# Número aproximado de celdas (filas × columnas) por bloque en la lectura por bloques.
+CHUNK_CELLS = 250_000
+
+_NON_ASCII_BYTE = re.compile(rb'[\x80-\xff]')
+
+def detect_encoding(content, sample_size=SNIFF_SAMPLE_SIZE):
+    """
+    Detecta la codificación de un CSV a partir de una muestra de bytes.
+    La muestra se toma desde el primer byte no ASCII, que es donde las codificaciones difieren.
+    """
+    if content.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    match = _NON_ASCII_BYTE.search(content)
+    if match is None:
+        return 'utf-8'
+    sample = content[match.start():match.start() + sample_size]
+    try:
+        # final=False tolera un carácter multibyte cortado al final de la muestra
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        return 'latin1'
+
+def detect_delimiter(content, encoding, default=';'):
+    """Detecta el delimitador contando los candidatos en la línea de encabezado."""
+    header = content[:SNIFF_SAMPLE_SIZE].split(b'\n', 1)[0].decode(encoding, errors='replace')
+    counts = {sep: header.count(sep) for sep in DELIMITER_CANDIDATES}
+    best = max(DELIMITER_CANDIDATES, key=lambda sep: counts[sep])
+    return best if counts[best] > 0 else default
+
+def read_csv_bytes(content, sep=None, **read_csv_kwargs):
+    """
+    Lee un CSV desde bytes en una sola pasada: detecta la codificación y el delimitador
+    sobre una muestra y decodifica en flujo durante el parseo.
+    Lanza ValueError si el contenido no se puede interpretar.
+    """
+    encoding = detect_encoding(content)
+    if sep is None:
+        sep = detect_delimiter(content, encoding)
+    if read_csv_kwargs.get('decimal') == sep:
+        # Un CSV separado por comas no puede usar la coma como decimal
+        read_csv_kwargs.pop('decimal')
+    try:
+        return pd.read_csv(io.BytesIO(content), sep=sep, encoding=encoding, **read_csv_kwargs)
+    except UnicodeDecodeError:
+        # La muestra no fue representativa (p. ej. archivo con codificación mixta):
+        # latin1 decodifica cualquier secuencia de bytes.
+        if encoding == 'latin1':
+            raise
+        return pd.read_csv(io.BytesIO(content), sep=sep, encoding='latin1', **read_csv_kwargs)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        raise ValueError(str(e)) from e
+
+def iter_csv_chunks(file_object, sep=None, encoding=None, chunk_cells=CHUNK_CELLS, **read_csv_kwargs):
+    """
+    Lee un CSV por bloques de filas sin construir la tabla completa en memoria.
+    El número de filas por bloque se ajusta al ancho del archivo para que cada bloque tenga
+    del orden de `chunk_cells` celdas, sin importar cuántas columnas (estaciones) tenga.
+    La codificación y el delimitador se detectan sobre una muestra inicial; si la muestra no
+    es representativa el parseo puede lanzar UnicodeDecodeError y el llamador puede reintentar
+    con encoding='latin1'. Lanza ValueError si el contenido no se puede interpretar.
+    """
+    file_object.seek(0)
+    sample = file_object.read(SNIFF_SAMPLE_SIZE)
+    file_object.seek(0)
+    if not sample.strip():
+        raise ValueError("El archivo está vacío.")
+    encoding = encoding or detect_encoding(sample)
+    if sep is None:
+        sep = detect_delimiter(sample, encoding)
+    if read_csv_kwargs.get('decimal') == sep:
+        read_csv_kwargs.pop('decimal')
+    n_columns = sample.split(b'\n', 1)[0].decode(encoding, errors='replace').count(sep) + 1
+    chunksize = max(1, chunk_cells // n_columns)
+    try:
+        with pd.read_csv(file_object, sep=sep, encoding=encoding, chunksize=chunksize, **read_csv_kwargs) as reader:
+            for chunk in reader:
+                yield chunk
+    except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        raise ValueError(str(e)) from e
@@ -1,14 +1,18 @@
-import streamlit as st
 import pandas as pd
 import numpy as np
-import gstools as gs
-from scipy.interpolate import Rbf
-import matplotlib.pyplot as plt
 import plotly.graph_objects as go
 import plotly.express as px
-from sklearn.model_selection import LeaveOneOut
-from sklearn.metrics import mean_squared_error, mean_absolute_error
 from modules.config import Config
+from modules.compute_cache import cached
+from modules.lazy_import import lazy_import, lazy_callable
+
+# gstools, matplotlib, scikit-learn y scipy.interpolate se importan en la primera interpolación
+gs = lazy_import('gstools')
+plt = lazy_import('matplotlib.pyplot')
+Rbf = lazy_callable('scipy.interpolate', 'Rbf')
+LeaveOneOut = lazy_callable('sklearn.model_selection', 'LeaveOneOut')
+mean_squared_error = lazy_callable('sklearn.metrics', 'mean_squared_error')
+mean_absolute_error = lazy_callable('sklearn.metrics', 'mean_absolute_error')
 
 def interpolate_idw(lons, lats, vals, grid_lon, grid_lat, power=2):
     """Realiza una interpolación por el método IDW."""
@@ -30,6 +34,12 @@ def interpolate_idw(lons, lats, vals, grid_lon, grid_lat, power=2):
                 grid_z[j, i] = np.nan
     return grid_z.T
 
+def interpolation_grid(gdf_bounds, size=100, margin=0.1):
+    """Ejes (grid_lon, grid_lat) de la grilla regular de interpolación para unos límites dados."""
+    grid_lon = np.linspace(gdf_bounds[0] - margin, gdf_bounds[2] + margin, size)
+    grid_lat = np.linspace(gdf_bounds[1] - margin, gdf_bounds[3] + margin, size)
+    return grid_lon, grid_lat
+
 # -----------------------------------------------------------------------------
 # NUEVA FUNCIÓN INTERNA PARA REUTILIZAR LA LÓGICA DE VALIDACIÓN CRUZADA
 # -----------------------------------------------------------------------------
@@ -88,25 +98,13 @@ def _perform_loocv(method, lons, lats, vals, elevs=None):
 # -----------------------------------------------------------------------------
 # NUEVA FUNCIÓN PÚBLICA PARA LA PESTAÑA DE VALIDACIÓN
 # -----------------------------------------------------------------------------
-@st.cache_data
+@cached
 def perform_loocv_for_year(year, method, gdf_metadata, df_anual_non_na):
     """
     Realiza una Validación Cruzada Dejando Uno Afuera (LOOCV) para un año y método dados.
     Devuelve las métricas de error (RMSE y MAE).
     """
-    df_year = pd.merge(
-        df_anual_non_na[df_anual_non_na[Config.YEAR_COL] == year],
-        gdf_metadata,
-        on=Config.STATION_NAME_COL
-    )
-    
-    clean_cols = [Config.LONGITUDE_COL, Config.LATITUDE_COL, Config.PRECIPITATION_COL]
-    if method == "Kriging con Deriva Externa (KED)" and Config.ELEVATION_COL in df_year.columns:
-        clean_cols.append(Config.ELEVATION_COL)
-
-    df_clean = df_year.dropna(subset=clean_cols).copy()
-    df_clean = df_clean[np.isfinite(df_clean[clean_cols]).all(axis=1)]
-    df_clean = df_clean.drop_duplicates(subset=[Config.LONGITUDE_COL, Config.LATITUDE_COL])
+    df_clean = prepare_interpolation_data(year, method, gdf_metadata, df_anual_non_na)
 
     if len(df_clean) < 4:
         return {'RMSE': np.nan, 'MAE': np.nan}
@@ -118,7 +116,7 @@ def perform_loocv_for_year(year, method, gdf_metadata, df_anual_non_na):
     
     return _perform_loocv(method, lons, lats, vals, elevs)
 
-@st.cache_data
+@cached
 def perform_loocv_for_all_methods(_year, _gdf_metadata, _df_anual_non_na):
     """Ejecuta LOOCV para todos los métodos de interpolación para un año dado."""
     methods = ["Kriging Ordinario", "IDW", "Spline (Thin Plate)"]
@@ -136,15 +134,8 @@ def perform_loocv_for_all_methods(_year, _gdf_metadata, _df_anual_non_na):
                 "MAE": metrics.get('MAE')
             })
     return pd.DataFrame(results)
-# -----------------------------------------------------------------------------
-# FUNCIÓN ORIGINAL, AHORA ACTUALIZADA PARA USAR LA FUNCIÓN AUXILIAR
-# -----------------------------------------------------------------------------
-@st.cache_data
-def create_interpolation_surface(year, method, variogram_model, gdf_bounds, gdf_metadata, df_anual_non_na):
-    """Crea una superficie de interpolación y calcula el error RMSE."""
-    fig_var = None
-    error_msg = None
-
+def prepare_interpolation_data(year, method, gdf_metadata, df_anual_non_na):
+    """Estaciones con dato válido (y coordenadas únicas) para interpolar un año."""
     df_year = pd.merge(
         df_anual_non_na[df_anual_non_na[Config.YEAR_COL] == year],
         gdf_metadata,
@@ -157,7 +148,58 @@ def create_interpolation_surface(year, method, variogram_model, gdf_bounds, gdf_
 
     df_clean = df_year.dropna(subset=clean_cols).copy()
     df_clean = df_clean[np.isfinite(df_clean[clean_cols]).all(axis=1)]
-    df_clean = df_clean.drop_duplicates(subset=[Config.LONGITUDE_COL, Config.LATITUDE_COL])
+    return df_clean.drop_duplicates(subset=[Config.LONGITUDE_COL, Config.LATITUDE_COL])
+
+def compute_interpolation_grid(method, variogram_model, lons, lats, vals, grid_lon, grid_lat, elevs=None, drift_grid=None):
+    """
+    Calcula la superficie interpolada (arreglo len(grid_lon) × len(grid_lat)) sin generar gráficos.
+    Para los métodos de Kriging devuelve además el variograma experimental y el modelo
+    ajustado como (bin_center, gamma, model); para los demás, None.
+    Lanza excepción si el método falla.
+    """
+    if method in ["Kriging Ordinario", "Kriging con Deriva Externa (KED)"]:
+        model_map = {'gaussian': gs.Gaussian(dim=2), 'exponential': gs.Exponential(dim=2), 'spherical': gs.Spherical(dim=2), 'linear': gs.Linear(dim=2)}
+        model = model_map.get(variogram_model, gs.Spherical(dim=2))
+        bin_center, gamma = gs.vario_estimate((lons, lats), vals)
+        model.fit_variogram(bin_center, gamma, nugget=True)
+
+        if method == "Kriging Ordinario":
+            krig = gs.krige.Ordinary(model, (lons, lats), vals)
+            z_grid, _ = krig.structured([grid_lon, grid_lat])
+        else: # KED
+            if drift_grid is None:
+                # Sin DEM: grilla de elevación aproximada a partir de las estaciones
+                rbf_elev = Rbf(lons, lats, elevs, function='thin_plate')
+                grid_x, grid_y = np.meshgrid(grid_lon, grid_lat)
+                drift_grid = rbf_elev(grid_x, grid_y)
+            krig = gs.krige.ExtDrift(model, (lons, lats), vals, drift_src=elevs)
+            z_grid, _ = krig.structured([grid_lon, grid_lat], drift_tgt=drift_grid.T)
+        return z_grid, (bin_center, gamma, model)
+
+    if method == "IDW":
+        return interpolate_idw(lons, lats, vals, grid_lon, grid_lat), None
+
+    if method == "Spline (Thin Plate)":
+        rbf = Rbf(lons, lats, vals, function='thin_plate')
+        grid_x, grid_y = np.meshgrid(grid_lon, grid_lat)
+        return rbf(grid_x, grid_y), None
+
+    return None, None
+
+# -----------------------------------------------------------------------------
+# FUNCIÓN ORIGINAL, AHORA ACTUALIZADA PARA USAR LA FUNCIÓN AUXILIAR
+# -----------------------------------------------------------------------------
+@cached
+def create_interpolation_surface(year, method, variogram_model, gdf_bounds, gdf_metadata, df_anual_non_na, drift_grid=None, precomputed=None):
+    """
+    Crea una superficie de interpolación y calcula el error RMSE.
+    Para KED, `drift_grid` es la grilla de covariable (elevación del DEM remuestreada sobre
+    la grilla de interpolación, ver dem_service.get_covariate_grid); si no se entrega, la
+    deriva se aproxima con un spline de las elevaciones de las estaciones.
+    `precomputed` = (z_grid, rmse) permite usar una superficie calculada por pipeline.py;
+    en ese caso no se recalcula la grilla ni la validación cruzada.
+    """
+    df_clean = prepare_interpolation_data(year, method, gdf_metadata, df_anual_non_na)
     
     if len(df_clean) < 4:
         error_msg = f"Se necesitan al menos 4 estaciones con datos para el año {year} para interpolar."
@@ -169,51 +211,32 @@ def create_interpolation_surface(year, method, variogram_model, gdf_bounds, gdf_
     vals = df_clean[Config.PRECIPITATION_COL].values
     elevs = df_clean[Config.ELEVATION_COL].values if Config.ELEVATION_COL in df_clean else None
 
-    # Llama a la función auxiliar para obtener métricas
-    metrics = _perform_loocv(method, lons, lats, vals, elevs)
-    rmse = metrics.get('RMSE')
+    grid_lon, grid_lat = interpolation_grid(gdf_bounds)
+    fig_variogram = None
 
-    grid_lon = np.linspace(gdf_bounds[0] - 0.1, gdf_bounds[2] + 0.1, 100)
-    grid_lat = np.linspace(gdf_bounds[1] - 0.1, gdf_bounds[3] + 0.1, 100)
-    z_grid, fig_variogram, error_message = None, None, None
+    if precomputed is not None:
+        z_grid, rmse = precomputed
+    else:
+        # Llama a la función auxiliar para obtener métricas
+        metrics = _perform_loocv(method, lons, lats, vals, elevs)
+        rmse = metrics.get('RMSE')
+        try:
+            z_grid, variogram = compute_interpolation_grid(
+                method, variogram_model, lons, lats, vals, grid_lon, grid_lat, elevs=elevs, drift_grid=drift_grid
+            )
+        except Exception as e:
+            error_message = f"Error al calcular {method}: {e}"
+            fig = go.Figure().update_layout(title=error_message, xaxis_visible=False, yaxis_visible=False)
+            return fig, None, error_message
 
-    try:
-        if method in ["Kriging Ordinario", "Kriging con Deriva Externa (KED)"]:
-            model_map = {'gaussian': gs.Gaussian(dim=2), 'exponential': gs.Exponential(dim=2), 'spherical': gs.Spherical(dim=2), 'linear': gs.Linear(dim=2)}
-            model = model_map.get(variogram_model, gs.Spherical(dim=2))
-            bin_center, gamma = gs.vario_estimate((lons, lats), vals)
-            model.fit_variogram(bin_center, gamma, nugget=True)
-            
+        if variogram is not None:
+            bin_center, gamma, model = variogram
             fig_variogram, ax = plt.subplots()
             ax.plot(bin_center, gamma, 'o', label='Experimental')
             model.plot(ax=ax, label='Modelo Ajustado')
             ax.set_xlabel('Distancia'); ax.set_ylabel('Semivarianza')
             ax.set_title(f'Variograma para {year}'); ax.legend()
 
-            if method == "Kriging Ordinario":
-                krig = gs.krige.Ordinary(model, (lons, lats), vals)
-                z_grid, _ = krig.structured([grid_lon, grid_lat])
-            else: # KED
-                # Necesitamos crear una grilla de elevación para la predicción
-                rbf_elev = Rbf(lons, lats, elevs, function='thin_plate')
-                grid_x, grid_y = np.meshgrid(grid_lon, grid_lat)
-                drift_grid = rbf_elev(grid_x, grid_y)
-                krig = gs.krige.ExtDrift(model, (lons, lats), vals, drift_src=elevs)
-                z_grid, _ = krig.structured([grid_lon, grid_lat], drift_tgt=drift_grid.T)
-
-        elif method == "IDW":
-            z_grid = interpolate_idw(lons, lats, vals, grid_lon, grid_lat)
-            
-        elif method == "Spline (Thin Plate)":
-            rbf = Rbf(lons, lats, vals, function='thin_plate')
-            grid_x, grid_y = np.meshgrid(grid_lon, grid_lat)
-            z_grid = rbf(grid_x, grid_y)
-            
-    except Exception as e:
-        error_message = f"Error al calcular {method}: {e}"
-        fig = go.Figure().update_layout(title=error_message, xaxis_visible=False, yaxis_visible=False)
-        return fig, None, error_message
-
     if z_grid is not None:
         fig = go.Figure(data=go.Contour(
             z=z_grid.T, x=grid_lon, y=grid_lat,
@@ -0,0 +1,51 @@
+# modules/lazy_import.py
+
+import importlib
+import types
+
+# Importación diferida de librerías pesadas (prophet, pmdarima, statsmodels, gstools,
+# matplotlib, altair, pymannkendall, rasterio...). El módulo real se importa la primera vez
+# que se accede a uno de sus atributos, es decir, cuando la pestaña o función que lo usa
+# se ejecuta por primera vez, y no al arrancar la aplicación.
+# Si la librería no está instalada, el ImportError aparece en ese primer uso.
+
+class LazyModule(types.ModuleType):
+    """Módulo sustituto que importa `name` en el primer acceso a un atributo."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'cargado' if self.__dict__['_module'] is not None else 'diferido'
+        return f"<módulo {self.__name__!r} ({state})>"
+
+def lazy_import(name):
+    """Equivalente diferido de `import name` (admite submódulos, p. ej. 'matplotlib.pyplot')."""
+    return LazyModule(name)
+
+def lazy_callable(module_name, attribute):
+    """
+    Equivalente diferido de `from module_name import attribute` para funciones y clases que
+    solo se llaman (no sirve para herencia ni isinstance). El módulo se importa en la primera llamada.
+    """
+    module = LazyModule(module_name)
+
+    def call(*args, **kwargs):
+        return getattr(module, attribute)(*args, **kwargs)
+    call.__name__ = call.__qualname__ = attribute
+    call.__doc__ = f"Versión diferida de {module_name}.{attribute}."
+    return call
@@ -0,0 +1,292 @@
+# modules/precip_cube.py
+
+import numpy as np
+import pandas as pd
+from modules.config import Config
+
+class PrecipCube:
+    """
+    Almacén denso de precipitación mensual: un arreglo (estaciones × meses) con NaN
+    donde no hay dato, un índice de estaciones y un eje de meses. El eje temporal
+    cubre años calendario completos (enero a diciembre), por lo que `by_year()`
+    entrega una vista (estaciones × años × 12) sin copiar datos.
+    Las vistas en formato largo o ancho se construyen solo cuando se piden.
+    """
+
+    def __init__(self, values, stations, first_year):
+        self.values = values
+        self.stations = pd.Index(stations, name=Config.STATION_NAME_COL)
+        self.first_year = int(first_year)
+
+    # --- Construcción ---
+    @classmethod
+    def from_long(cls, df, value_col=Config.PRECIPITATION_COL):
+        """
+        Construye el cubo a partir de un DataFrame en formato largo (p. ej. df_long).
+        Si una estación tiene varios registros para un mismo mes se promedian,
+        igual que en pivot_table.
+        """
+        if df is None or df.empty:
+            return cls(np.empty((0, 0), dtype='float32'), [], 0)
+        codes, stations = pd.factorize(df[Config.STATION_NAME_COL], sort=True)
+        dates = pd.DatetimeIndex(df[Config.DATE_COL])
+        years, months = dates.year.to_numpy(), dates.month.to_numpy()
+        first_year = int(np.nanmin(years))
+        n_years = int(np.nanmax(years)) - first_year + 1
+        n_stations, n_months = len(stations), n_years * 12
+
+        values = df[value_col].to_numpy(dtype='float64', na_value=np.nan)
+        valid = (codes >= 0) & ~np.isnan(values) & ~dates.isna()
+        flat_index = codes[valid] * n_months + (years[valid] - first_year) * 12 + (months[valid] - 1)
+        sums = np.bincount(flat_index, weights=values[valid], minlength=n_stations * n_months)
+        counts = np.bincount(flat_index, minlength=n_stations * n_months)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cube = np.where(counts > 0, sums / counts, np.nan).astype('float32')
+        return cls(cube.reshape(n_stations, n_months), np.asarray(stations), first_year)
+
+    @classmethod
+    def from_series(cls, series, station=None):
+        """Cubo de una sola estación a partir de una serie mensual indexada por fecha."""
+        df = pd.DataFrame({
+            Config.STATION_NAME_COL: station if station is not None else (series.name or 'serie'),
+            Config.DATE_COL: pd.DatetimeIndex(series.index), Config.PRECIPITATION_COL: series.to_numpy()
+        })
+        return cls.from_long(df.dropna(subset=[Config.PRECIPITATION_COL]))
+
+    # --- Ejes y propiedades ---
+    @property
+    def n_stations(self):
+        return self.values.shape[0]
+
+    @property
+    def n_months(self):
+        return self.values.shape[1]
+
+    @property
+    def years(self):
+        return np.arange(self.first_year, self.first_year + self.n_months // 12)
+
+    @property
+    def months(self):
+        """Eje temporal como DatetimeIndex (inicio de mes)."""
+        return pd.date_range(f"{self.first_year}-01-01", periods=self.n_months, freq='MS', name=Config.DATE_COL)
+
+    @property
+    def mask(self):
+        """True donde hay dato válido."""
+        return ~np.isnan(self.values)
+
+    def by_year(self):
+        """Vista (estaciones × años × 12 meses) del arreglo de valores."""
+        return self.values.reshape(self.n_stations, -1, 12)
+
+    def station_positions(self, stations):
+        """Posiciones (ordenadas) de las estaciones solicitadas que existen en el cubo."""
+        positions = self.stations.get_indexer(pd.Index(stations))
+        return np.sort(positions[positions >= 0])
+
+    # --- Filtrado ---
+    def select(self, stations=None, year_range=None, months=None):
+        """
+        Subconjunto del cubo por estaciones, rango de años (inclusive) y meses del año.
+        Los meses no seleccionados quedan como NaN para conservar el eje de años completos.
+        """
+        values, stations_index, first_year = self.values, self.stations, self.first_year
+        if stations is not None:
+            positions = self.station_positions(stations)
+            values, stations_index = values[positions], stations_index[positions]
+        if year_range is not None and self.n_months:
+            start_year = max(int(year_range[0]), first_year)
+            end_year = min(int(year_range[1]), first_year + self.n_months // 12 - 1)
+            if end_year < start_year:
+                values = values[:, :0]
+            else:
+                values = values[:, (start_year - first_year) * 12:(end_year - first_year + 1) * 12]
+            first_year = start_year
+        if months is not None and set(months) != set(range(1, 13)):
+            excluded = ~np.isin(np.arange(values.shape[1]) % 12 + 1, list(months))
+            values = values.copy()
+            values[:, excluded] = np.nan
+        return PrecipCube(values, stations_index, first_year)
+
+    def where(self, condition):
+        """Nuevo cubo con NaN donde `condition` (arreglo booleano del mismo tamaño) es False."""
+        return PrecipCube(np.where(condition, self.values, np.nan).astype(self.values.dtype), self.stations, self.first_year)
+
+    def update(self, other):
+        """
+        Nuevo cubo con los valores de `other` superpuestos a los actuales (p. ej. meses
+        recién añadidos). Los ejes se amplían si `other` trae estaciones o años nuevos;
+        los NaN de `other` no borran datos existentes.
+        """
+        if other.n_stations == 0:
+            return self
+        if self.n_stations == 0:
+            return other
+        stations = self.stations.union(other.stations)
+        first_year = min(self.first_year, other.first_year)
+        last_year = max(self.first_year + self.n_months // 12, other.first_year + other.n_months // 12) - 1
+        values = np.full((len(stations), (last_year - first_year + 1) * 12), np.nan, dtype='float32')
+        for cube in (self, other):
+            rows = stations.get_indexer(cube.stations)
+            offset = (cube.first_year - first_year) * 12
+            block = values[rows, offset:offset + cube.n_months]
+            values[rows, offset:offset + cube.n_months] = np.where(np.isnan(cube.values), block, cube.values)
+        return PrecipCube(values, stations, first_year)
+
+    def align_to(self, other):
+        """Valores del cubo sobre los ejes (estaciones y meses) de `other`; NaN donde no hay dato."""
+        values = np.full(other.values.shape, np.nan, dtype=self.values.dtype)
+        rows = other.stations.get_indexer(self.stations)
+        start = (self.first_year - other.first_year) * 12
+        src_start, dst_start = max(-start, 0), max(start, 0)
+        length = min(self.n_months - src_start, other.n_months - dst_start)
+        keep = rows >= 0
+        if length > 0 and keep.any():
+            values[rows[keep], dst_start:dst_start + length] = self.values[keep, src_start:src_start + length]
+        return values
+
+    def fill_gaps(self):
+        """
+        Nuevo cubo con los huecos interiores de cada estación (entre su primer y su último dato)
+        interpolados linealmente en el tiempo, como Series.interpolate(method='time') sobre la
+        serie mensual de cada estación, pero para todas las estaciones a la vez.
+        """
+        if self.n_months == 0:
+            return self
+        values = self.values.astype('float64')
+        valid = ~np.isnan(values)
+        positions = np.arange(self.n_months)
+        previous = np.maximum.accumulate(np.where(valid, positions, -1), axis=1)
+        following = np.minimum.accumulate(np.where(valid, positions, self.n_months)[:, ::-1], axis=1)[:, ::-1]
+        station_idx, month_idx = np.nonzero(~valid & (previous >= 0) & (following < self.n_months))
+        prev_idx, next_idx = previous[station_idx, month_idx], following[station_idx, month_idx]
+
+        days = self.months.asi8 / 86_400e9 # Distancia real entre meses (días)
+        weight = (days[month_idx] - days[prev_idx]) / (days[next_idx] - days[prev_idx])
+        prev_values, next_values = values[station_idx, prev_idx], values[station_idx, next_idx]
+        values[station_idx, month_idx] = prev_values + (next_values - prev_values) * weight
+        return PrecipCube(values.astype(self.values.dtype), self.stations, self.first_year)
+
+    # --- Vistas tabulares ---
+    def to_wide(self, dropna=True):
+        """DataFrame ancho (fechas × estaciones), equivalente a un pivot_table de df_long."""
+        wide = pd.DataFrame(self.values.T, index=self.months, columns=self.stations)
+        if dropna:
+            wide = wide.dropna(how='all').dropna(axis=1, how='all')
+        return wide
+
+    def to_long(self, dropna=True):
+        """DataFrame largo (estación, fecha, año, mes, precipitación) ordenado por estación y fecha."""
+        station_idx, month_idx = np.nonzero(self.mask) if dropna else np.indices(self.values.shape).reshape(2, -1)
+        dates = self.months[month_idx]
+        return pd.DataFrame({
+            Config.STATION_NAME_COL: self.stations.to_numpy()[station_idx],
+            Config.DATE_COL: dates,
+            Config.YEAR_COL: dates.year,
+            Config.MONTH_COL: dates.month,
+            Config.PRECIPITATION_COL: self.values[station_idx, month_idx],
+        })
+
+    # --- Agregaciones ---
+    def correlation(self):
+        """
+        Matriz de correlación de Pearson entre estaciones con eliminación por pares
+        (misma semántica que DataFrame.corr), calculada con productos matriciales.
+        Se omiten las estaciones sin ningún dato.
+        """
+        has_data = self.mask.any(axis=1)
+        x = self.values[has_data].astype('float64')
+        valid = ~np.isnan(x)
+        x0 = np.where(valid, x, 0.0)
+        m = valid.astype('float64')
+        n = m @ m.T
+        sum_x = x0 @ m.T           # suma de x_i donde i y j tienen dato
+        sum_xx = (x0 ** 2) @ m.T
+        sum_xy = x0 @ x0.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = sum_xy - sum_x * sum_x.T / n
+            var_x = sum_xx - sum_x ** 2 / n
+            corr = cov / np.sqrt(var_x * var_x.T)
+        corr[n < 2] = np.nan
+        np.fill_diagonal(corr, np.where(np.diag(var_x) > 0, 1.0, np.nan))
+        stations = self.stations[has_data]
+        return pd.DataFrame(np.clip(corr, -1.0, 1.0), index=stations, columns=stations)
+
+class AnnualCube:
+    """
+    Agregados anuales precalculados a partir de un PrecipCube: para cada estación y año,
+    sumas acumuladas a lo largo de los meses (prefijos de longitud 13) de la precipitación,
+    del número de meses con dato y del número de meses con lluvia (> 0).
+    El total anual, los meses válidos y el total de cualquier subconjunto de meses para
+    cualquier rango de años salen de restas de prefijos, sin recorrer las filas mensuales.
+    """
+
+    def __init__(self, sums, counts, positives, stations, first_year):
+        self.sums = sums             # (estaciones × años × 13) float64
+        self.counts = counts         # (estaciones × años × 13) int16
+        self.positives = positives   # (estaciones × años × 13) int16
+        self.stations = pd.Index(stations, name=Config.STATION_NAME_COL)
+        self.first_year = int(first_year)
+
+    @classmethod
+    def from_precip_cube(cls, cube):
+        by_year = cube.by_year().astype('float64')
+        valid = ~np.isnan(by_year)
+        pad = [(0, 0), (0, 0), (1, 0)]
+        sums = np.pad(np.cumsum(np.where(valid, by_year, 0.0), axis=2), pad)
+        counts = np.pad(np.cumsum(valid, axis=2, dtype='int16'), pad)
+        positives = np.pad(np.cumsum(valid & (by_year > 0), axis=2, dtype='int16'), pad)
+        return cls(sums, counts, positives, cube.stations, cube.first_year)
+
+    @property
+    def years(self):
+        return np.arange(self.first_year, self.first_year + self.sums.shape[1])
+
+    @staticmethod
+    def _month_totals(prefix, months):
+        """Total por estación y año de los meses indicados (todos por defecto)."""
+        if months is None:
+            return prefix[..., 12] - prefix[..., 0]
+        months = np.unique(np.asarray(list(months), dtype='int64'))
+        if len(months) == 0:
+            return np.zeros(prefix.shape[:2], dtype=prefix.dtype)
+        if months[-1] - months[0] + 1 == len(months): # Meses consecutivos: una sola resta
+            return prefix[..., months[-1]] - prefix[..., months[0] - 1]
+        return (prefix[..., months] - prefix[..., months - 1]).sum(axis=2)
+
+    def totals(self, stations=None, year_range=None, months=None, exclude_zeros=False):
+        """
+        (estaciones, años, sumas, meses_validos) de la selección. Con exclude_zeros los
+        meses con 0 mm no cuentan como meses válidos (como al descartar las filas en cero).
+        """
+        positions = np.arange(len(self.stations))
+        if stations is not None:
+            positions = self.stations.get_indexer(pd.Index(stations))
+            positions = np.sort(positions[positions >= 0])
+        start, end = 0, self.sums.shape[1]
+        if year_range is not None:
+            start = min(max(int(year_range[0]) - self.first_year, 0), end)
+            end = max(min(int(year_range[1]) - self.first_year + 1, end), start)
+        counts_prefix = self.positives if exclude_zeros else self.counts
+        sums = self._month_totals(self.sums[positions, start:end], months)
+        counts = self._month_totals(counts_prefix[positions, start:end], months)
+        return self.stations[positions], self.years[start:end], sums, counts
+
+    def annual_totals(self, stations=None, year_range=None, months=None, exclude_zeros=False, min_valid_months=10):
+        """
+        Precipitación anual en formato largo, equivalente a analysis.calculate_annual_totals
+        sobre las filas mensuales de la misma selección: una fila por estación y año con al
+        menos un mes válido; los años con menos de `min_valid_months` meses quedan como NaN.
+        """
+        station_names, years, sums, counts = self.totals(stations, year_range, months, exclude_zeros)
+        station_idx, year_idx = np.nonzero(counts > 0)
+        precipitation = sums[station_idx, year_idx]
+        valid_months = counts[station_idx, year_idx].astype('int64')
+        df = pd.DataFrame({
+            Config.STATION_NAME_COL: station_names.to_numpy()[station_idx],
+            Config.YEAR_COL: years[year_idx].astype('int64'),
+            Config.PRECIPITATION_COL: np.where(valid_months < min_valid_months, np.nan, precipitation),
+            'meses_validos': valid_months,
+        })
+        return df.sort_values([Config.STATION_NAME_COL, Config.YEAR_COL], kind='stable').reset_index(drop=True)
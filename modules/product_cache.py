@@ -0,0 +1,117 @@
+# modules/product_cache.py
+
+import sys
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+def estimate_size(value):
+    """Tamaño aproximado en bytes de un producto (tablas, arreglos, cubos y tuplas de ellos)."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(getattr(value, 'values', None), np.ndarray): # PrecipCube y similares
+        return value.values.nbytes
+    return sys.getsizeof(value)
+
+def filter_signature(dataset_key, stations, year_range, months, analysis_mode, exclude_na=False, exclude_zeros=False):
+    """
+    Firma canónica de una selección del panel lateral: no depende del orden en que se
+    eligieron las estaciones o los meses, e incluye la versión del conjunto de datos.
+    """
+    return (
+        'seleccion', dataset_key, tuple(sorted(stations)), (int(year_range[0]), int(year_range[1])),
+        tuple(sorted(set(months))), analysis_mode, bool(exclude_na), bool(exclude_zeros)
+    )
+
+class ProductCache:
+    """
+    Caché de productos derivados (umbrales, series completadas, selecciones, etc.).
+    Cada entrada registra de qué estaciones y de qué período depende, de modo que al
+    añadir registros nuevos solo se invalidan los productos afectados.
+    stations=None significa "depende de todas las estaciones"; period=None, "de todo el período".
+    Es una LRU acotada: si se indica max_bytes y/o max_entries, al guardar se descartan las
+    entradas usadas hace más tiempo hasta volver al límite. Un producto que por sí solo supera
+    max_bytes se devuelve sin guardarse. Los productos se comparten entre reejecuciones: no
+    deben modificarse en su lugar.
+    """
+
+    def __init__(self, max_bytes=None, max_entries=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, stations=None, period=None):
+        stations = None if stations is None else frozenset(stations)
+        period = None if period is None else (pd.Timestamp(period[0]), pd.Timestamp(period[1]))
+        size = estimate_size(value)
+        self._discard(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return value
+        self._entries[key] = (value, stations, period, size)
+        self.nbytes += size
+        self._evict()
+        return value
+
+    def get_or_compute(self, key, compute, stations=None, period=None):
+        """Devuelve el producto almacenado o lo calcula con `compute()` y lo guarda."""
+        if key in self._entries:
+            return self.get(key)
+        return self.put(key, compute(), stations=stations, period=period)
+
+    def invalidate(self, stations=None, period=None):
+        """
+        Elimina las entradas que dependen de alguna de las estaciones indicadas y cuyo
+        período se superpone con `period`. Devuelve el número de entradas eliminadas.
+        """
+        stations = None if stations is None else frozenset(stations)
+        if period is not None:
+            period = (pd.Timestamp(period[0]), pd.Timestamp(period[1]))
+
+        def is_affected(entry_stations, entry_period):
+            if stations is not None and entry_stations is not None and not (entry_stations & stations):
+                return False
+            if period is not None and entry_period is not None:
+                if entry_period[1] < period[0] or entry_period[0] > period[1]:
+                    return False
+            return True
+
+        stale_keys = [key for key, (_, s, p, _) in self._entries.items() if is_affected(s, p)]
+        for key in stale_keys:
+            self._discard(key)
+        return len(stale_keys)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[3]
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_bytes is not None and self.nbytes > self.max_bytes)
+            or (self.max_entries is not None and len(self._entries) > self.max_entries)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self.nbytes -= entry[3]
@@ -0,0 +1,112 @@
+# modules/product_store.py
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+from modules.config import Config
+
+def station_signature(stations, bounds=None):
+    """Firma corta de un conjunto de estaciones (y opcionalmente de los límites de la grilla)."""
+    payload = "|".join(sorted(map(str, stations)))
+    if bounds is not None:
+        payload += "|" + ",".join(f"{b:.6f}" for b in bounds)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def interpolation_signature(gdf_metadata, df_anual_non_na, gdf_bounds):
+    """
+    Firma de las estaciones que entran a la interpolación anual y de los límites de la grilla.
+    Una superficie precalculada solo se reutiliza si la firma de la selección actual coincide.
+    """
+    stations = set(df_anual_non_na[Config.STATION_NAME_COL].unique()) & set(gdf_metadata[Config.STATION_NAME_COL])
+    return station_signature(stations, gdf_bounds)
+
+def _slug(text):
+    return "".join(c if c.isalnum() else '_' for c in str(text).lower()).strip('_')
+
+class ProductStore:
+    """
+    Almacén en disco de productos derivados precalculados por pipeline.py para un conjunto
+    de datos (identificado por su clave de contenido, ver data_cache.compute_dataset_key).
+    Las tablas se guardan en Parquet y las superficies de interpolación en .npz; el archivo
+    manifest.json registra qué productos existen y con qué parámetros se generaron.
+    La aplicación solo lee: si un producto no existe, lo calcula en línea como siempre.
+    """
+
+    def __init__(self, dataset_key, root=None):
+        self.dataset_key = dataset_key
+        self.root = os.path.join(root or Config.PRODUCT_STORE_DIR, dataset_key) if dataset_key else None
+        self._frames = {}
+
+    @property
+    def available(self):
+        return self.root is not None and os.path.exists(os.path.join(self.root, 'manifest.json'))
+
+    @property
+    def manifest(self):
+        try:
+            with open(os.path.join(self.root, 'manifest.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, TypeError, ValueError):
+            return {}
+
+    # --- Tablas ---
+    def save_frame(self, name, df):
+        self._atomic_write(os.path.join(self.root, f"{name}.parquet"), lambda path: df.to_parquet(path, index=False))
+
+    def load_frame(self, name):
+        """Tabla guardada o None. Se lee una sola vez por instancia."""
+        if name not in self._frames:
+            path = os.path.join(self.root, f"{name}.parquet") if self.root else None
+            self._frames[name] = pd.read_parquet(path, memory_map=True) if path and os.path.exists(path) else None
+        return self._frames[name]
+
+    # --- Superficies de interpolación ---
+    def _surface_path(self, signature, year, method, variogram_model):
+        file_name = f"{int(year)}_{_slug(method)}_{_slug(variogram_model or 'na')}.npz"
+        return os.path.join(self.root, 'surfaces', signature, file_name)
+
+    def save_surface(self, signature, year, method, variogram_model, z_grid, rmse):
+        path = self._surface_path(signature, year, method, variogram_model)
+        self._atomic_write(path, lambda temp_path: np.savez(temp_path, z_grid=z_grid, rmse=np.float64(rmse)), suffix='.npz')
+
+    def load_surface(self, signature, year, method, variogram_model):
+        """Devuelve (z_grid, rmse) o None si la superficie no fue precalculada."""
+        if self.root is None:
+            return None
+        path = self._surface_path(signature, year, method, variogram_model)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return data['z_grid'], float(data['rmse'])
+
+    # --- Escritura ---
+    def reset(self):
+        """Elimina los productos existentes del conjunto de datos antes de regenerarlos."""
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        self._frames = {}
+
+    def write_manifest(self, products, **params):
+        manifest = {'dataset_key': self.dataset_key, 'created': pd.Timestamp.now().isoformat(), 'products': products, **params}
+        payload = json.dumps(manifest, ensure_ascii=False, indent=2, default=str)
+
+        def write_json(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+        self._atomic_write(os.path.join(self.root, 'manifest.json'), write_json)
+
+    @staticmethod
+    def _atomic_write(path, writer, suffix=''):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.tmp-', suffix=suffix, dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            writer(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -17,6 +17,7 @@ import pymannkendall as mk
 
 from modules.config import Config
 from modules.visualizer import create_folium_map, generate_station_popup_html
+from modules.precip_cube import PrecipCube
 
 # --- Configuración para Selenium ---
 def setup_driver():
@@ -211,8 +212,8 @@ def generate_pdf_report(report_title, sections_to_include, summary_data, df_anom
         # NUEVA SECCIÓN: Matriz de Correlación
         pdf.add_section_title("8. Matriz de Correlación entre Estaciones")
         if len(stations_for_analysis) > 1:
-            df_pivot = df_monthly_filtered.pivot_table(index=Config.DATE_COL, columns=Config.STATION_NAME_COL, values=Config.PRECIPITATION_COL)
-            corr_matrix = df_pivot.corr()
+            precip_cube = data.get('precip_cube') or PrecipCube.from_long(df_monthly_filtered)
+            corr_matrix = precip_cube.correlation()
             fig = px.imshow(corr_matrix, text_auto='.2f', aspect="auto", color_continuous_scale='RdBu_r', title="Correlación de Precipitación Mensual")
             pdf.add_plotly_fig(fig, width=180)
         else:
@@ -0,0 +1,42 @@
+# modules/streamlit_adapter.py
+
+import streamlit as st
+from modules.compute_cache import get_cache_backend, set_cache_backend
+from modules.dataset_registry import DatasetRegistry
+
+# Adaptador entre los módulos de cálculo (sin dependencia de Streamlit) y la aplicación.
+
+class StreamlitCache:
+    """Backend de compute_cache que guarda los resultados con st.cache_data."""
+
+    def __init__(self):
+        self._functions = {}
+
+    def wrap(self, func):
+        if func not in self._functions:
+            self._functions[func] = st.cache_data(show_spinner=False)(func)
+        return self._functions[func]
+
+    def clear(self):
+        st.cache_data.clear()
+
+def install_streamlit_cache():
+    """Instala StreamlitCache como backend de caché (una sola vez por proceso)."""
+    if not isinstance(get_cache_backend(), StreamlitCache):
+        set_cache_backend(StreamlitCache())
+
+@st.cache_resource(show_spinner=False)
+def shared_dataset_registry():
+    """Registro de conjuntos de datos del proceso, compartido por todas las sesiones."""
+    return DatasetRegistry()
+
+def run_or_report(func, *args, **kwargs):
+    """
+    Ejecuta una función de cálculo y muestra con st.error los errores de datos (ValueError)
+    que los módulos de cálculo lanzan en lugar de escribir en la interfaz. Devuelve None si falla.
+    """
+    try:
+        return func(*args, **kwargs)
+    except ValueError as e:
+        st.error(str(e))
+        return None
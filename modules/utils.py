@@ -1,64 +1,24 @@
 # modules/utils.py
 
-import streamlit as st
-import io
-import plotly.graph_objects as go 
-import folium 
 import pandas as pd
 import numpy as np
 
-# --- NUEVA FUNCIÓN PARA CORRECCIÓN NUMÉRICA ---
-@st.cache_data
-def standardize_numeric_column(series):
+# --- CORRECCIÓN NUMÉRICA ---
+def normalize_numeric_frame(df, columns=None):
     """
-    Convierte una serie de Pandas a valores numéricos de manera robusta,
-    reemplazando comas por puntos como separador decimal.
+    Convierte a numérico, en bloque, las columnas indicadas de un DataFrame (todas por defecto).
+    Las columnas que ya son numéricas (p. ej. leídas con decimal=',') se dejan intactas; las
+    de texto se procesan juntas en una sola pasada de reemplazo de coma decimal.
+    Modifica el DataFrame en sitio y lo retorna.
     """
-    series_clean = series.astype(str).str.replace(',', '.', regex=False)
-    return pd.to_numeric(series_clean, errors='coerce')
+    columns = df.columns if columns is None else [col for col in columns if col in df.columns]
+    text_cols = [col for col in columns if not pd.api.types.is_numeric_dtype(df[col])]
+    if not text_cols:
+        return df
+    flat_values = pd.Series(df[text_cols].to_numpy(dtype=object).ravel(order='F'))
+    flat_numeric = pd.to_numeric(flat_values.astype(str).str.replace(',', '.', regex=False), errors='coerce')
+    numeric_block = flat_numeric.to_numpy().reshape((len(df), len(text_cols)), order='F')
+    for i, col in enumerate(text_cols):
+        df[col] = numeric_block[:, i]
+    return df
 
-
-def display_plotly_download_buttons(fig, file_prefix):
-    """Muestra botones de descarga para un gráfico Plotly (HTML y PNG).""" 
-    st.markdown("---")
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        html_buffer = io.StringIO()
-        fig.write_html(html_buffer, include_plotlyjs='cdn')
-        st.download_button(
-            label="Descargar Gráfico (HTML)",
-            data=html_buffer.getvalue(),
-            file_name=f"{file_prefix}.html",
-            mime="text/html",
-            key=f"dl_html_{file_prefix}",
-            use_container_width=True
-        )
-
-    with col2:
-        try:
-            img_bytes = fig.to_image(format="png", width=1200, height=700, scale=2)
-            st.download_button(
-                label="Descargar Gráfico (PNG)",
-                data=img_bytes,
-                file_name=f"{file_prefix}.png",
-                mime="image/png",
-                key=f"dl_png_{file_prefix}",
-                use_container_width=True
-            )
-        except Exception as e:
-            st.warning("No se pudo generar la imagen PNG. Asegúrate de tener la librería 'kaleido' instalada ('pip install kaleido').")
-
-def add_folium_download_button(map_object, file_name):
-    """Muestra un botón de descarga para un mapa de Folium (HTML)."""
-    st.markdown("---")
-    map_buffer = io.BytesIO()
-    map_object.save(map_buffer, close_file=False)
-    st.download_button(
-        label="Descargar Mapa (HTML)",
-        data=map_buffer.getvalue(),
-        file_name=file_name,
-        mime="text/html",
-        key=f"dl_map_{file_name.replace('.', '_')}",
-        use_container_width=True
-    )
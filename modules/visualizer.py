@@ -4,7 +4,6 @@ import streamlit as st
 import pandas as pd
 import base64
 import geopandas as gpd
-import altair as alt
 import folium
 from folium.plugins import MarkerCluster, MiniMap
 from folium.raster_layers import WmsTileLayer
@@ -15,10 +14,6 @@ from plotly.subplots import make_subplots
 import numpy as np
 import os
 import branca.colormap as cm
-import matplotlib.pyplot as plt
-import pymannkendall as mk
-from scipy import stats
-from prophet.plot import plot_plotly
 import io
 from datetime import datetime, timedelta
 
@@ -29,21 +24,115 @@ from modules.analysis import (
     calculate_monthly_anomalies,
     calculate_percentiles_and_extremes, 
     analyze_events,
-    calculate_climatological_anomalies
+    calculate_climatological_anomalies,
+    calculate_station_trend
 )
 from modules.config import Config
-from modules.utils import add_folium_download_button
-from modules.interpolation import create_interpolation_surface, perform_loocv_for_all_methods
+from modules.interpolation import create_interpolation_surface, perform_loocv_for_all_methods, interpolation_grid
+from modules.dem_service import get_elevations, get_covariate_grid
 from modules.forecasting import (
     generate_sarima_forecast, 
     generate_prophet_forecast,
     get_decomposition_results, 
     create_acf_chart, 
     create_pacf_chart,
-    auto_arima_search
+    auto_arima_search,
+    prepare_monthly_series
 )
 from modules.data_processor import complete_series
 from modules.forecast_api import get_weather_forecast
+from modules.precip_cube import PrecipCube
+from modules.product_store import interpolation_signature
+from modules.lazy_import import lazy_import, lazy_callable
+
+# Librerías pesadas que solo usan algunas pestañas: se importan en su primer uso
+alt = lazy_import('altair')
+plt = lazy_import('matplotlib.pyplot')
+mk = lazy_import('pymannkendall')
+stats = lazy_import('scipy.stats')
+plot_plotly = lazy_callable('prophet.plot', 'plot_plotly')
+
+# --- BOTONES DE DESCARGA
+def display_plotly_download_buttons(fig, file_prefix):
+    """Muestra botones de descarga para un gráfico Plotly (HTML y PNG).""" 
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        html_buffer = io.StringIO()
+        fig.write_html(html_buffer, include_plotlyjs='cdn')
+        st.download_button(
+            label="Descargar Gráfico (HTML)",
+            data=html_buffer.getvalue(),
+            file_name=f"{file_prefix}.html",
+            mime="text/html",
+            key=f"dl_html_{file_prefix}",
+            use_container_width=True
+        )
+
+    with col2:
+        try:
+            img_bytes = fig.to_image(format="png", width=1200, height=700, scale=2)
+            st.download_button(
+                label="Descargar Gráfico (PNG)",
+                data=img_bytes,
+                file_name=f"{file_prefix}.png",
+                mime="image/png",
+                key=f"dl_png_{file_prefix}",
+                use_container_width=True
+            )
+        except Exception as e:
+            st.warning("No se pudo generar la imagen PNG. Asegúrate de tener la librería 'kaleido' instalada ('pip install kaleido').")
+
+def add_folium_download_button(map_object, file_name):
+    """Muestra un botón de descarga para un mapa de Folium (HTML)."""
+    st.markdown("---")
+    map_buffer = io.BytesIO()
+    map_object.save(map_buffer, close_file=False)
+    st.download_button(
+        label="Descargar Mapa (HTML)",
+        data=map_buffer.getvalue(),
+        file_name=file_name,
+        mime="text/html",
+        key=f"dl_map_{file_name.replace('.', '_')}",
+        use_container_width=True
+    )
+
+# --- PRODUCTOS PRECALCULADOS (pipeline.py)
+# `product_store` solo llega a las pestañas cuando la selección usa el período completo,
+# todos los meses y los datos originales, es decir, los mismos datos que usó el lote.
+def _stored_index(product_store, name, station, window):
+    """Serie precalculada de un índice ('spi' o 'spei') de una estación para una escala, o None si no existe."""
+    df_index = product_store.load_frame(name) if product_store is not None else None
+    if df_index is None:
+        return None
+    rows = df_index[(df_index[Config.STATION_NAME_COL] == station) & (df_index['escala'] == window)]
+    if rows.empty:
+        return None
+    return pd.Series(rows[name].to_numpy(), index=pd.DatetimeIndex(rows[Config.DATE_COL], name=Config.DATE_COL))
+
+def _stored_sarima_forecast(product_store, station, horizon, test_size):
+    """
+    Pronóstico SARIMA (Auto-ARIMA) precalculado de una estación, recortado al horizonte pedido.
+    Devuelve (forecast_mean, forecast_ci, metrics, df_export, order, seasonal_order) o None.
+    """
+    if product_store is None:
+        return None
+    df_models = product_store.load_frame('sarima_models')
+    df_forecast = product_store.load_frame('sarima_forecast')
+    if df_models is None or df_forecast is None:
+        return None
+    model = df_models[(df_models[Config.STATION_NAME_COL] == station) & (df_models['test_size'] == test_size)]
+    rows = df_forecast[df_forecast[Config.STATION_NAME_COL] == station].sort_values('ds')
+    if model.empty or len(rows) < horizon:
+        return None
+    rows = rows.iloc[:horizon]
+    index = pd.DatetimeIndex(rows['ds'])
+    forecast_mean = pd.Series(rows['yhat'].to_numpy(), index=index, name='predicted_mean')
+    forecast_ci = pd.DataFrame({'lower precipitation': rows['yhat_lower'].to_numpy(), 'upper precipitation': rows['yhat_upper'].to_numpy()}, index=index)
+    metrics = {'RMSE': model['RMSE'].iloc[0], 'MAE': model['MAE'].iloc[0]}
+    df_export = pd.DataFrame({'ds': index, 'yhat': forecast_mean.to_numpy()})
+    return forecast_mean, forecast_ci, metrics, df_export, model['order'].iloc[0], model['seasonal_order'].iloc[0]
 
 # --- FUNCIONES DE UTILIDAD DE VISUALIZACIÓN
 def display_filter_summary(total_stations_count, selected_stations_count, year_range,
@@ -1015,7 +1104,7 @@ def display_advanced_maps_tab(gdf_filtered, stations_for_analysis, df_anual_melt
                         if not df_map_data.empty:
                             min_val, max_val = df_anual_melted_non_na[Config.PRECIPITATION_COL].min(), df_anual_melted_non_na[Config.PRECIPITATION_COL].max()
                             if min_val >= max_val: max_val = min_val + 1
-                            colormap = cm.LinearColormap(colors=plt.cm.viridis.colors, vmin=min_val, vmax=max_val)
+                            colormap = cm.LinearColormap(colors=cm.linear.viridis.colors, vmin=min_val, vmax=max_val)
                             
                             for _, row in df_map_data.iterrows():
                                 ## AQUÍ ESTÁ LA CORRECCIÓN ##
@@ -1096,7 +1185,7 @@ def display_advanced_maps_tab(gdf_filtered, stations_for_analysis, df_anual_melt
                 min_precip, max_precip = int(df_anual_valid[Config.PRECIPITATION_COL].min()), int(df_anual_valid[Config.PRECIPITATION_COL].max())
                 if min_precip >= max_precip: max_precip = min_precip + 1
                 color_range = st.slider("Rango de Escala de Color (mm)", min_precip, max_precip, (min_precip, max_precip), key="color_compare")
-                colormap = cm.LinearColormap(colors=plt.cm.viridis.colors, vmin=color_range[0], vmax=color_range[1])
+                colormap = cm.LinearColormap(colors=cm.linear.viridis.colors, vmin=color_range[0], vmax=color_range[1])
 
             def create_compare_map(data, year, col, gdf_stations_info, df_anual_full):
                 col.markdown(f"**Precipitación en {year}**")
@@ -1137,11 +1226,24 @@ def display_advanced_maps_tab(gdf_filtered, stations_for_analysis, df_anual_melt
             st.warning("No hay suficientes datos anuales para realizar la interpolación.")
         else:
             min_year, max_year = int(df_anual_non_na[Config.YEAR_COL].min()), int(df_anual_non_na[Config.YEAR_COL].max())
+            gdf_bounds = gdf_filtered.total_bounds.tolist()
+            gdf_metadata = pd.DataFrame(gdf_filtered.drop(columns='geometry', errors='ignore'))
+            drift_grid = None
+            dem_source = st.session_state.get('dem_raster')
+            if dem_source is not None:
+                # Elevación del DEM en las estaciones y sobre la grilla (deriva externa del KED)
+                try:
+                    gdf_metadata[Config.ELEVATION_COL] = get_elevations(dem_source, gdf_filtered.geometry.x, gdf_filtered.geometry.y)
+                    drift_grid = get_covariate_grid(dem_source, *interpolation_grid(gdf_bounds))
+                except Exception as e:
+                    st.warning(f"No se pudo usar el DEM como covariable: {e}")
+                    gdf_metadata = gdf_metadata.drop(columns=Config.ELEVATION_COL, errors='ignore')
+
             control_col, map_col1, map_col2 = st.columns([1, 2, 2])
             with control_col:
                 st.markdown("#### Controles de los Mapas")
                 interpolation_methods = ["Kriging Ordinario", "IDW", "Spline (Thin Plate)"]
-                if Config.ELEVATION_COL in gdf_filtered.columns:
+                if Config.ELEVATION_COL in gdf_metadata.columns:
                     interpolation_methods.insert(1, "Kriging con Deriva Externa (KED)")
                 st.markdown("**Mapa 1**")
                 year1 = st.slider("Seleccione el año", min_year, max_year, max_year, key="interp_year1")
@@ -1159,11 +1261,18 @@ def display_advanced_maps_tab(gdf_filtered, stations_for_analysis, df_anual_melt
                     variogram_options = ['linear', 'spherical', 'exponential', 'gaussian']
                     variogram_model2 = st.selectbox("Modelo de Variograma para Mapa 2", variogram_options, key="var_model_2")
             
-            gdf_bounds = gdf_filtered.total_bounds.tolist()
-            gdf_metadata = pd.DataFrame(gdf_filtered.drop(columns='geometry', errors='ignore'))
-            
-            fig1, fig_var1, error1 = create_interpolation_surface(year1, method1, variogram_model1, gdf_bounds, gdf_metadata, df_anual_non_na)
-            fig2, fig_var2, error2 = create_interpolation_surface(year2, method2, variogram_model2, gdf_bounds, gdf_metadata, df_anual_non_na)
+            # Superficies precalculadas por pipeline.py (solo si la selección coincide con la del lote)
+            product_store = kwargs.get('product_store')
+            precomputed1, precomputed2 = None, None
+            if product_store is not None:
+                signature = interpolation_signature(gdf_metadata, df_anual_non_na, gdf_bounds)
+                if method1 != "Kriging con Deriva Externa (KED)":
+                    precomputed1 = product_store.load_surface(signature, year1, method1, variogram_model1)
+                if method2 != "Kriging con Deriva Externa (KED)":
+                    precomputed2 = product_store.load_surface(signature, year2, method2, variogram_model2)
+
+            fig1, fig_var1, error1 = create_interpolation_surface(year1, method1, variogram_model1, gdf_bounds, gdf_metadata, df_anual_non_na, drift_grid, precomputed1)
+            fig2, fig_var2, error2 = create_interpolation_surface(year2, method2, variogram_model2, gdf_bounds, gdf_metadata, df_anual_non_na, drift_grid, precomputed2)
             
             with map_col1:
                 if fig1: st.plotly_chart(fig1, use_container_width=True)
@@ -1210,6 +1319,11 @@ def display_advanced_maps_tab(gdf_filtered, stations_for_analysis, df_anual_melt
                 if st.button(f"Ejecutar Validación para el año {selected_year}", key="run_validation_button"):
                     with st.spinner("Realizando validación cruzada..."):
                         gdf_metadata = pd.DataFrame(gdf_filtered.drop(columns='geometry', errors='ignore'))
+                        if st.session_state.get('dem_raster') is not None:
+                            try:
+                                gdf_metadata[Config.ELEVATION_COL] = get_elevations(st.session_state.dem_raster, gdf_filtered.geometry.x, gdf_filtered.geometry.y)
+                            except Exception as e:
+                                st.warning(f"No se pudo usar el DEM como covariable: {e}")
                         validation_results_df = perform_loocv_for_all_methods(selected_year, gdf_metadata, df_anual_non_na)
                         if not validation_results_df.empty:
                             st.subheader(f"Resultados de la Validación para el Año {selected_year}")
@@ -1359,8 +1473,12 @@ def display_drought_analysis_tab(df_monthly_filtered, stations_for_analysis, df_
         if df_long is not None and not df_long.empty:
             try:
                 with st.spinner(f"Calculando percentiles P{p_lower} y P{p_upper}..."):
-                    df_extremes, df_thresholds = calculate_percentiles_and_extremes(
-                        df_long, station_to_analyze_perc, p_lower, p_upper
+                    df_extremes, df_thresholds = st.session_state.product_cache.get_or_compute(
+                        ('percentiles', station_to_analyze_perc, p_lower, p_upper),
+                        lambda: calculate_percentiles_and_extremes(
+                            df_long, station_to_analyze_perc, p_lower, p_upper, climatology=kwargs.get('climatology')
+                        ),
+                        stations=[station_to_analyze_perc]
                     )
             except Exception as e:
                 st.error(f"Error al calcular el análisis de percentiles: {e}")
@@ -1426,6 +1544,21 @@ def display_drought_analysis_tab(df_monthly_filtered, stations_for_analysis, df_
             st.plotly_chart(fig_thresh, use_container_width=True)
         else:
             st.info("Seleccione una estación para ver los umbrales.")
+
+        # Las mismas clases de evento para todas las estaciones seleccionadas (umbrales de toda la red)
+        if kwargs.get('climatology') is not None:
+            st.subheader(f"Meses Extremos por Estación (P{p_lower} y P{p_upper})")
+            df_counts = kwargs['climatology'].event_counts(
+                p_lower, p_upper, stations=stations_for_analysis,
+                year_range=kwargs.get('year_range'), months=kwargs.get('meses_numeros')
+            )
+            if not df_counts.empty:
+                df_counts['% secos'] = 100 * df_counts['meses_secos'] / df_counts['meses_con_dato']
+                df_counts['% húmedos'] = 100 * df_counts['meses_humedos'] / df_counts['meses_con_dato']
+                st.dataframe(df_counts.rename(columns={
+                    Config.STATION_NAME_COL: 'Estación', 'meses_con_dato': 'Meses con Dato',
+                    'meses_secos': 'Meses Secos', 'meses_humedos': 'Meses Húmedos'
+                }).round(1), use_container_width=True)
     
     # --- FIN DE LA MODIFICACIÓN ---
 
@@ -1433,33 +1566,46 @@ def display_drought_analysis_tab(df_monthly_filtered, stations_for_analysis, df_
         st.subheader("Análisis con Índices Estandarizados")
         col1_idx, col2_idx = st.columns([1, 3])
         index_values = pd.Series(dtype=float)
+        fit_attempted = False
         
         with col1_idx:
             index_type = st.radio("Índice a Calcular:", ("SPI", "SPEI"), key="index_type_radio")
             station_to_analyze_idx = st.selectbox("Estación para análisis:", options=sorted(stations_for_analysis), key="index_station_select")
-            index_window = st.select_slider("Escala de tiempo (meses):", options=[3, 6, 9, 12, 24], value=12, key="index_window_slider")
+            index_window = st.select_slider("Escala de tiempo (meses):", options=Config.SPI_SCALES, value=12, key="index_window_slider")
         
         if station_to_analyze_idx:
             df_station_idx = df_monthly_filtered[df_monthly_filtered[Config.STATION_NAME_COL] == station_to_analyze_idx].copy().set_index(Config.DATE_COL).sort_index()
+            # El ajuste es por mes calendario: Config.SPI_MIN_FIT_VALUES sumas por mes, más la primera ventana
+            min_months = max(index_window * 2, Config.SPI_MIN_FIT_VALUES * 12 + index_window - 1)
             
             with col2_idx:
                 with st.spinner(f"Calculando {index_type}-{index_window}..."):
                     if index_type == "SPI":
                         precip_series = df_station_idx[Config.PRECIPITATION_COL]
-                        if len(precip_series.dropna()) < index_window * 2:
-                            st.warning(f"No hay suficientes datos ({len(precip_series.dropna())} meses) para calcular el SPI-{index_window}.")
+                        if len(precip_series.dropna()) < min_months:
+                            st.warning(f"No hay suficientes datos ({len(precip_series.dropna())} meses; se requieren al menos {min_months}) para calcular el SPI-{index_window}.")
                         else:
-                            index_values = calculate_spi(precip_series, index_window)
+                            fit_attempted = True
+                            index_values = _stored_index(kwargs.get('product_store'), 'spi', station_to_analyze_idx, index_window)
+                            if index_values is None and kwargs.get('shared_dataset') is not None:
+                                index_values = kwargs['shared_dataset'].spi_cube().series(station_to_analyze_idx, index_window)
+                            if index_values is None:
+                                index_values = calculate_spi(precip_series, index_window)
                     
                     elif index_type == "SPEI":
                         if Config.ET_COL not in df_station_idx.columns or df_station_idx[Config.ET_COL].isnull().all():
                             st.error(f"No hay datos de evapotranspiración ('{Config.ET_COL}') disponibles.")
                         else:
                             precip_series, et_series = df_station_idx[Config.PRECIPITATION_COL], df_station_idx[Config.ET_COL]
-                            if len(precip_series.dropna()) < index_window * 2 or len(et_series.dropna()) < index_window * 2:
-                                st.warning(f"No hay suficientes datos de precipitación o ETP para calcular el SPEI-{index_window}.")
+                            if len(precip_series.dropna()) < min_months or len(et_series.dropna()) < min_months:
+                                st.warning(f"No hay suficientes datos de precipitación o ETP (se requieren al menos {min_months} meses) para calcular el SPEI-{index_window}.")
                             else:
-                                index_values = calculate_spei(precip_series, et_series, index_window)
+                                fit_attempted = True
+                                index_values = _stored_index(kwargs.get('product_store'), 'spei', station_to_analyze_idx, index_window)
+                                if index_values is None and kwargs.get('shared_dataset') is not None:
+                                    index_values = kwargs['shared_dataset'].spei_cube().series(station_to_analyze_idx, index_window)
+                                if index_values is None:
+                                    index_values = calculate_spei(precip_series, et_series, index_window)
             
                 if not index_values.empty and not index_values.isnull().all():
                     with col2_idx:
@@ -1472,6 +1618,10 @@ def display_drought_analysis_tab(df_monthly_filtered, stations_for_analysis, df_
                         st.plotly_chart(fig, use_container_width=True)
                     
                     display_event_analysis(index_values, index_type)
+                elif fit_attempted:
+                    with col2_idx:
+                        st.warning(f"No fue posible ajustar la distribución del {index_type}-{index_window} para {station_to_analyze_idx}: "
+                                   f"se requieren al menos {Config.SPI_MIN_FIT_VALUES} años con datos para cada mes calendario.")
 
     with frequency_sub_tab:
         st.subheader("Análisis de Frecuencia de Precipitaciones Anuales Máximas")
@@ -1553,11 +1703,11 @@ def display_anomalies_tab(df_long, df_monthly_filtered, stations_for_analysis, a
             return
         
         with st.spinner(f"Calculando anomalías vs. normal climatológica ({baseline_start}-{baseline_end})..."):
-            df_anomalias = calculate_climatological_anomalies(df_monthly_filtered, df_long, baseline_start, baseline_end)
+            df_anomalias = calculate_climatological_anomalies(df_monthly_filtered, kwargs['climatology'], baseline_start, baseline_end)
             avg_col_name = 'precip_promedio_climatologico'
     else:
         with st.spinner("Calculando anomalías vs. promedio de todo el período..."):
-            df_anomalias = calculate_monthly_anomalies(df_monthly_filtered, df_long)
+            df_anomalias = calculate_monthly_anomalies(df_monthly_filtered, kwargs['climatology'])
             avg_col_name = 'precip_promedio_mes'
 
     if df_anomalias.empty or df_anomalias['anomalia'].isnull().all():
@@ -1613,6 +1763,17 @@ def display_anomalies_tab(df_long, df_monthly_filtered, stations_for_analysis, a
             humedos = df_extremos.nlargest(10, 'anomalia')[cols_to_show]
             st.dataframe(humedos.rename(columns=col_rename_dict).round(0), use_container_width=True)
 
+def _viridis_row_gradient(row):
+    """Fondo viridis por fila, como Styler.background_gradient pero sin importar matplotlib."""
+    values = pd.to_numeric(row, errors='coerce')
+    low, high = values.min(), values.max()
+    if pd.isna(low):
+        return [''] * len(row)
+    colormap = cm.linear.viridis.scale(low, high if high > low else low + 1)
+    middle = (low + high) / 2 # viridis se aclara al subir: texto oscuro en la mitad superior
+    return ['' if pd.isna(v) else f"background-color: {colormap(v)}; color: {'#000000' if v > middle else '#f1f1f1'}"
+            for v in values]
+
 def display_stats_tab(df_long, df_anual_melted, df_monthly_filtered, stations_for_analysis, gdf_filtered, analysis_mode, selected_regions, selected_municipios, selected_altitudes, **kwargs):
     st.header("Estadísticas de Precipitación")
     display_filter_summary(
@@ -1657,7 +1818,7 @@ def display_stats_tab(df_long, df_anual_melted, df_monthly_filtered, stations_fo
                 title_text = "Disponibilidad de Datos Totales (Original + Completado)"
             else: # Porcentaje de Datos Originales
                 df_original_filtered = df_long[(df_long[Config.STATION_NAME_COL].isin(stations_for_analysis)) & (df_long[Config.DATE_COL].dt.year >= st.session_state.year_range[0]) & (df_long[Config.DATE_COL].dt.year <= st.session_state.year_range[1])]
-                df_counts = df_original_filtered.groupby([Config.STATION_NAME_COL, Config.YEAR_COL]).size().reset_index(name='count')
+                df_counts = df_original_filtered.groupby([Config.STATION_NAME_COL, Config.YEAR_COL], observed=True).size().reset_index(name='count')
                 df_counts['porc_value'] = (df_counts['count'] / 12) * 100
                 heatmap_df = df_counts.pivot(index=Config.STATION_NAME_COL, columns=Config.YEAR_COL, values='porc_value').fillna(0)
                 title_text = "Disponibilidad de Datos Originales"
@@ -1702,7 +1863,7 @@ def display_stats_tab(df_long, df_anual_melted, df_monthly_filtered, stations_fo
         st.subheader("Series de Precipitación Anual por Estación (mm)")
         if not df_anual_melted.empty:
             ppt_series_df = df_anual_melted.pivot_table(index=Config.STATION_NAME_COL, columns=Config.YEAR_COL, values=Config.PRECIPITATION_COL)
-            st.dataframe(ppt_series_df.style.format("{:.0f}", na_rep="-").background_gradient(cmap='viridis', axis=1))
+            st.dataframe(ppt_series_df.style.format("{:.0f}", na_rep="-").apply(_viridis_row_gradient, axis=1))
         else:
             st.info("No hay datos anuales para mostrar en la tabla.")
 
@@ -1878,12 +2039,8 @@ def display_correlation_tab(df_monthly_filtered, stations_for_analysis, analysis
             st.info("Seleccione al menos dos estaciones para generar la matriz de correlación.")
         else:
             with st.spinner("Calculando matriz de correlación..."):
-                df_pivot = df_monthly_filtered.pivot_table(
-                    index=Config.DATE_COL, 
-                    columns=Config.STATION_NAME_COL, 
-                    values=Config.PRECIPITATION_COL
-                )
-                corr_matrix = df_pivot.corr()
+                precip_cube = kwargs.get('precip_cube') or PrecipCube.from_long(df_monthly_filtered)
+                corr_matrix = precip_cube.correlation()
                 
                 fig_matrix = px.imshow(
                     corr_matrix,
@@ -2188,20 +2345,15 @@ def display_trends_and_forecast_tab(df_full_monthly, stations_for_analysis, df_a
             with st.spinner("Calculando tendencias..."):
                 results = []
                 df_anual_calc = df_anual_melted.copy()
+                stored_trends = kwargs.get('product_store').load_frame('trends') if kwargs.get('product_store') else None
+                if stored_trends is not None:
+                    stored_trends = stored_trends.set_index("Estación")
                 for station in stations_for_analysis:
-                    station_data = df_anual_calc[df_anual_calc[Config.STATION_NAME_COL] == station].dropna(subset=[Config.PRECIPITATION_COL]).sort_values(by=Config.YEAR_COL)
-                    slope_lin, p_lin = np.nan, np.nan
-                    trend_mk, p_mk, slope_sen = "Datos insuficientes", np.nan, np.nan
-                    if len(station_data) > 2:
-                        station_data['año_num'] = pd.to_numeric(station_data[Config.YEAR_COL])
-                        res = stats.linregress(station_data['año_num'], station_data[Config.PRECIPITATION_COL])
-                        slope_lin, p_lin = res.slope, res.pvalue
-                    if len(station_data) > 3:
-                        mk_result_table = mk.original_test(station_data[Config.PRECIPITATION_COL])
-                        trend_mk = mk_result_table.trend.capitalize()
-                        p_mk = mk_result_table.p
-                        slope_sen = mk_result_table.slope
-                    results.append({"Estación": station, "Años Analizados": len(station_data), "Tendencia Lineal (mm/año)": slope_lin, "Valor p (Lineal)": p_lin, "Tendencia MK": trend_mk, "Valor p (MK)": p_mk, "Pendiente de Sen (mm/año)": slope_sen})
+                    if stored_trends is not None and station in stored_trends.index:
+                        results.append({"Estación": station, **stored_trends.loc[station].to_dict()})
+                        continue
+                    station_data = df_anual_calc[df_anual_calc[Config.STATION_NAME_COL] == station]
+                    results.append({"Estación": station, **calculate_station_trend(station_data)})
                 if results:
                     results_df = pd.DataFrame(results)
                     def style_p_value(val):
@@ -2267,14 +2419,22 @@ def display_trends_and_forecast_tab(df_full_monthly, stations_for_analysis, df_a
                 st.warning("No hay suficientes datos para un pronóstico confiable (se necesitan al menos 3 años más que el período de evaluación).")
             else:
                 try:
+                    stored_forecast = None
                     if use_auto_arima:
-                        with st.spinner("Buscando el mejor modelo Auto-ARIMA (esto puede tardar)..."):
-                            order, seasonal_order = auto_arima_search(ts_data_sarima, test_size)
-                        st.success(f"Modelo óptimo encontrado: orden={order}, orden estacional={seasonal_order}")
+                        stored_forecast = _stored_sarima_forecast(kwargs.get('product_store'), station_to_forecast, forecast_horizon, test_size)
+                    if stored_forecast is not None:
+                        forecast_mean, forecast_ci, metrics, sarima_df_export, order, seasonal_order = stored_forecast
+                        ts_hist = prepare_monthly_series(ts_data_sarima)
+                        st.success(f"Modelo precalculado: orden={order}, orden estacional={seasonal_order}")
                     else:
-                        order, seasonal_order = (1, 1, 1), (1, 1, 1, 12)
-                    with st.spinner("Entrenando y evaluando modelo SARIMA..."):
-                        ts_hist, forecast_mean, forecast_ci, metrics, sarima_df_export = generate_sarima_forecast(ts_data_sarima, order, seasonal_order, forecast_horizon, test_size)
+                        if use_auto_arima:
+                            with st.spinner("Buscando el mejor modelo Auto-ARIMA (esto puede tardar)..."):
+                                order, seasonal_order = auto_arima_search(ts_data_sarima, test_size)
+                            st.success(f"Modelo óptimo encontrado: orden={order}, orden estacional={seasonal_order}")
+                        else:
+                            order, seasonal_order = (1, 1, 1), (1, 1, 1, 12)
+                        with st.spinner("Entrenando y evaluando modelo SARIMA..."):
+                            ts_hist, forecast_mean, forecast_ci, metrics, sarima_df_export = generate_sarima_forecast(ts_data_sarima, order, seasonal_order, forecast_horizon, test_size)
                     st.session_state['sarima_results'] = {'forecast': sarima_df_export, 'metrics': metrics, 'history': ts_hist}
                     st.markdown("##### Resultados del Pronóstico")
                     fig_pronostico = go.Figure()
@@ -2451,7 +2611,14 @@ def display_percentile_analysis_subtab(df_monthly_filtered, station_to_analyze_p
     
     with st.spinner(f"Calculando percentiles P{p_lower} y P{p_upper} para {station_to_analyze_perc}..."):
         try:
-            df_extremes, df_thresholds = calculate_percentiles_and_extremes(df_long, station_to_analyze_perc, p_lower, p_upper)
+            df_extremes, df_thresholds = st.session_state.product_cache.get_or_compute(
+                ('percentiles', station_to_analyze_perc, p_lower, p_upper),
+                lambda: calculate_percentiles_and_extremes(
+                    df_long, station_to_analyze_perc, p_lower, p_upper,
+                    climatology=st.session_state.dataset_handle.dataset.climatology()
+                ),
+                stations=[station_to_analyze_perc]
+            )
             
             year_range_val = st.session_state.get('year_range', (2000, 2020))
             if isinstance(year_range_val, tuple) and len(year_range_val) == 2 and isinstance(year_range_val[0], int):
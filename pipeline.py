@@ -0,0 +1,192 @@
+# pipeline.py
+"""
+Cálculo por lotes, sin interfaz, de los productos derivados de SIHCLIM.
+
+Ejecuta la cadena de análisis (SPI, SPEI, tendencias, superficies de interpolación y
+pronósticos SARIMA) para todas las estaciones y años, en paralelo, y guarda los resultados
+en el almacén de productos (Config.PRODUCT_STORE_DIR/<clave del conjunto de datos>).
+La aplicación consulta ese almacén antes de calcular en línea.
+Los totales anuales y las anomalías no se guardan: la aplicación los obtiene en línea del
+cubo anual (AnnualCube) y de la climatología compartida (Climatology) en milisegundos.
+Los módulos de cálculo no dependen de Streamlit y aquí corren sin caché (compute_cache.NullCache).
+
+Uso:
+    python pipeline.py --estaciones data/mapaCVENSO.csv \\
+        --precipitacion data/DatosPptnmes_ENSO.csv --shapefile data/mapaCVENSO.zip \\
+        [--productos spi spei tendencias interpolacion pronosticos] [--workers 4]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from modules.config import Config
+from modules.data_cache import compute_dataset_key
+from modules.data_processor import load_and_process_all_data, attach_station_metadata
+from modules.analysis import calculate_annual_totals, calculate_station_trend
+from modules.drought_indices import compute_spi, compute_spei, monthly_pet
+from modules.precip_cube import PrecipCube
+from modules.product_store import ProductStore, interpolation_signature
+
+ALL_PRODUCTS = ('spi', 'spei', 'tendencias', 'interpolacion', 'pronosticos')
+
+def _read_input(path):
+    with open(path, 'rb') as f:
+        return io.BytesIO(f.read())
+
+def _log(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+def _run_parallel(task, arguments, workers):
+    """Ejecuta `task(*args)` para cada tupla de `arguments`, en procesos separados si workers > 1."""
+    if workers <= 1:
+        return [task(*args) for args in arguments]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(task, *args) for args in arguments]
+        return [future.result() for future in futures]
+
+# --- Tareas (se ejecutan en los procesos de trabajo) ---
+def _trend_task(station, station_annual):
+    return {"Estación": station, **calculate_station_trend(station_annual)}
+
+def _interpolation_task(year, method, variogram_model, gdf_bounds, gdf_metadata, df_anual_year):
+    from modules.interpolation import (
+        prepare_interpolation_data, compute_interpolation_grid, interpolation_grid, _perform_loocv
+    )
+    df_clean = prepare_interpolation_data(year, method, gdf_metadata, df_anual_year)
+    if len(df_clean) < 4:
+        return None
+    lons = df_clean[Config.LONGITUDE_COL].values
+    lats = df_clean[Config.LATITUDE_COL].values
+    vals = df_clean[Config.PRECIPITATION_COL].values
+    try:
+        rmse = _perform_loocv(method, lons, lats, vals).get('RMSE')
+        z_grid, _ = compute_interpolation_grid(method, variogram_model, lons, lats, vals, *interpolation_grid(gdf_bounds))
+    except Exception as e:
+        _log(f"  {method} {year}: {e}")
+        return None
+    return (year, method, z_grid, rmse) if z_grid is not None else None
+
+def _forecast_task(station, ts_data, horizon, test_size):
+    from modules.forecasting import auto_arima_search, generate_sarima_forecast
+    try:
+        order, seasonal_order = auto_arima_search(ts_data, test_size)
+        _, forecast_mean, forecast_ci, metrics, _ = generate_sarima_forecast(ts_data, order, seasonal_order, horizon, test_size)
+    except Exception as e:
+        _log(f"  Pronóstico {station}: {e}")
+        return None
+    forecast = pd.DataFrame({
+        Config.STATION_NAME_COL: station, 'ds': forecast_mean.index, 'yhat': forecast_mean.to_numpy(),
+        'yhat_lower': forecast_ci.iloc[:, 0].to_numpy(), 'yhat_upper': forecast_ci.iloc[:, 1].to_numpy(),
+    })
+    meta = {
+        Config.STATION_NAME_COL: station, 'order': str(tuple(order)), 'seasonal_order': str(tuple(seasonal_order)),
+        'test_size': test_size, 'RMSE': metrics['RMSE'], 'MAE': metrics['MAE'],
+    }
+    return forecast, meta
+
+# --- Cadena de productos ---
+def run_pipeline(file_mapa, file_precip, file_shape, products=ALL_PRODUCTS, workers=1, store_root=None):
+    """
+    Carga el conjunto de datos y calcula los productos pedidos. Devuelve el ProductStore escrito.
+    Lanza ValueError si los archivos no se pueden procesar.
+    """
+    inputs = [_read_input(path) for path in (file_mapa, file_precip, file_shape)]
+    dataset_key = compute_dataset_key(*inputs)
+    _log(f"Cargando conjunto de datos {dataset_key}...")
+    gdf_stations, gdf_municipios, df_long, df_enso = load_and_process_all_data(*inputs)
+
+    store = ProductStore(dataset_key, root=store_root)
+    store.reset()
+    written = {}
+    df_monthly = attach_station_metadata(df_long, gdf_stations, columns=[])
+    df_anual = calculate_annual_totals(df_monthly)
+    precip_cube = PrecipCube.from_long(df_long)
+    stations = sorted(df_monthly[Config.STATION_NAME_COL].unique())
+
+    if 'spi' in products:
+        # Toda la red y todas las escalas en un solo cálculo vectorizado (sin procesos de trabajo)
+        spi_cube = compute_spi(precip_cube, Config.PRODUCT_SPI_SCALES)
+        df_spi = spi_cube.to_long()
+        if not df_spi.empty:
+            store.save_frame('spi', df_spi)
+            written['spi'] = {'scales': Config.PRODUCT_SPI_SCALES, 'rows': len(df_spi)}
+        _log(f"SPI: {df_spi[Config.STATION_NAME_COL].nunique()} estaciones.")
+
+    if 'spei' in products:
+        spei_cube = compute_spei(precip_cube, monthly_pet(gdf_stations, precip_cube.stations), Config.PRODUCT_SPI_SCALES)
+        df_spei = spei_cube.to_long()
+        if not df_spei.empty:
+            store.save_frame('spei', df_spei)
+            written['spei'] = {'scales': Config.PRODUCT_SPI_SCALES, 'rows': len(df_spei)}
+        _log(f"SPEI: {df_spei[Config.STATION_NAME_COL].nunique()} estaciones.")
+
+    if 'tendencias' in products:
+        arguments = [(station, df) for station, df in df_anual.groupby(Config.STATION_NAME_COL)]
+        df_trends = pd.DataFrame(_run_parallel(_trend_task, arguments, workers))
+        store.save_frame('trends', df_trends)
+        written['trends'] = {'rows': len(df_trends)}
+        _log(f"Tendencias: {len(df_trends)} estaciones.")
+
+    if 'interpolacion' in products:
+        gdf_metadata = pd.DataFrame(gdf_stations.drop(columns='geometry', errors='ignore'))
+        gdf_bounds = gdf_stations.total_bounds.tolist()
+        df_anual_non_na = df_anual.dropna(subset=[Config.PRECIPITATION_COL])
+        signature = interpolation_signature(gdf_metadata, df_anual_non_na, gdf_bounds)
+        arguments = [
+            (year, method, Config.PRODUCT_VARIOGRAM_MODEL if 'Kriging' in method else None,
+             gdf_bounds, gdf_metadata, df_year)
+            for year, df_year in df_anual_non_na.groupby(Config.YEAR_COL)
+            for method in Config.PRODUCT_INTERPOLATION_METHODS
+        ]
+        surfaces = [result for result in _run_parallel(_interpolation_task, arguments, workers) if result is not None]
+        for year, method, z_grid, rmse in surfaces:
+            variogram_model = Config.PRODUCT_VARIOGRAM_MODEL if 'Kriging' in method else None
+            store.save_surface(signature, year, method, variogram_model, z_grid, rmse)
+        written['surfaces'] = {
+            'signature': signature, 'methods': Config.PRODUCT_INTERPOLATION_METHODS,
+            'variogram_model': Config.PRODUCT_VARIOGRAM_MODEL, 'count': len(surfaces)
+        }
+        _log(f"Superficies de interpolación: {len(surfaces)}.")
+
+    if 'pronosticos' in products:
+        horizon, test_size = Config.PRODUCT_FORECAST_HORIZON, Config.PRODUCT_FORECAST_TEST_SIZE
+        arguments = [
+            (station, df[[Config.DATE_COL, Config.PRECIPITATION_COL]], horizon, test_size)
+            for station, df in df_monthly.groupby(Config.STATION_NAME_COL, observed=True)
+            if df[Config.PRECIPITATION_COL].notna().sum() >= test_size + 36
+        ]
+        results = [result for result in _run_parallel(_forecast_task, arguments, workers) if result is not None]
+        if results:
+            store.save_frame('sarima_forecast', pd.concat([forecast for forecast, _ in results], ignore_index=True))
+            store.save_frame('sarima_models', pd.DataFrame([meta for _, meta in results]))
+            written['sarima'] = {'horizon': horizon, 'test_size': test_size, 'stations': len(results)}
+        _log(f"Pronósticos SARIMA: {len(results)} estaciones.")
+
+    store.write_manifest(written, stations=len(stations), years=[int(df_anual[Config.YEAR_COL].min()), int(df_anual[Config.YEAR_COL].max())])
+    return store
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precalcula los productos derivados de SIHCLIM.")
+    parser.add_argument('--estaciones', required=True, help="CSV de estaciones (mapaCVENSO.csv)")
+    parser.add_argument('--precipitacion', required=True, help="CSV de precipitación mensual (DatosPptnmes_ENSO.csv)")
+    parser.add_argument('--shapefile', required=True, help="ZIP con el shapefile de municipios")
+    parser.add_argument('--productos', nargs='+', choices=ALL_PRODUCTS, default=list(ALL_PRODUCTS))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Procesos en paralelo")
+    parser.add_argument('--salida', default=None, help="Directorio del almacén (por defecto Config.PRODUCT_STORE_DIR)")
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    try:
+        store = run_pipeline(args.estaciones, args.precipitacion, args.shapefile, args.productos, args.workers, args.salida)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    _log(f"Productos guardados en {store.root} ({time.time() - start:.1f} s).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+# tests/test_drought_indices.py
+
+import numpy as np
+import pandas as pd
+from modules.drought_indices import rolling_sums
+
+def _pandas_rolling(values, scale):
+    return pd.DataFrame(values.T).rolling(scale).sum().to_numpy().T
+
+def test_rolling_sums_keeps_negative_windows():
+    # Balance hídrico P - ETP: las ventanas con déficit no deben quedar en 0
+    values = np.array([[-10, -20, 5, -30, -40, -5]], dtype='float64')
+    np.testing.assert_allclose(rolling_sums(values, 1), values)
+    np.testing.assert_allclose(rolling_sums(values, 2)[:, 1:], _pandas_rolling(values, 2)[:, 1:])
+
+def test_rolling_sums_matches_pandas_on_signed_input():
+    rng = np.random.default_rng(0)
+    values = rng.normal(-20, 40, (5, 120))
+    values[rng.random(values.shape) < 0.05] = np.nan
+    for scale in (1, 3, 6, 12, 24):
+        np.testing.assert_allclose(rolling_sums(values, scale), _pandas_rolling(values, scale), atol=1e-9)
+
+def test_rolling_sums_snaps_dry_windows_for_precipitation():
+    values = np.array([[0.1, 0.2, 0.0, 0.0, 0.0, 3.0]])
+    sums = rolling_sums(values, 3, non_negative=True)
+    assert sums[0, 4] == 0.0
+    np.testing.assert_allclose(sums, _pandas_rolling(values, 3), atol=1e-12)
@@ -0,0 +1,48 @@
+# tests/test_github_loader.py
+
+import functools
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import pytest
+import requests
+from modules.github_loader import fetch_url, fetch_urls, _cache_paths
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server(tmp_path):
+    # Servidor HTTP local que sirve los archivos de tmp_path/www (con Last-Modified y 304)
+    www = tmp_path / 'www'
+    www.mkdir()
+    (www / 'estaciones.csv').write_bytes(b'nom_est;alt_est\nA;100\n')
+    handler = functools.partial(_QuietHandler, directory=str(www))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_fetch_url_caches_revalidates_and_falls_back(server, tmp_path):
+    httpd, base = server
+    url, cache_dir, session = f"{base}/estaciones.csv", str(tmp_path / 'cache'), requests.Session()
+
+    content, origin = fetch_url(url, session=session, cache_dir=cache_dir, timeout=5)
+    assert (content, origin) == (b'nom_est;alt_est\nA;100\n', 'red')
+    data_path, meta_path = _cache_paths(url, cache_dir)
+    with open(data_path, 'rb') as f:
+        assert f.read() == content
+
+    assert fetch_url(url, session=session, cache_dir=cache_dir, timeout=5) == (content, 'sin cambios')
+
+    httpd.shutdown()
+    httpd.server_close()
+    assert fetch_url(url, session=session, cache_dir=cache_dir, timeout=5) == (content, 'copia local')
+
+def test_fetch_urls_returns_exception_without_cache(server, tmp_path):
+    _, base = server
+    url = f"{base}/no_existe.csv"
+    results = fetch_urls([url], session=requests.Session(), cache_dir=str(tmp_path / 'cache'), timeout=5)
+    assert isinstance(results[url], requests.RequestException)